@@ -0,0 +1,69 @@
+"""Benchmark HTTP/1.1 keep-alive pools against the HTTP/2 transport on a local
+TLS stand-in appliance (needs httpx, h2 and the openssl command).
+
+    $ python -m benchmarks.http2 --requests 400 --workers 32 --delay 0.02
+"""
+from __future__ import print_function, division
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.luns import list_lun
+from test.fakeh2 import FakeH2Appliance
+from test.test_connection import LUN
+
+LUNURL = '/api/storage/v1/pools/pool_0/projects/unittest/luns/lun{:05d}'
+ZAUTH = ('root', 'password')
+
+
+def run(http2, offer_h2, args):
+    """List args.requests luns from args.workers threads, returning a dict
+    with the results."""
+    routes = {('GET', LUNURL.format(i)): (200, LUN)
+              for i in range(args.requests)}
+    session = ZfssaSession(zauth=ZAUTH, pool_size=args.workers, http2=http2)
+    with FakeH2Appliance(routes, delay=args.delay,
+                         http2=offer_h2) as server:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(
+                lambda i: list_lun(['pool_0', 'unittest',
+                                    'lun{:05d}'.format(i)], server.url,
+                                   ZAUTH, 30, False, session),
+                range(args.requests)))
+        elapsed = time.time() - start
+        connections = server.connections
+    row = session.stats.rows()[0]
+    session.close()
+    return {'elapsed': elapsed, 'connections': connections,
+            'failed': sum(1 for err, _ in results if err),
+            'p50': row['p50'], 'p95': row['p95']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400,
+                        help="GET requests sent")
+    parser.add_argument("--workers", type=int, default=32,
+                        help="threads sending requests")
+    parser.add_argument("--delay", type=float, default=0.02,
+                        help="seconds the stand-in waits before answering")
+    args = parser.parse_args()
+    print("{} requests from {} threads, {:.0f} ms server delay"
+          .format(args.requests, args.workers, args.delay * 1000))
+    print("{:28}{:>8}{:>8}{:>8}{:>8}{:>8}".format(
+        "transport", "conns", "secs", "req/s", "p50 ms", "p95 ms"))
+    for name, http2, offer_h2 in (("requests HTTP/1.1", False, True),
+                                  ("httpx HTTP/2", True, True),
+                                  ("httpx fallback HTTP/1.1", True, False)):
+        result = run(http2, offer_h2, args)
+        print("{:28}{:>8}{:>8.2f}{:>8.0f}{:>8.1f}{:>8.1f}{}".format(
+            name, result['connections'], result['elapsed'],
+            args.requests / result['elapsed'], result['p50'] * 1000,
+            result['p95'] * 1000,
+            "  ({} failed)".format(result['failed'])
+            if result['failed'] else ""))
+
+
+if __name__ == "__main__":
+    main()
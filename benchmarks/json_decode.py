@@ -0,0 +1,71 @@
+"""Benchmark json backends decoding a synthetic /storage/v1/luns response.
+
+    $ python -m benchmarks.json_decode --count 40000
+"""
+from __future__ import print_function, division
+import argparse
+import json
+import time
+from zfssa_utils.common import build_response
+from zfssa_utils.jsondecode import BACKENDS, available
+
+
+def luns_payload(count):
+    """Return the bytes of a luns collection with count luns."""
+    luns = [{"name": "lun{:05d}".format(i), "project": "project{}"
+             .format(i % 50), "pool": "pool_{}".format(i % 2),
+             "assignednumber": i % 256, "initiatorgroup": ["default"],
+             "volsize": 1073741824 * (i % 10 + 1), "volblocksize": 8192,
+             "status": "online", "space_total": 8192 * i,
+             "space_data": 4096 * i, "compressratio": 100 + i % 50,
+             "lunguid": "600144F0{:024X}".format(i), "logbias": "latency",
+             "creation": "20180211T14:49:00", "sparse": i % 2 == 0,
+             "nodestroy": False, "canonical_name": "pool_{}/local/project{}"
+             "/lun{:05d}".format(i % 2, i % 50, i),
+             "href": "/api/storage/v1/pools/pool_{}/projects/project{}/"
+             "luns/lun{:05d}".format(i % 2, i % 50, i)}
+            for i in range(count)]
+    return json.dumps({"luns": luns}).encode('utf-8')
+
+
+def text_loads(payload):
+    """Decode the way the utility did before, json.loads(req.text)."""
+    response = build_response('GET', 'https://zfssa:215/api/storage/v1/luns',
+                              200, 'OK', {'Content-Type': 'application/json'},
+                              payload)
+    response.encoding = None
+    return json.loads(response.text)
+
+
+def best(func, payload, repeat):
+    """Return the best time of repeat calls to func(payload)."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func(payload)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=40000,
+                        help="luns in the payload")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs per backend, best is reported")
+    args = parser.parse_args()
+    payload = luns_payload(args.count)
+    print("payload {:.1f} MB, {} luns".format(len(payload) / 2 ** 20,
+                                              args.count))
+    results = [('req.text', best(text_loads, payload, args.repeat))]
+    for name in available():
+        results.append((name, best(BACKENDS[name], payload, args.repeat)))
+    baseline = results[0][1]
+    print("{:15}{:>10}{:>10}".format("backend", "seconds", "speedup"))
+    for name, seconds in results:
+        print("{:15}{:>10.3f}{:>9.1f}x".format(name, seconds,
+                                               baseline / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,48 @@ run_tests(){
     # test common
     python -m unittest -v test.test_zfssa
 
+    # test connection
+    python -m unittest -v test.test_connection
+
+    # test asyncio engine
+    python -m unittest -v test.test_aio
+
+    # test bulk execution
+    python -m unittest --buffer -v test.test_bulk
+
+    # test adaptive concurrency
+    python -m unittest -v test.test_concurrency
+
+    # test retries
+    python -m unittest -v test.test_retries
+
+    # test circuit breaker
+    python -m unittest -v test.test_breaker
+
+    # test response cache
+    python -m unittest -v test.test_cache
+
+    # test json decoding
+    python -m unittest -v test.test_jsondecode
+
+    # test metrics
+    python -m unittest -v test.test_metrics
+
+    # test http2 transport
+    python -m unittest -v test.test_http2
+
+    # test pipeline stages
+    python -m unittest -v test.test_pipeline
+
+    # test run deadline
+    python -m unittest --buffer -v test.test_deadline
+
+    # test ssh batch scripts
+    python -m unittest --buffer -v test.test_sshbatch
+
+    # test record/replay
+    python -m unittest --buffer -v test.test_cassette
+
     # test projects
     python -m unittest --buffer -v test.test_projects
 
@@ -19,9 +61,15 @@ run_tests(){
     # test filesystems
     python -m unittest --buffer -v test.test_filesystems
 
+    # test endpoint schema
+    python -m unittest -v test.test_schema
+
     # test explorer
     python -m unittest --buffer -v test.test_explorer
 
+    # test fleet explorer
+    python -m unittest --buffer -v test.test_fleet
+
     # test templates
     python -m unittest --buffer -v test.test_templates
 
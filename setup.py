@@ -27,6 +27,18 @@ setup(name='zfssa_utils',
           ':python_version < "3.2"': [
               'futures',
           ],
+          'async': [
+              'aiohttp',
+          ],
+          'fastjson': [
+              'orjson',
+          ],
+          'http2': [
+              'httpx[http2]',
+          ],
+          'ssh': [
+              'paramiko',
+          ],
       },
       classifiers=[
           'Development Status :: 4 - Beta',
@@ -0,0 +1,124 @@
+"""Local HTTP stand-in for the ZFSSA REST api used by offline tests."""
+import base64
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver
+
+BASICAUTH = "Basic {}".format(base64.b64encode(b"root:password").decode())
+
+
+class FakeApplianceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer every request with the response registered for its path."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.received.append((self.command, self.path,
+                                     dict(self.headers.items()), body))
+        time.sleep(self.server.delay)
+        key = (self.command, self.path)
+        if self.server.token and self.path.endswith('/access/v1'):
+            self._login()
+            return
+        if self.server.token and (self.headers.get('X-Auth-Session') !=
+                                  self.server.token):
+            status, data = 401, {"fault": {"message": "unauthorized",
+                                           "code": 401}}
+        elif self.server.failures.get(key):
+            self.server.failures[key] -= 1
+            status, data = 503, {"fault": {"message": "busy", "code": 503}}
+        else:
+            status, data = self.server.routes.get(
+                key, (404, {"fault": {"message": "not found", "code": 404}}))
+            if self.server.etags and self.command == 'GET' and status == 200:
+                self._reply_etag(data)
+                return
+        self._reply(status, data)
+
+    def _reply_etag(self, data):
+        etag = '"{}"'.format(hashlib.md5(
+            json.dumps(data, sort_keys=True).encode()).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self._reply(200, data, {'ETag': etag})
+
+    def _login(self):
+        if self.command == 'DELETE':
+            self._reply(204, {})
+        elif self.headers.get('Authorization') == BASICAUTH:
+            self.server.logins += 1
+            self._reply(201, {"access": {}},
+                        {'X-Auth-Session': self.server.token})
+        else:
+            self._reply(401, {"fault": {"message": "unauthorized",
+                                        "code": 401}})
+
+    def _reply(self, status, data, headers=None):
+        payload = json.dumps(data).encode()
+        headers = dict(headers or {})
+        if self.server.gzip and 'gzip' in self.headers.get('Accept-Encoding',
+                                                           ''):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                gz.write(payload)
+            payload = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _answer
+
+
+class FakeAppliance(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded stand-in server, routes map (method, path) to
+    (status, data), failures map (method, path) to the number of 503
+    answers sent before the route. With token set every request needs the
+    X-Auth-Session header given by the access service, with etags GET
+    answers carry an ETag and If-None-Match gets 304 while unchanged. Every
+    answer waits delay seconds, with gzip answers are compressed when the
+    request accepts it."""
+    daemon_threads = True
+
+    def __init__(self, routes=None, failures=None, token=None, etags=False,
+                 delay=0, gzip=False):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeApplianceHandler)
+        self.routes = routes or {}
+        self.failures = failures or {}
+        self.token = token
+        self.etags = etags
+        self.delay = delay
+        self.gzip = gzip
+        self.logins = 0
+        self.received = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/api".format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
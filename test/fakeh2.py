@@ -0,0 +1,169 @@
+"""Local HTTPS stand-in for the ZFSSA REST api speaking HTTP/2 (h2 library,
+python 3) or HTTP/1.1, as negotiated with ALPN."""
+import asyncio
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import ConnectionTerminated, DataReceived, RequestReceived
+
+NOTFOUND = (404, {"fault": {"message": "not found", "code": 404}})
+
+
+def have_openssl():
+    """Return True when the openssl command can create test certificates."""
+    return shutil.which('openssl') is not None
+
+
+class FakeH2Appliance(object):
+    """Stand-in TLS server in its own thread and event loop, routes map
+    (method, path) to (status, data) and every answer waits delay seconds.
+    With http2 False only HTTP/1.1 is offered, like older firmware. Counts
+    the connections accepted and the protocol of every request."""
+
+    def __init__(self, routes=None, delay=0, http2=True):
+        self.routes = routes or {}
+        self.delay = delay
+        self.http2 = http2
+        self.connections = 0
+        self.protocols = []
+        self.certdir = None
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.tasks = set()
+        self.writers = set()
+
+    @property
+    def url(self):
+        port = self.server.sockets[0].getsockname()[1]
+        return "https://127.0.0.1:{}/api".format(port)
+
+    def _sslcontext(self):
+        self.certdir = tempfile.mkdtemp()
+        cert = os.path.join(self.certdir, 'cert.pem')
+        key = os.path.join(self.certdir, 'key.pem')
+        subprocess.check_call(['openssl', 'req', '-x509', '-newkey',
+                               'rsa:2048', '-nodes', '-days', '1',
+                               '-subj', '/CN=127.0.0.1', '-keyout', key,
+                               '-out', cert], stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        context.set_alpn_protocols(['h2', 'http/1.1'] if self.http2 else
+                                   ['http/1.1'])
+        return context
+
+    def __enter__(self):
+        context = self._sslcontext()
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(
+            self._serve, '127.0.0.1', 0, ssl=context))
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._shutdown(),
+                                         self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        shutil.rmtree(self.certdir)
+
+    async def _shutdown(self):
+        self.server.close()
+        for writer in self.writers:
+            writer.transport.abort()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def _answer(self, method, path):
+        status, data = self.routes.get((method, path.split('?')[0]),
+                                       NOTFOUND)
+        return status, json.dumps(data).encode()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self._track(asyncio.current_task())
+        self.writers.add(writer)
+        sslobject = writer.get_extra_info('ssl_object')
+        try:
+            if sslobject.selected_alpn_protocol() == 'h2':
+                await self._serve_h2(reader, writer)
+            else:
+                await self._serve_http1(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.transport.abort()
+            self.writers.discard(writer)
+
+    def _track(self, task):
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _serve_http1(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            method, path, _ = line.decode().split(' ', 2)
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b''):
+                    break
+                name, value = header.decode().split(':', 1)
+                if name.lower() == 'content-length':
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+            self.protocols.append('HTTP/1.1')
+            await asyncio.sleep(self.delay)
+            status, body = self._answer(method, path)
+            writer.write("HTTP/1.1 {} -\r\nContent-Type: application/json"
+                         "\r\nContent-Length: {}\r\n\r\n"
+                         .format(status, len(body)).encode() + body)
+            await writer.drain()
+
+    async def _serve_h2(self, reader, writer):
+        conn = H2Connection(H2Configuration(client_side=False,
+                                            header_encoding='utf-8'))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        while True:
+            data = await reader.read(65535)
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    headers = dict(event.headers)
+                    self._track(asyncio.ensure_future(self._respond_h2(
+                        conn, writer, event.stream_id, headers[':method'],
+                        headers[':path'])))
+                elif isinstance(event, DataReceived):
+                    conn.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, ConnectionTerminated):
+                    return
+            writer.write(conn.data_to_send())
+
+    async def _respond_h2(self, conn, writer, stream_id, method, path):
+        self.protocols.append('HTTP/2')
+        await asyncio.sleep(self.delay)
+        status, body = self._answer(method, path)
+        conn.send_headers(stream_id, [(':status', str(status)),
+                                      ('content-type', 'application/json'),
+                                      ('content-length', str(len(body)))])
+        # bodies are expected to fit the default flow control window
+        size = conn.max_outbound_frame_size
+        for start in range(0, len(body), size):
+            conn.send_data(stream_id, body[start:start + size])
+        conn.end_stream(stream_id)
+        writer.write(conn.data_to_send())
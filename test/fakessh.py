@@ -0,0 +1,262 @@
+"""Local SSH stand-in for the ZFSSA CLI used by offline tests (needs
+paramiko).
+
+The shell reads the script sent on stdin like the appliance does and runs
+the zu(index, commands) calls of the scripts built by zfssa_utils.sshbatch
+against an in-memory model of the shares, printing what the script prelude
+prints. Other script statements are ignored.
+"""
+import json
+import re
+import socket
+import threading
+import time
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+
+CALL = re.compile(r'^zu\((\d+), (\[.*\])\);$')
+SET = re.compile(r'^set (\w+)=(.*)$')
+BANNER = "Last login: Thu Jan  1 00:00:00 1970 from 127.0.0.1\n"
+_KEY = []
+
+
+class CliError(Exception):
+    """Error raised by a CLI command, the script prints its message."""
+
+
+def _value(text):
+    if text.startswith('"') and text.endswith('"'):
+        return text[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return text
+
+
+def _project():
+    return {'properties': {}, 'filesystems': {}, 'luns': {},
+            'snapshots': set()}
+
+
+class Shares(object):
+    """In-memory pools, projects, filesystems, luns and snapshots."""
+
+    def __init__(self, pools):
+        self.pools = dict((pool, {}) for pool in pools)
+
+    def run(self, commands):
+        """Run the commands of one zu() call from the root context."""
+        state = {'pool': None, 'context': ('root',), 'pending': None}
+        for command in commands:
+            self.command(state, command)
+
+    def command(self, state, command):
+        context = state['context']
+        match = SET.match(command)
+        if command == 'cd /':
+            state['context'] = ('root',)
+        elif command.startswith('shares set pool='):
+            pool = _value(command.split('=', 1)[1])
+            if pool not in self.pools:
+                raise CliError("invalid pool '{}'".format(pool))
+            state['pool'] = pool
+        elif command == 'shares':
+            state['context'] = ('shares',)
+        elif match:
+            target = state['pending'] or self._target(state)
+            target['properties'][match.group(1)] = _value(match.group(2))
+        elif command == 'commit':
+            self._commit(state)
+        elif command.startswith('confirm destroy '):
+            self._destroy(state, command.split()[-1])
+        elif command.startswith('select '):
+            name = command.split()[-1]
+            self._target(state, name)
+            state['context'] = context + (name,)
+        elif command == 'snapshots':
+            state['context'] = context + ('snapshots',)
+        elif command.startswith('snapshot '):
+            snapshots = self._target(state)['snapshots']
+            name = command.split()[-1]
+            if name in snapshots:
+                raise CliError("snapshot '{}' already exists".format(name))
+            snapshots.add(name)
+        elif command.split()[0] in ('project', 'filesystem', 'lun'):
+            kind, name = command.split()
+            state['pending'] = {'kind': kind, 'name': name,
+                                'properties': {}}
+        else:
+            raise CliError("invalid command \"{}\"".format(command))
+
+    def _project(self, state, name):
+        projects = self.pools[state['pool']]
+        if name not in projects:
+            raise CliError("project '{}' not found".format(name))
+        return projects[name]
+
+    def _target(self, state, name=None):
+        """Return the object selected in the context (and name)."""
+        path = [item for item in state['context'][1:]
+                if item != 'snapshots']
+        if name is not None:
+            path.append(name)
+        if not path:
+            raise CliError("nothing selected")
+        project = self._project(state, path[0])
+        if len(path) == 1:
+            return project
+        for kind in ('filesystems', 'luns'):
+            if path[1] in project[kind]:
+                return project[kind][path[1]]
+        raise CliError("share '{}' not found".format(path[1]))
+
+    def _commit(self, state):
+        pending = state['pending']
+        state['pending'] = None
+        if pending is None:
+            return
+        if pending['kind'] == 'project':
+            parent = self.pools[state['pool']]
+            item = _project()
+        else:
+            parent = self._target(state)[pending['kind'] + 's']
+            item = {'properties': {}, 'snapshots': set()}
+            if pending['kind'] == 'lun' and \
+                    'volsize' not in pending['properties']:
+                raise CliError("volsize must be set")
+        if pending['name'] in parent:
+            raise CliError("share '{}' already exists"
+                           .format(pending['name']))
+        item['properties'] = pending['properties']
+        parent[pending['name']] = item
+
+    def _destroy(self, state, name):
+        context = state['context']
+        if context[-1] == 'snapshots':
+            snapshots = self._target(state)['snapshots']
+            if name not in snapshots:
+                raise CliError("snapshot '{}' not found".format(name))
+            snapshots.remove(name)
+        elif context == ('shares',):
+            self._project(state, name)
+            del self.pools[state['pool']][name]
+        else:
+            project = self._target(state)
+            for kind in ('filesystems', 'luns'):
+                if name in project[kind]:
+                    del project[kind][name]
+                    return
+            raise CliError("share '{}' not found".format(name))
+
+
+class _Server(paramiko.ServerInterface if paramiko else object):
+
+    def __init__(self, appliance):
+        self.appliance = appliance
+        self.shell = threading.Event()
+
+    def check_auth_password(self, username, password):
+        if (username, password) == self.appliance.credentials:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_shell_request(self, channel):
+        self.shell.set()
+        return True
+
+
+class FakeSshAppliance(object):
+    """Threaded SSH stand-in accepting the root/password credentials. Every
+    zu() call waits delay seconds before printing its result. scripts keeps
+    the scripts received, one per session."""
+
+    def __init__(self, pools=('pool_0',), delay=0,
+                 credentials=('root', 'password')):
+        if not _KEY:
+            _KEY.append(paramiko.RSAKey.generate(2048))
+        self.shares = Shares(pools)
+        self.delay = delay
+        self.credentials = credentials
+        self.scripts = []
+        self.transports = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.url = "https://127.0.0.1:215/api"
+        self.thread = threading.Thread(target=self._accept)
+        self.thread.daemon = True
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (OSError, socket.error):
+                return
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        transport = paramiko.Transport(conn)
+        self.transports.append(transport)
+        transport.add_server_key(_KEY[0])
+        server = _Server(self)
+        try:
+            transport.start_server(server=server)
+            channel = transport.accept(10)
+            if channel is None or not server.shell.wait(10):
+                return
+            script = b''
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                script += data
+            self.scripts.append(script.decode('utf-8'))
+            channel.sendall(BANNER.encode())
+            self._run(channel, script.decode('utf-8'))
+            channel.send_exit_status(0)
+            channel.close()
+        except (EOFError, OSError, socket.error, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+    def _run(self, channel, script):
+        lines = script.splitlines()
+        if not lines or lines[0] != 'script' or lines[-1] != '.':
+            channel.sendall(b"error: script not ended\n")
+            return
+        for line in lines[1:-1]:
+            match = CALL.match(line)
+            if not match:
+                continue
+            time.sleep(self.delay)
+            index = int(match.group(1))
+            try:
+                self.shares.run(json.loads(match.group(2)))
+                result = "ZU {} OK\n".format(index)
+            except CliError as error:
+                result = "ZU {} FAIL {}\n".format(index, error)
+            channel.sendall(result.encode('utf-8'))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, socket.error):
+            pass
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
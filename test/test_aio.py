@@ -0,0 +1,225 @@
+"""Test Asyncio functions"""
+import time
+import unittest
+import six
+from zfssa_utils.breaker import CircuitBreaker
+from zfssa_utils.concurrency import TokenBucket, AdaptiveLimiter
+from zfssa_utils.luns import list_lun, create_lun, delete_lun
+from zfssa_utils.metrics import RequestStats
+from zfssa_utils.retries import RetryPolicy, RetryBudget
+from zfssa_utils.snapshots import create_snap
+from zfssa_utils.connection import ZfssaSession, TOKENHEADER
+from test.fakeappliance import FakeAppliance
+from test.test_connection import LUN
+
+try:
+    import aiohttp
+    from zfssa_utils.aio import run_async
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+LUNURL = '/api/storage/v1/pools/pool_0/projects/unittest/luns'
+ROUTES = {('GET', LUNURL + '/lun01'): (200, LUN),
+          ('POST', LUNURL): (400, {"fault": {"message": "exists",
+                                             "code": 400}})}
+ZAUTH = ('root', 'password')
+
+
+@unittest.skipIf(six.PY2 or aiohttp is None, "needs python 3 and aiohttp")
+class TestAsync(unittest.TestCase):
+    """Test the asyncio engine against a local stand-in appliance."""
+
+    def run_both(self, func, entries):
+        session = ZfssaSession(zauth=ZAUTH)
+        results = {}
+        with FakeAppliance(ROUTES) as server:
+            serial = [func(entry, server.url, ZAUTH, 10, False, session)
+                      for entry in entries]
+            run_async(func, entries, server.url, ZAUTH, 10, False, 4,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}))
+        session.close()
+        return serial, [results[i] for i in range(len(entries))]
+
+    def test_00_same_results(self):
+        """Asyncio engine returns the same (err, msg) as serial calls."""
+        entries = [['pool_0', 'unittest', 'lun01'],
+                   ['pool_0', 'unittest', 'lun02'],
+                   ['pool_0', 'unittest']] * 5
+        serial, concurrent = self.run_both(list_lun, entries)
+        self.assertEqual(serial, concurrent)
+
+    def test_01_create_fault(self):
+        """Faults in POST bodies come back as FAIL."""
+        entries = [['pool_0', 'unittest', 'lun01', '1g', '8k', 'True',
+                    'default', 'default', 'off', 'latency', 'False']]
+        serial, concurrent = self.run_both(create_lun, entries)
+        self.assertEqual(serial, concurrent)
+        self.assertTrue(concurrent[0][0])
+        self.assertTrue('exists' in concurrent[0][1])
+
+    def test_02_coalesce(self):
+        """Identical GETs in flight share one request."""
+        results = {}
+        with FakeAppliance(ROUTES, delay=0.3) as server:
+            run_async(list_lun, [['pool_0', 'unittest', 'lun01']] * 10,
+                      server.url, ZAUTH, 10, False, 10,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}))
+            self.assertEqual(len(server.received), 1)
+        self.assertEqual(len(set(results.values())), 1)
+        self.assertTrue('SUCCESS' in results[0][1])
+
+    def test_03_rate_limit(self):
+        """Requests wait for the token bucket."""
+        results = {}
+        with FakeAppliance(ROUTES) as server:
+            start = time.time()
+            run_async(list_lun, [['pool_0', 'unittest', 'lun{:02d}'.format(i)]
+                                 for i in range(10)],
+                      server.url, ZAUTH, 10, False, 10,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}),
+                      bucket=TokenBucket(20, burst=1))
+            self.assertTrue(time.time() - start >= 0.4)
+        self.assertEqual(len(results), 10)
+
+    def test_04_connection_error(self):
+        """Connection errors come back as FAIL."""
+        results = {}
+        run_async(list_lun, [['pool_0', 'unittest', 'lun01']],
+                  "http://127.0.0.1:9/api", ZAUTH, 2, False, 4,
+                  lambda index, err, msg: results.update({index: (err, msg)}))
+        self.assertTrue(results[0][0])
+        self.assertTrue('FAIL' in results[0][1])
+
+    def test_05_circuit_open(self):
+        """Rows fail at once once the appliance circuit is open."""
+        results = {}
+        breaker = CircuitBreaker('zfssa', failures=2, reset=30)
+        run_async(list_lun, [['pool_0', 'unittest', 'lun{}'.format(i)]
+                             for i in range(10)],
+                  "http://127.0.0.1:9/api", ZAUTH, 2, False, 1,
+                  lambda index, err, msg: results.update({index: (err, msg)}),
+                  breaker=breaker)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(breaker.rejected, 8)
+        self.assertTrue('Circuit open' in results[9][1])
+
+    def test_06_retries(self):
+        """503 answers are retried from the run budget, a POST only once a
+        GET confirms the object was not created."""
+        results = {}
+        snapurl = '/api/storage/v1/pools/pool_0/projects/unittest/snapshots'
+        routes = dict(ROUTES)
+        routes[('POST', snapurl)] = (201, {"snapshot": {"name": "backup"}})
+        retry = RetryPolicy(retries=3, backoff=0.01, budget=RetryBudget(5))
+        with FakeAppliance(routes, {('GET', LUNURL + '/lun01'): 2,
+                                    ('POST', snapurl): 1}) as server:
+            run_async(list_lun, [['pool_0', 'unittest', 'lun01']],
+                      server.url, ZAUTH, 10, False, 4,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}), retry=retry)
+            self.assertTrue('SUCCESS' in results[0][1])
+            run_async(create_snap, [['pool_0', 'unittest', '-', 'project',
+                                     'backup']],
+                      server.url, ZAUTH, 10, False, 4,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}), retry=retry)
+            methods = [(method, path) for method, path, _, _
+                       in server.received][3:]
+        self.assertFalse(results[0][0])
+        self.assertEqual(methods, [('POST', snapurl),
+                                   ('GET', snapurl + '/backup'),
+                                   ('POST', snapurl)])
+        self.assertEqual(retry.budget.spent, 3)
+
+    def test_07_token_expired(self):
+        """Rows sent once the session token expired login again once and
+        are sent with the new token."""
+        results = {}
+        session = ZfssaSession(zauth=ZAUTH)
+        with FakeAppliance(ROUTES, token='tok1') as server:
+            session.enable_token_auth(server.url)
+            headers = {TOKENHEADER: session.auth_headers(10)[TOKENHEADER]}
+            server.token = 'tok2'
+            run_async(list_lun, [['pool_0', 'unittest', 'lun01'],
+                                 ['pool_0', 'unittest', 'lun02']] * 3,
+                      server.url, ZAUTH, 10, False, 4,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}),
+                      headers=headers, auth_session=session)
+            self.assertEqual(server.logins, 2)
+        self.assertEqual(session.token, 'tok2')
+        self.assertEqual([results[i][0] for i in range(6)],
+                         [False, True] * 3)
+        self.assertFalse(any('unauthorized' in msg
+                             for _, msg in results.values()))
+        session.token_url = None
+        session.close()
+
+    def test_08_metrics(self):
+        """Requests sent by the asyncio engine are timed by endpoint with
+        their status and bytes, connection errors too."""
+        results = {}
+        stats = RequestStats()
+        with FakeAppliance(ROUTES, gzip=True) as server:
+            run_async(list_lun, [['pool_0', 'unittest', 'lun01'],
+                                 ['pool_0', 'unittest', 'lun02']],
+                      server.url, ZAUTH, 10, False, 4,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}),
+                      headers={'Accept-Encoding': 'gzip'}, stats=stats)
+        run_async(list_lun, [['pool_0', 'unittest', 'lun01']],
+                  "http://127.0.0.1:9/api", ZAUTH, 2, False, 4,
+                  lambda index, err, msg: None, stats=stats)
+        rows = stats.rows()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['endpoint'],
+                         'storage/v1/pools/*/projects/*/luns/*')
+        self.assertEqual(rows[0]['count'], 3)
+        self.assertEqual(rows[0]['statuses'], {'200': 1, '404': 1,
+                                               'error': 1})
+        self.assertEqual(rows[0]['responses'], 2)
+        self.assertTrue(0 < rows[0]['wire_bytes'] <
+                        rows[0]['decoded_bytes'])
+
+    def test_09_adaptive(self):
+        """The adaptive limiter bounds the requests in flight and grows
+        with fast answers."""
+        results = {}
+        entries = [['pool_0', 'unittest', 'lun{:02d}'.format(i)]
+                   for i in range(4)]
+        limiter = AdaptiveLimiter(initial=1, maximum=1)
+        with FakeAppliance(ROUTES, delay=0.2) as server:
+            start = time.time()
+            run_async(list_lun, entries, server.url, ZAUTH, 10, False, 10,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}), limiter=limiter)
+            self.assertTrue(time.time() - start >= 0.8)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(limiter.in_flight, 0)
+        limiter = AdaptiveLimiter(initial=1, maximum=4)
+        with FakeAppliance(ROUTES) as server:
+            run_async(list_lun, entries * 5, server.url, ZAUTH, 10, False,
+                      10, lambda index, err, msg: None, limiter=limiter)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertTrue(len(limiter.history) > 1)
+
+    def test_10_delete_confirmed(self):
+        """A failed DELETE is not sent again once a GET finds the lun
+        gone."""
+        results = {}
+        with FakeAppliance({}, {('DELETE', LUNURL + '/lun01'): 1}) as server:
+            run_async(delete_lun, [['pool_0', 'unittest', 'lun01']],
+                      server.url, ZAUTH, 10, False, 4,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}),
+                      retry=RetryPolicy(retries=3, backoff=0.01))
+            methods = [method for method, _, _, _ in server.received]
+        self.assertFalse(results[0][0])
+        self.assertEqual(methods, ['DELETE', 'GET'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""Test Circuit breaker functions"""
+import time
+import unittest
+from requests.adapters import BaseAdapter
+from zfssa_utils.breaker import (CircuitBreaker, CircuitOpenError, CLOSED,
+                                 OPEN, HALFOPEN)
+from zfssa_utils.concurrency import AdaptiveLimiter
+from zfssa_utils.connection import ZfssaSession, get_session, close_sessions
+from zfssa_utils.luns import list_lun
+from zfssa_utils.retries import RetryPolicy
+from test.fakeappliance import FakeAppliance
+from test.test_connection import ROUTES, CONFIG
+
+ZAUTH = ('root', 'password')
+DEADURL = "http://127.0.0.1:9/api"
+LUN = ['pool_0', 'unittest', 'lun01']
+
+
+class Logger(object):
+    """Collect warnings."""
+
+    def __init__(self):
+        self.messages = []
+
+    def warning(self, msg):
+        self.messages.append(msg)
+
+
+class InterruptedAdapter(BaseAdapter):
+    """Adapter interrupted by Ctrl-C while sending."""
+
+    def send(self, request, **kwargs):
+        raise KeyboardInterrupt()
+
+    def close(self):
+        pass
+
+
+def breaker_session(failures=3, reset=0.2):
+    """Session without retries and with a breaker."""
+    session = ZfssaSession(zauth=ZAUTH)
+    session.retry = RetryPolicy(retries=0)
+    session.breaker = CircuitBreaker('zfssa', failures, reset, Logger())
+    return session
+
+
+class TestBreaker(unittest.TestCase):
+    """Test circuit breaker states and sessions."""
+
+    def test_00_states(self):
+        """Consecutive failures open, a probe after reset closes."""
+        breaker = CircuitBreaker('zfssa', failures=2, reset=0.1,
+                                 logger=Logger())
+        breaker.before()
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.failure()
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before()
+        time.sleep(0.1)
+        breaker.before()
+        self.assertEqual(breaker.state, HALFOPEN)
+        # only one probe at a time
+        with self.assertRaises(CircuitOpenError):
+            breaker.before()
+        breaker.success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.summary(),
+                         ["Circuit breaker: closed opened 1 failed fast 2"])
+        self.assertEqual(breaker.logger.messages[0],
+                         "Circuit closed -> open for appliance zfssa "
+                         "(2 consecutive connection errors)")
+
+    def test_01_failed_probe(self):
+        """A failed probe opens the circuit again."""
+        breaker = CircuitBreaker('zfssa', failures=1, reset=0.05,
+                                 logger=Logger())
+        breaker.failure()
+        time.sleep(0.05)
+        breaker.before()
+        breaker.failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.opened, 2)
+
+    def test_02_from_config(self):
+        """Breaker is read from the server config, 0 disables it."""
+        breaker = CircuitBreaker.from_config(dict(CONFIG,
+                                                  breaker_failures=3,
+                                                  breaker_reset=10))
+        self.assertEqual((breaker.failures, breaker.reset), (3, 10))
+        self.assertTrue(CircuitBreaker.from_config(
+            dict(CONFIG, breaker_failures=0)) is None)
+
+    def test_03_fail_fast(self):
+        """Rows fail at once with a clear message once the circuit is
+        open."""
+        session = breaker_session()
+        results = [list_lun(LUN, DEADURL, ZAUTH, 2, False, session)
+                   for _ in range(6)]
+        self.assertTrue(all(err for err, _ in results))
+        self.assertFalse('Circuit open' in results[2][1])
+        self.assertTrue('Circuit open for appliance zfssa' in results[3][1])
+        self.assertEqual(session.breaker.rejected, 3)
+        # requests failed fast are not sent nor timed
+        self.assertEqual(session.stats.rows()[0]['count'], 3)
+        self.assertTrue("Circuit breaker: open opened 1 failed fast 3" in
+                        session.summary())
+        session.close()
+
+    def test_04_probe_closes(self):
+        """The appliance answering the probe closes the circuit."""
+        session = breaker_session(failures=1, reset=0.1)
+        list_lun(LUN, DEADURL, ZAUTH, 2, False, session)
+        self.assertEqual(session.breaker.state, OPEN)
+        time.sleep(0.1)
+        with FakeAppliance(ROUTES) as server:
+            err, _ = list_lun(LUN, server.url, ZAUTH, 10, False, session)
+        self.assertFalse(err)
+        self.assertEqual(session.breaker.state, CLOSED)
+        self.assertEqual(session.breaker.logger.messages[-1],
+                         "Circuit half-open -> closed for appliance zfssa "
+                         "(appliance answered)")
+        session.close()
+
+    def test_05_http_errors(self):
+        """Error statuses are answers, they don't open the circuit."""
+        session = breaker_session(failures=1)
+        with FakeAppliance(ROUTES) as server:
+            for _ in range(3):
+                err, _ = list_lun(['pool_0', 'unittest', 'missing'],
+                                  server.url, ZAUTH, 10, False, session)
+                self.assertTrue(err)
+        self.assertEqual(session.breaker.state, CLOSED)
+        session.close()
+
+    def test_06_shared_breaker(self):
+        """Sessions to one appliance share its breaker across runs."""
+        close_sessions()
+        first = get_session(CONFIG, False)
+        second = get_session(dict(CONFIG, username='admin'), False)
+        self.assertTrue(first.breaker is second.breaker)
+        self.assertTrue(get_session(dict(CONFIG, breaker_failures=0),
+                                    False).breaker is None)
+        close_sessions()
+
+    def test_07_interrupted_probe(self):
+        """An interrupted request gives back its probe and limiter slot."""
+        session = breaker_session(failures=1, reset=0.1)
+        session.limiter = AdaptiveLimiter(initial=1, maximum=1)
+        list_lun(LUN, DEADURL, ZAUTH, 2, False, session)
+        self.assertEqual(session.breaker.state, OPEN)
+        time.sleep(0.1)
+        session.mount('http://', InterruptedAdapter())
+        self.assertRaises(KeyboardInterrupt, session.get, DEADURL)
+        self.assertEqual(session.limiter.in_flight, 0)
+        self.assertEqual(session.breaker.state, HALFOPEN)
+        self.assertFalse(session.breaker.probing)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Test Bulk functions"""
+import unittest
+import sys
+from zfssa_utils.bulk import ResultWriter, run_bulk
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.luns import list_lun
+from test.fakeappliance import FakeAppliance
+from test.test_connection import ROUTES
+
+try:
+    import aiohttp
+    import zfssa_utils.aio
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+
+class Namespace:
+    """Class to simulate args parsed"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestBulk(unittest.TestCase):
+    """Test bulk execution of csv lines."""
+
+    def test_00_writer_csv_order(self):
+        """Results arriving out of order are printed in csv order."""
+        writer = ResultWriter("Listing", None, False, 3)
+        for index in (2, 0, 1):
+            writer.write(index, False, "line {}".format(index))
+        if not hasattr(sys.stdout, "getvalue"):
+            self.fail("need to run in buffered mode")
+        lines = [x for x in sys.stdout.getvalue().splitlines()
+                 if x.startswith('line')]
+        self.assertEqual(lines, ['line 0', 'line 1', 'line 2'])
+
+    def test_01_writer_as_completed(self):
+        """Results are printed as they arrive when not ordered."""
+        writer = ResultWriter("Listing", None, False, 3, ordered=False)
+        for index in (2, 0, 1):
+            writer.write(index, False, "line {}".format(index))
+        if not hasattr(sys.stdout, "getvalue"):
+            self.fail("need to run in buffered mode")
+        lines = [x for x in sys.stdout.getvalue().splitlines()
+                 if x.startswith('line')]
+        self.assertEqual(lines, ['line 2', 'line 0', 'line 1'])
+
+    def test_02_workers(self):
+        """Thread pool runs every line keeping csv order."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        entries = [['pool_0', 'unittest', 'lun01'],
+                   ['pool_0', 'unittest', 'missing']] * 10
+        with FakeAppliance(ROUTES) as server:
+            args = Namespace(timeout=10, cert=False, progress=False,
+                             workers=8)
+            run_bulk(list_lun, entries, server.url, ('root', 'password'),
+                     session, args, "Listing luns", None)
+        if not hasattr(sys.stdout, "getvalue"):
+            self.fail("need to run in buffered mode")
+        results = [x for x in sys.stdout.getvalue().splitlines()
+                   if 'LIST' in x]
+        self.assertEqual(len(results), 20)
+        for index, line in enumerate(results):
+            self.assertEqual('SUCCESS' in line, index % 2 == 0)
+        # identical GETs in flight at the same time share one request
+        self.assertEqual(session.connection_stats()['requests'] +
+                         session.inflight.shared, 20)
+        session.close()
+
+    def test_03_adaptive(self):
+        """The AIMD limiter of --adaptive ends with the run, later runs on
+        the shared session aren't gated by it."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        with FakeAppliance(ROUTES) as server:
+            args = Namespace(timeout=10, cert=False, progress=False,
+                             workers=4, adaptive=True)
+            run_bulk(list_lun, [['pool_0', 'unittest', 'lun01']] * 4,
+                     server.url, ('root', 'password'), session, args,
+                     "Listing luns", None)
+        self.assertTrue(session.limiter is None)
+        self.assertTrue(session.deadline is None)
+        session.close()
+
+    def test_04_row_errors(self):
+        """An entry raising an error is a failed row, the others run and
+        the session is reset."""
+        def row(entry, zfsurl, zauth, timeout, verify, session=None):
+            if entry == ['bad']:
+                raise ValueError("bad entry")
+            return list_lun(entry, zfsurl, zauth, timeout, verify, session)
+
+        session = ZfssaSession(zauth=('root', 'password'))
+        entries = [['pool_0', 'unittest', 'lun01'], ['bad']] * 3
+        engines = [{}, {'workers': 4, 'adaptive': True}]
+        if aiohttp is not None:
+            engines.append({'asyncio': True})
+        if not hasattr(sys.stdout, "getvalue"):
+            self.fail("need to run in buffered mode")
+        for engine in engines:
+            sys.stdout.truncate(0)
+            sys.stdout.seek(0)
+            with FakeAppliance(ROUTES) as server:
+                args = Namespace(timeout=10, cert=False, progress=False,
+                                 **engine)
+                run_bulk(row, entries, server.url, ('root', 'password'),
+                         session, args, "Listing luns", None)
+            lines = [x for x in sys.stdout.getvalue().splitlines()
+                     if 'LIST' in x or 'RUN' in x]
+            self.assertEqual(len(lines), 6)
+            for index, line in enumerate(lines):
+                self.assertEqual('SUCCESS' in line, index % 2 == 0)
+            self.assertTrue('bad entry' in lines[1])
+            self.assertTrue(session.limiter is None)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
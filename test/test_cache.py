@@ -0,0 +1,157 @@
+"""Test Cache functions"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from zfssa_utils.cache import ResponseCache, DiskStore
+from zfssa_utils.common import fetch, HEADER
+from zfssa_utils.connection import ZfssaSession, get_session, close_sessions
+from zfssa_utils.luns import list_lun
+from test.fakeappliance import FakeAppliance
+from test.test_connection import LUN, ROUTES, CONFIG
+
+USERS = {"users": [{"logname": "root", "fullname": "Super-User"}]}
+USERSPATH = '/api/user/v1/users'
+LUNSPATH = '/api/storage/v1/pools/pool_0/projects/unittest/luns'
+
+
+class TestCache(unittest.TestCase):
+    """Test cached GET responses."""
+
+    def test_00_ttl(self):
+        """Endpoint ttl comes from the last known path segment."""
+        cache = ResponseCache(ttls={'luns': 30})
+        self.assertEqual(cache.ttl('https://zfssa:215/api/user/v1/users'),
+                         300)
+        self.assertEqual(cache.ttl('https://zfssa:215' + LUNSPATH +
+                                   '/lun01'), 30)
+        self.assertEqual(cache.ttl('https://zfssa:215/api/problem/v1/'
+                                   'problems'), 0)
+        # objects named like endpoints
+        self.assertEqual(cache.ttl('https://zfssa:215' + LUNSPATH +
+                                   '/version'), 30)
+        self.assertEqual(cache.ttl('https://zfssa:215/api/storage/v1/pools/'
+                                   'pool_0/projects/users/filesystems/'
+                                   'targets'), 0)
+        self.assertEqual(cache.ttl('https://zfssa:215' + LUNSPATH[:-5] +
+                                   '/filesystems/fs01/snapshots'), 30)
+
+    def test_01_fresh_hit(self):
+        """Fresh responses are served without a request."""
+        session = ZfssaSession(zauth=('root', 'password'),
+                               cache=ResponseCache())
+        with FakeAppliance({('GET', USERSPATH): (200, USERS)}) as server:
+            for _ in range(3):
+                data, _ = fetch(server.url + '/user/v1/users',
+                                ('root', 'password'), HEADER, 10, 'users',
+                                False, session)
+                self.assertEqual(data, USERS)
+            self.assertEqual(len(server.received), 1)
+        self.assertEqual((session.cache.hits, session.cache.misses), (2, 1))
+        self.assertTrue("Cache: hits 2 misses 1 revalidated 0" in
+                        session.summary())
+        session.close()
+
+    def test_02_revalidate(self):
+        """Expired responses are revalidated with If-None-Match."""
+        session = ZfssaSession(zauth=('root', 'password'),
+                               cache=ResponseCache())
+        with FakeAppliance({('GET', USERSPATH): (200, USERS)},
+                           etags=True) as server:
+            url = server.url + '/user/v1/users'
+            fetch(url, ('root', 'password'), HEADER, 10, 'users', False,
+                  session)
+            session.cache.store.get(url).stored -= 1000
+            data, _ = fetch(url, ('root', 'password'), HEADER, 10, 'users',
+                            False, session)
+            self.assertEqual(data, USERS)
+            self.assertEqual(len(server.received), 2)
+            self.assertTrue('If-None-Match' in server.received[1][2])
+        self.assertEqual(session.cache.revalidated, 1)
+        session.close()
+
+    def test_03_write_invalidates(self):
+        """Writes forget the cached responses under their path."""
+        session = ZfssaSession(zauth=('root', 'password'),
+                               cache=ResponseCache(ttls={'luns': 60}))
+        routes = dict(ROUTES)
+        routes[('POST', LUNSPATH)] = (201, LUN)
+        with FakeAppliance(routes) as server:
+            lun = ['pool_0', 'unittest', 'lun01']
+            for _ in range(2):
+                list_lun(lun, server.url, ('root', 'password'), 10, False,
+                         session)
+            session.post(server.url + LUNSPATH[4:], data='{}')
+            list_lun(lun, server.url, ('root', 'password'), 10, False,
+                     session)
+            self.assertEqual([method for method, _, _, _ in server.received],
+                             ['GET', 'POST', 'GET'])
+        session.close()
+
+    def test_04_disk_store(self):
+        """Disk store keeps responses for a new cache."""
+        directory = tempfile.mkdtemp()
+        try:
+            with FakeAppliance({('GET', USERSPATH): (200, USERS)}) as server:
+                url = server.url + '/user/v1/users'
+                for _ in range(2):
+                    session = ZfssaSession(
+                        zauth=('root', 'password'),
+                        cache=ResponseCache(DiskStore(directory)))
+                    data, _ = fetch(url, ('root', 'password'), HEADER, 10,
+                                    'users', False, session)
+                    self.assertEqual(data, USERS)
+                    session.close()
+                self.assertEqual(len(server.received), 1)
+                # another account of the appliance gets its own entries
+                store = DiskStore(directory, user='operator')
+                self.assertEqual(store.keys(), [])
+                session = ZfssaSession(zauth=('operator', 'password'),
+                                       cache=ResponseCache(store))
+                fetch(url, ('operator', 'password'), HEADER, 10, 'users',
+                      False, session)
+                session.close()
+                self.assertEqual(len(server.received), 2)
+                self.assertEqual(DiskStore(directory).keys(), [url])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_05_no_cache(self):
+        """Shared session cache is disabled for --no-cache runs."""
+        self.assertFalse(get_session(CONFIG, False, False).use_cache)
+        self.assertTrue(get_session(CONFIG, False).use_cache)
+        self.assertFalse(get_session(dict(CONFIG, cache=False),
+                                     False).use_cache)
+        close_sessions()
+
+    def test_06_disk_invalidate(self):
+        """Disk entries are JSON files, writes forget them from the index
+        without reading the other files."""
+        directory = tempfile.mkdtemp()
+        try:
+            store = DiskStore(directory, user='root')
+            cache = ResponseCache(store, ttls={'luns': 60})
+            lunsurl = 'https://zfssa:215' + LUNSPATH
+            with FakeAppliance(ROUTES) as server:
+                url = server.url + LUNSPATH[4:] + '/lun01'
+                cache.get(lambda url, **_: ZfssaSession().get(url), url, {})
+            with open(os.path.join(directory, 'broken.json'), 'w') as f:
+                f.write('not json')
+            entries = [name for name in os.listdir(directory)
+                       if name.endswith('.json') and name != 'broken.json']
+            with open(os.path.join(directory, entries[0])) as f:
+                self.assertEqual(json.load(f)['url'], url)
+            self.assertEqual(DiskStore(directory, user='root').keys(),
+                             [url])
+            store.set(lunsurl, store.get(url))
+            cache.invalidate(server.url + LUNSPATH[4:])
+            self.assertEqual(DiskStore(directory, user='root').keys(),
+                             [lunsurl])
+            self.assertTrue(DiskStore(directory, 'root').get(url) is None)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
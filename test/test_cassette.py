@@ -0,0 +1,159 @@
+"""Test Cassette functions"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from zfssa_utils.bulk import run_bulk
+from zfssa_utils.cassette import Cassette
+from zfssa_utils.common import fetch, fetch_stream, HEADER
+from zfssa_utils.connection import (ZfssaSession, get_session,
+                                    close_sessions, use_cassette)
+from zfssa_utils.luns import list_lun, create_lun
+from test.fakeappliance import FakeAppliance
+from test.test_aio import ROUTES as LUNROUTES
+from test.test_bulk import Namespace
+from test.test_connection import CONFIG
+from test.test_metrics import USERS, USERSPATH
+
+try:
+    import aiohttp
+    from zfssa_utils.aio import run_async
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+ZAUTH = ('root', 'password')
+ZFSURL = "https://192.168.56.150:215/api"
+LUN = ['pool_0', 'unittest', 'lun01']
+NEWLUN = ['pool_0', 'unittest', 'lun02', '1', '8k', 'True', 'targetgroup',
+          'default', 'off', 'latency', 'False']
+
+
+def record(filename, routes, calls, **kwargs):
+    """Run calls(url, session) against a stand-in appliance recording to
+    filename, returning their results with the appliance url replaced by
+    ZFSURL."""
+    cassette = Cassette(filename, record=True)
+    session = ZfssaSession(zauth=ZAUTH, cassette=cassette)
+    with FakeAppliance(routes, **kwargs) as server:
+        results = calls(server.url, session)
+        results = json.loads(json.dumps(results).replace(server.url, ZFSURL))
+    session.close()
+    return results
+
+
+class TestCassette(unittest.TestCase):
+    """Test recording and replaying."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cassette.json')
+
+    def tearDown(self):
+        use_cassette(None)
+        close_sessions()
+        shutil.rmtree(self.tmpdir)
+
+    def test_00_record_replay(self):
+        """Replayed rows give the recorded results without an appliance."""
+        def calls(url, session):
+            return [list_lun(LUN, url, ZAUTH, 10, False, session),
+                    list_lun(['pool_0', 'unittest', 'missing'], url, ZAUTH,
+                             10, False, session),
+                    create_lun(NEWLUN, url, ZAUTH, 10, False, session)]
+
+        recorded = record(self.filename, LUNROUTES, calls, delay=0.05)
+        with open(self.filename) as cassette:
+            data = json.load(cassette)
+        self.assertEqual(len(data['interactions']), 3)
+        self.assertFalse('Authorization' in json.dumps(data))
+        session = ZfssaSession(zauth=ZAUTH,
+                               cassette=Cassette(self.filename, latency=0))
+        start = time.time()
+        replayed = calls(ZFSURL, session)
+        self.assertTrue(time.time() - start < 0.05)
+        self.assertEqual([list(result) for result in replayed], recorded)
+        self.assertEqual(session.stats.rows()[0]['statuses'],
+                         {'200': 1, '404': 1})
+        self.assertTrue("Cassette: replayed 3 missing 0 from {}"
+                        .format(self.filename) in session.summary())
+        session.close()
+
+    def test_01_latency(self):
+        """Replays wait the recorded time scaled by latency."""
+        record(self.filename, LUNROUTES, lambda url, session: [
+            list_lun(LUN, url, ZAUTH, 10, False, session)
+            for _ in range(2)], delay=0.1)
+        for latency, low, high in ((1, 0.1, 1), (0.5, 0.05, 0.1)):
+            session = ZfssaSession(zauth=ZAUTH, cassette=Cassette(
+                self.filename, latency=latency))
+            start = time.time()
+            list_lun(LUN, "https://zfssa:215/api", ZAUTH, 10, False, session)
+            self.assertTrue(low <= time.time() - start < high)
+
+    def test_02_missing(self):
+        """Requests not recorded fail as connection errors."""
+        record(self.filename, LUNROUTES, lambda url, session:
+               list_lun(LUN, url, ZAUTH, 10, False, session))
+        session = ZfssaSession(zauth=ZAUTH,
+                               cassette=Cassette(self.filename, latency=0))
+        session.retry.retries = 0
+        err, msg = list_lun(['pool_0', 'unittest', 'lun09'],
+                            "https://zfssa:215/api", ZAUTH, 10, False,
+                            session)
+        self.assertTrue(err)
+        self.assertTrue("No response for GET" in msg)
+        self.assertEqual(session.cassette.missing, 1)
+
+    def test_03_gzip_stream(self):
+        """Compressed bodies are kept decoded with their wire bytes, and can
+        be streamed."""
+        url = '/user/v1/users'
+        record(self.filename, {('GET', USERSPATH): (200, USERS)},
+               lambda zfsurl, session: fetch(zfsurl + url, ZAUTH, HEADER, 10,
+                                             'users', False, session),
+               gzip=True)
+        session = ZfssaSession(zauth=ZAUTH,
+                               cassette=Cassette(self.filename, latency=0))
+        data, _ = fetch_stream("https://zfssa:215/api" + url, ZAUTH, HEADER,
+                               10, 'users', False, session)
+        self.assertEqual(list(data['users']), USERS['users'])
+        _, wire, decoded = session.stats.totals()
+        self.assertTrue(0 < wire * 5 < decoded)
+
+    def test_04_bulk_command(self):
+        """Bulk commands run unmodified against a cassette."""
+        entries = [LUN, ['pool_0', 'unittest', 'missing']]
+        record(self.filename, LUNROUTES, lambda url, session: [
+            list_lun(entry, url, ZAUTH, 10, False, session)
+            for entry in entries])
+        use_cassette(Cassette(self.filename, latency=0))
+        session = get_session(CONFIG, False)
+        args = Namespace(timeout=10, cert=False, progress=False, workers=2)
+        run_bulk(list_lun, entries, ZFSURL, ZAUTH, session, args,
+                 "Listing luns", None)
+        if not hasattr(sys.stdout, "getvalue"):
+            self.fail("need to run in buffered mode")
+        results = [x for x in sys.stdout.getvalue().splitlines()
+                   if 'LIST' in x]
+        self.assertEqual(len(results), 2)
+        self.assertTrue('SUCCESS' in results[0])
+        self.assertTrue('FAIL' in results[1])
+
+    @unittest.skipIf(aiohttp is None, "needs python 3 and aiohttp")
+    def test_05_async_replay(self):
+        """The asyncio engine replays the cassette too."""
+        record(self.filename, LUNROUTES, lambda url, session:
+               list_lun(LUN, url, ZAUTH, 10, False, session))
+        results = {}
+        run_async(list_lun, [LUN, ['pool_0', 'unittest', 'missing']],
+                  ZFSURL, ZAUTH, 10, False, 4,
+                  lambda index, err, msg: results.update({index: err}),
+                  cassette=Cassette(self.filename, latency=0))
+        self.assertEqual(results, {0: False, 1: True})
+
+
+if __name__ == "__main__":
+    unittest.main()
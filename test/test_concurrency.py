@@ -0,0 +1,169 @@
+"""Test Concurrency functions"""
+import unittest
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zfssa_utils.concurrency import (AdaptiveLimiter, SingleFlight,
+                                     TokenBucket, percentile)
+from zfssa_utils.connection import ZfssaSession, get_session, close_sessions
+from zfssa_utils.luns import list_lun
+from test.test_connection import ROUTES, CONFIG
+from zfssa_utils.snapshots import list_snap
+from test.fakeappliance import FakeAppliance
+
+SNAPURL = '/api/storage/v1/pools/pool_0/projects/unittest/snapshots'
+
+
+def send(limiter, latency, status=200):
+    """Simulate one request through the limiter."""
+    limiter.acquire()
+    limiter.release(latency, status)
+
+
+class TestConcurrency(unittest.TestCase):
+    """Test AIMD limiter."""
+
+    def test_00_percentile(self):
+        """Test percentile over a small sample."""
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([], 95), None)
+
+    def test_01_increase_fast(self):
+        """Fast 2xx responses grow the limit up to maximum."""
+        limiter = AdaptiveLimiter(initial=2, maximum=6)
+        for _ in range(100):
+            send(limiter, 0.01)
+        self.assertEqual(int(limiter.limit), 6)
+        self.assertEqual(limiter.history[0][1], 2)
+
+    def test_02_backoff_overload(self):
+        """503 and timeouts halve the limit."""
+        limiter = AdaptiveLimiter(initial=8)
+        send(limiter, 0.01, 503)
+        self.assertEqual(int(limiter.limit), 4)
+        time.sleep(0.11)
+        send(limiter, 0.01, None)
+        self.assertEqual(int(limiter.limit), 2)
+        self.assertEqual(limiter.decreases, 2)
+
+    def test_03_backoff_latency(self):
+        """Rising p95 latency halves the limit."""
+        limiter = AdaptiveLimiter(initial=8, maximum=8, window=5)
+        for _ in range(5):
+            send(limiter, 0.01)
+        for _ in range(5):
+            send(limiter, 0.5)
+        self.assertTrue(limiter.limit < 8)
+        self.assertTrue('decreases 1' in limiter.summary()[0])
+
+    def test_04_client_errors_neutral(self):
+        """4xx responses don't change the limit."""
+        limiter = AdaptiveLimiter(initial=4)
+        for _ in range(10):
+            send(limiter, 0.01, 404)
+        self.assertEqual(int(limiter.limit), 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_05_singleflight(self):
+        """Concurrent calls with the same key run once."""
+        group = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.3)
+            return 'done'
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: group.do('key', slow),
+                                        range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], ['done'] * 5)
+        self.assertEqual(sum(leader for _, leader in results), 1)
+        self.assertEqual(group.shared, 4)
+        self.assertEqual(group.calls, {})
+
+    def test_06_singleflight_error(self):
+        """Waiting callers get the exception of the shared call."""
+        group = SingleFlight()
+
+        def fail():
+            time.sleep(0.3)
+            raise ValueError('boom')
+
+        def call(_):
+            try:
+                group.do('key', fail)
+            except ValueError as error:
+                return str(error)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            self.assertEqual(list(executor.map(call, range(3))),
+                             ['boom'] * 3)
+
+    def test_07_session_coalesce(self):
+        """Rows listing snapshots of one project share the GET."""
+        snaps = {"snapshots": [{"name": "snap{}".format(i),
+                                "creation": "20180211T14:49:00",
+                                "space_data": 1024, "space_unique": 0}
+                               for i in range(8)]}
+        session = ZfssaSession(zauth=('root', 'password'))
+        with FakeAppliance({('GET', SNAPURL): (200, snaps)},
+                           delay=0.3) as server:
+            rows = [['pool_0', 'unittest', '-', 'project',
+                     'snap{}'.format(i)] for i in range(8)]
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(
+                    lambda row: list_snap(row, server.url,
+                                          ('root', 'password'), 10, False,
+                                          session), rows))
+            self.assertEqual(len(server.received), 1)
+        for row, (err, msg) in zip(rows, results):
+            self.assertFalse(err)
+            self.assertTrue(row[4] in msg and 'SUCCESS' in msg)
+        self.assertTrue("Coalesced: requests 7" in session.summary())
+        session.close()
+
+
+    def test_08_token_bucket(self):
+        """Burst requests go at once, the rest at rate per second."""
+        bucket = TokenBucket(20, burst=5)
+        start = time.time()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertTrue(time.time() - start < 0.1)
+        for _ in range(10):
+            bucket.acquire()
+        self.assertTrue(0.4 < time.time() - start < 0.8)
+        self.assertEqual(bucket.requests, 15)
+        self.assertTrue("Rate limit: 20 rps burst 5 requests 15" in
+                        bucket.summary()[0])
+
+    def test_09_session_rate_limit(self):
+        """Threads sharing a session share the appliance rate."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.bucket = TokenBucket(20, burst=1)
+        with FakeAppliance(ROUTES) as server:
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(
+                    lambda lun: list_lun(['pool_0', 'unittest', lun],
+                                         server.url, ('root', 'password'),
+                                         10, False, session),
+                    ['lun01', 'lun02', 'lun03', 'lun04'] * 3))
+            self.assertTrue(time.time() - start >= 0.5)
+            self.assertEqual(len(server.received), 12)
+        session.close()
+
+    def test_10_shared_bucket(self):
+        """Sessions to the same appliance share one bucket."""
+        config = dict(CONFIG, rate_limit=10, rate_burst=2)
+        first = get_session(config, False)
+        second = get_session(dict(config, username='admin'), False)
+        self.assertTrue(first.bucket is second.bucket)
+        self.assertEqual(first.bucket.burst, 2)
+        self.assertTrue(get_session(CONFIG, False).bucket is None)
+        close_sessions()
+
+
+if __name__ == "__main__":
+    unittest.main()
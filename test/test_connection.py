@@ -0,0 +1,135 @@
+"""Test Connection functions"""
+import unittest
+from zfssa_utils.connection import ZfssaSession, get_session, close_sessions
+from zfssa_utils.luns import list_lun
+from test.fakeappliance import FakeAppliance
+
+LUN = {"lun": {"name": "lun01", "project": "unittest", "pool": "pool_0",
+               "assignednumber": 0, "initiatorgroup": ["default"],
+               "volsize": 1073741824, "volblocksize": 8192,
+               "status": "online", "space_total": 8192,
+               "lunguid": "600144F0", "logbias": "latency",
+               "creation": "20180211T14:49:00", "sparse": True,
+               "nodestroy": False}}
+ROUTES = {('GET', '/api/storage/v1/pools/pool_0/projects/unittest/luns/'
+           'lun01'): (200, LUN)}
+
+CONFIG = {'ip': '192.168.56.150', 'username': 'root', 'password': 'password'}
+
+
+class TestConnection(unittest.TestCase):
+    """Test shared keep-alive sessions."""
+
+    def test_00_connection_reused(self):
+        """Many calls through one session open a single connection."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        with FakeAppliance(ROUTES) as server:
+            for _ in range(5):
+                err, msg = list_lun(['pool_0', 'unittest', 'lun01'],
+                                    server.url, ('root', 'password'), 10,
+                                    False, session)
+                self.assertFalse(err)
+                self.assertTrue('SUCCESS' in msg)
+        stats = session.connection_stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['reused'], 4)
+        session.close()
+
+    def test_01_shared_session(self):
+        """Runs on the same appliance and credentials share one session,
+        each with its own stats and retry budget."""
+        first = get_session(CONFIG, False)
+        second = get_session(dict(CONFIG, pool_size=4), False)
+        self.assertTrue(first.parent is second.parent)
+        self.assertTrue(first.adapters is second.adapters)
+        self.assertFalse(first.stats is second.stats)
+        self.assertFalse(first.retry.budget is second.retry.budget)
+        self.assertFalse(first.parent is get_session(CONFIG,
+                                                     'zfssa.crt').parent)
+        self.assertFalse(first.parent is get_session(
+            dict(CONFIG, password='changed'), False).parent)
+        with FakeAppliance(ROUTES) as server:
+            list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                     ('root', 'password'), 10, False, first)
+            # closing a run keeps the connections of the others
+            second.close()
+            list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                     ('root', 'password'), 10, False, first)
+        self.assertEqual(first.stats.totals()[0], 2)
+        self.assertEqual(second.stats.totals()[0], 0)
+        self.assertEqual(first.connection_stats()['opened'], 1)
+        close_sessions()
+
+    def test_02_session_headers(self):
+        """Session sends json content type and extra config headers."""
+        session = ZfssaSession(headers={'X-Test': 'yes'})
+        self.assertEqual(session.headers['Content-Type'], 'application/json')
+        self.assertEqual(session.headers['X-Test'], 'yes')
+        session.close()
+
+    def test_03_token_auth(self):
+        """Login once and send the session token instead of basic auth."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        with FakeAppliance(ROUTES, token='tok1') as server:
+            session.enable_token_auth(server.url)
+            for _ in range(3):
+                err, _ = list_lun(['pool_0', 'unittest', 'lun01'],
+                                  server.url, ('root', 'password'), 10,
+                                  False, session)
+                self.assertFalse(err)
+            self.assertEqual(server.logins, 1)
+            for method, path, headers, _ in server.received[1:]:
+                self.assertEqual(headers.get('X-Auth-Session'), 'tok1')
+                self.assertFalse('Authorization' in headers)
+            session.close()
+            self.assertEqual(server.received[-1][:2],
+                             ('DELETE', '/api/access/v1'))
+
+    def test_04_token_expired(self):
+        """Login again when the appliance rejects an expired token."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        with FakeAppliance(ROUTES, token='tok1') as server:
+            session.enable_token_auth(server.url)
+            list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                     ('root', 'password'), 10, False, session)
+            server.token = 'tok2'
+            err, _ = list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                              ('root', 'password'), 10, False, session)
+            self.assertFalse(err)
+            self.assertEqual(server.logins, 2)
+            self.assertEqual(session.token, 'tok2')
+            session.close()
+
+    def test_05_token_bad_user(self):
+        """Failed login comes back as a FAIL message."""
+        session = ZfssaSession(zauth=('baduser', 'password'))
+        with FakeAppliance(ROUTES, token='tok1') as server:
+            session.enable_token_auth(server.url)
+            err, msg = list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                                ('baduser', 'password'), 10, False, session)
+            session.close()
+        self.assertTrue(err)
+        self.assertTrue('401' in msg)
+
+    def test_06_pool_resized(self):
+        """Growing the pool closes the connections of the adapter
+        replaced and keeps counting them."""
+        session = ZfssaSession(zauth=('root', 'password'), pool_size=2)
+        with FakeAppliance(ROUTES) as server:
+            lun = ['pool_0', 'unittest', 'lun01']
+            list_lun(lun, server.url, ('root', 'password'), 10, False,
+                     session)
+            replaced = session.adapter
+            session.ensure_pool_size(8)
+            self.assertEqual(len(replaced.poolmanager.pools), 0)
+            self.assertEqual(session.pool_size, 8)
+            list_lun(lun, server.url, ('root', 'password'), 10, False,
+                     session)
+        stats = session.connection_stats()
+        self.assertEqual((stats['requests'], stats['opened']), (2, 2))
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Test Deadline functions"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from zfssa_utils.bulk import run_bulk
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.deadline import (Deadline, DeadlineExceeded, EXPIRED,
+                                  INTERRUPTED)
+from zfssa_utils.explorer import write_incomplete, INCOMPLETEFILE
+from zfssa_utils.luns import list_lun
+from test.fakeappliance import FakeAppliance
+from test.test_bulk import Namespace
+from test.test_connection import ROUTES
+
+try:
+    import aiohttp
+    from zfssa_utils.aio import run_async
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+ZAUTH = ('root', 'password')
+ENTRIES = [['pool_0', 'unittest', 'lun{:02d}'.format(i)] for i in range(20)]
+
+
+def output_lines(test):
+    """Return the result lines printed in buffered mode."""
+    if not hasattr(sys.stdout, "getvalue"):
+        test.fail("need to run in buffered mode")
+    return [x for x in sys.stdout.getvalue().splitlines()
+            if ' - FAIL - ' in x or ' - SUCCESS - ' in x]
+
+
+class TestDeadline(unittest.TestCase):
+    """Test run deadlines and cancellation."""
+
+    def test_00_timeout(self):
+        """Timeouts shrink to the time left, then requests are refused."""
+        deadline = Deadline(0.2)
+        self.assertTrue(deadline.timeout(100) <= 0.2)
+        connect, read = deadline.timeout((1, 0.1))
+        self.assertTrue(connect <= 0.2 and read == 0.1)
+        self.assertTrue(deadline.cap(30) <= 0.2)
+        self.assertEqual(Deadline().timeout(100), 100)
+        time.sleep(0.2)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.timeout(100)
+        self.assertEqual(deadline.reason, EXPIRED)
+        self.assertEqual(deadline.message(), "run deadline of 0.2s exceeded")
+        deadline.cancel(INTERRUPTED)
+        self.assertEqual(deadline.reason, EXPIRED)
+
+    def test_01_session(self):
+        """A slow request ends at the deadline, later ones are not sent."""
+        session = ZfssaSession(zauth=ZAUTH)
+        session.retry.retries = 0
+        session.deadline = Deadline(0.3)
+        with FakeAppliance(ROUTES, delay=1) as server:
+            start = time.time()
+            err, _ = list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                              ZAUTH, 10, False, session)
+            self.assertTrue(err)
+            self.assertTrue(time.time() - start < 0.8)
+            err, msg = list_lun(['pool_0', 'unittest', 'lun01'], server.url,
+                                ZAUTH, 10, False, session)
+        self.assertTrue(err)
+        self.assertTrue("Request not sent, run deadline of 0.3s exceeded"
+                        in msg)
+        self.assertEqual(len(server.received), 1)
+        session.close()
+
+    def test_02_bulk_workers(self):
+        """Entries not started by the deadline are reported as not run."""
+        session = ZfssaSession(zauth=ZAUTH)
+        args = Namespace(timeout=10, cert=False, progress=False, workers=2,
+                         deadline=0.5)
+        with FakeAppliance(ROUTES, delay=0.2) as server:
+            start = time.time()
+            run_bulk(list_lun, ENTRIES, server.url, ZAUTH, session, args,
+                     "Listing luns", None)
+            self.assertTrue(time.time() - start < 1.5)
+        lines = output_lines(self)
+        self.assertEqual(len(lines), 20)
+        self.assertTrue('LIST - ' in lines[0])
+        self.assertTrue("RUN - FAIL - entry ['pool_0', 'unittest', 'lun19'] "
+                        "not run, run deadline of 0.5s exceeded" in lines[-1])
+        self.assertTrue(session.deadline is None)
+        session.close()
+
+    def test_03_bulk_interrupted(self):
+        """Ctrl-C stops a serial run reporting the entries left."""
+        calls = []
+
+        def interrupted(entry, *args):
+            calls.append(entry)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return False, "LIST - SUCCESS - {}".format(entry)
+
+        session = ZfssaSession(zauth=ZAUTH)
+        args = Namespace(timeout=10, cert=False, progress=False)
+        run_bulk(interrupted, ENTRIES[:5], "https://zfssa:215/api", ZAUTH,
+                 session, args, "Listing luns", None)
+        lines = output_lines(self)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(lines), 5)
+        self.assertTrue("not run, run interrupted" in lines[2])
+        session.close()
+
+    @unittest.skipIf(aiohttp is None, "needs python 3 and aiohttp")
+    def test_04_async(self):
+        """The asyncio engine stops sending at the deadline."""
+        results = {}
+        deadline = Deadline(0.3)
+        with FakeAppliance(ROUTES, delay=0.2) as server:
+            run_async(list_lun, ENTRIES, server.url, ZAUTH, 10, False, 2,
+                      lambda index, err, msg: results.update(
+                          {index: (err, msg)}), deadline=deadline)
+            sent = len(server.received)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(sent < 8)
+        self.assertTrue("Request not sent" in results[19][1])
+
+    def test_05_incomplete(self):
+        """Explorers stopped early say what was not collected."""
+        outputdir = tempfile.mkdtemp()
+        try:
+            deadline = Deadline()
+            deadline.cancel()
+            write_incomplete(outputdir, deadline, ['luns', 'filesystems'])
+            with open(os.path.join(outputdir, INCOMPLETEFILE)) as report:
+                self.assertEqual(report.read().splitlines(),
+                                 ["Explorer incomplete, run interrupted. "
+                                  "Not collected:", "filesystems", "luns"])
+        finally:
+            shutil.rmtree(outputdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,27 @@
 """Test Explorer functions"""
+import argparse
+import json
 import unittest
 import sys
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZipFile
 import six
-from zfssa_utils.explorer import run_explorer
+from zfssa_utils import explorer
+from zfssa_utils.explorer import (run_explorer, create_csv, stream_csv,
+                                  explorer_workers, workers_metadata,
+                                  write_metadata, explorer_stages,
+                                  render_payload, explorer_items,
+                                  ExplorerArchive, MergedCsv, METADATAFILE)
+from zfssa_utils.breaker import CircuitBreaker
+from zfssa_utils.common import workers_value
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.pipeline import Pipeline
+from zfssa_utils.schema import ENDPOINTS
+from test.fakeappliance import FakeAppliance
+from test.test_connection import CONFIG
 # from zfssa_utils.common import urls_constructor
 
 HERE = os.path.abspath(os.path.dirname(__file__))
@@ -32,6 +50,38 @@ DATASET = ['cluster',
            'users']
 
 
+USERS = {"users": [{"logname": "user{}".format(i), "type": "local",
+                    "uid": 2000 + i, "fullname": "User {}".format(i),
+                    "initial_password": "", "require_annotation": False,
+                    "roles": ["basic"], "href": "/api/user/v1/users/user{}"
+                    .format(i)} for i in range(500)]}
+
+PROJECTS = {"projects": [{"pool": "p0", "name": "db"},
+                         {"pool": "p1", "name": "home dirs"}]}
+
+
+def share(datatype, name):
+    """Return a lun or filesystem with every column of its csv file."""
+    data = {'name': name}
+    for column in ENDPOINTS[datatype].tables[0].columns:
+        parent = data.setdefault(column.parent, {}) if column.parent \
+            else data
+        parent.setdefault(column.key, 1024)
+    return data
+
+
+class Logger(object):
+    """Collect messages."""
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg):
+        self.messages.append(msg)
+
+    warning = info
+
+
 class Namespace:
     """Class to simulate args parsed"""
     def __init__(self, **kwargs):
@@ -70,3 +120,243 @@ class TestExplorer(unittest.TestCase):
             os.removedirs("data")
         except Exception:
             self.fail("file created but unable to remove directory data.")
+
+    def test_01_stream_csv(self):
+        """Streamed collections write the same csv as whole responses."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        outputdir = tempfile.mkdtemp()
+        try:
+            with FakeAppliance({('GET', '/api/user/v1/users'):
+                                (200, USERS)}) as server:
+                result = stream_csv(server.url + '/user/v1/users',
+                                    ('root', 'password'), 10, 'users',
+                                    False, os.path.join(outputdir, 'stream'),
+                                    session)
+            self.assertEqual(result, (None, 'users'))
+            create_csv(USERS, 'users', os.path.join(outputdir, 'whole'))
+            with open(os.path.join(outputdir, 'stream', 'users.csv')) as f:
+                streamed = f.read()
+            with open(os.path.join(outputdir, 'whole', 'users.csv')) as f:
+                self.assertEqual(streamed, f.read())
+            self.assertEqual(len(streamed.splitlines()), 502)
+        finally:
+            shutil.rmtree(outputdir)
+            session.close()
+
+    def test_02_workers(self):
+        """Explorer threads are fixed, or sized by a limiter with auto."""
+        self.assertEqual(workers_value('auto'), 'auto')
+        self.assertEqual(workers_value('12'), 12)
+        for value in ('0', 'many'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                workers_value(value)
+        cases = [(Namespace(), 4, None),
+                 (Namespace(workers=16), 16, None),
+                 (Namespace(workers='auto'), 32, 32),
+                 (Namespace(workers=8, adaptive=True), 8, 8)]
+        for args, workers, maximum in cases:
+            session = ZfssaSession(zauth=('root', 'password'))
+            self.assertEqual(explorer_workers(args, session), workers)
+            self.assertTrue(session.pool_size >= workers)
+            if maximum is None:
+                self.assertTrue(session.limiter is None)
+                self.assertEqual(workers_metadata(workers),
+                                 {'mode': 'fixed', 'workers': workers})
+            else:
+                self.assertEqual(session.limiter.maximum, maximum)
+                session.limiter.release(0.01, 503)
+                metadata = workers_metadata(workers, session.limiter)
+                self.assertEqual((metadata['mode'], metadata['initial'],
+                                  metadata['final'], metadata['decreases']),
+                                 ('auto', 4, 2, 1))
+            session.close()
+
+    def test_03_metadata(self):
+        """The explorer run is described in a JSON file."""
+        outputdir = tempfile.mkdtemp()
+        try:
+            write_metadata(os.path.join(outputdir, 'run'),
+                           {'ip': '192.168.56.150',
+                            'workers': {'mode': 'fixed', 'workers': 4}})
+            with open(os.path.join(outputdir, 'run', METADATAFILE)) as f:
+                data = json.load(f)
+            self.assertEqual(data['workers'], {'mode': 'fixed',
+                                               'workers': 4})
+            self.assertTrue('version' in data)
+        finally:
+            shutil.rmtree(outputdir)
+
+    def test_04_archive(self):
+        """Csv files are written straight into the zip file, the same as
+        in a directory."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        outputdir = tempfile.mkdtemp()
+        rundir = os.path.join(outputdir, 'data', 'zfssa_explorer_run')
+        try:
+            with ExplorerArchive(rundir) as archive:
+                with FakeAppliance({('GET', '/api/user/v1/users'):
+                                    (200, USERS)}) as server:
+                    stream_csv(server.url + '/user/v1/users',
+                               ('root', 'password'), 10, 'users', False,
+                               archive, session)
+                create_csv(USERS, 'users', outputdir)
+                write_metadata(archive, {'ip': '192.168.56.150'})
+            self.assertFalse(os.path.exists(rundir))
+            with ZipFile(rundir + '.zip') as outzip:
+                self.assertEqual(sorted(outzip.namelist()),
+                                 ['zfssa_explorer_run/explorer.json',
+                                  'zfssa_explorer_run/users.csv'])
+                streamed = outzip.read('zfssa_explorer_run/users.csv')
+                data = json.loads(outzip.read('zfssa_explorer_run/'
+                                              'explorer.json').decode())
+            with open(os.path.join(outputdir, 'users.csv'), 'rb') as f:
+                self.assertEqual(streamed, f.read())
+            self.assertEqual(data['ip'], '192.168.56.150')
+        finally:
+            shutil.rmtree(outputdir)
+            session.close()
+
+    def test_05_processes(self):
+        """Big responses are decoded and rendered by a process pool from
+        their bytes."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        outputdir = tempfile.mkdtemp()
+        rundir = os.path.join(outputdir, 'zfssa_explorer_run')
+        processmin = explorer.PROCESSMIN
+        explorer.PROCESSMIN = 0
+        try:
+            files = render_payload(json.dumps(USERS).encode(), 'users')
+            create_csv(USERS, 'users', outputdir)
+            with open(os.path.join(outputdir, 'users.csv'), 'rb') as f:
+                self.assertEqual(files, [('users.csv', f.read())])
+            with FakeAppliance({('GET', '/api/user/v1/users'):
+                                (200, USERS)}) as server:
+                url = server.url + '/user/v1/users'
+                with ExplorerArchive(rundir) as archive, \
+                        ProcessPoolExecutor(max_workers=2) as pool:
+                    stages = explorer_stages(archive, ('root', 'password'),
+                                             10, False, session, 2,
+                                             pool=pool, processes=2)
+                    pipeline = Pipeline(stages)
+                    outcomes = list(pipeline.run(
+                        [((url, 'users'), (url, 'users'))] * 3))
+            self.assertEqual([outcome.value for outcome in outcomes],
+                             ['users'] * 3)
+            self.assertEqual([row['stage'] for row in pipeline.stats()],
+                             ['fetch', 'render', 'archive'])
+            with ZipFile(rundir + '.zip') as outzip:
+                self.assertEqual(len(outzip.namelist()), 3)
+                self.assertEqual(outzip.read(outzip.namelist()[0]),
+                                 files[0][1])
+        finally:
+            explorer.PROCESSMIN = processmin
+            shutil.rmtree(outputdir)
+            session.close()
+
+    def test_06_fanout(self):
+        """Luns and filesystems fetched project by project are merged in
+        one csv file each, a part failing leaves the others."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        outputdir = tempfile.mkdtemp()
+        rundir = os.path.join(outputdir, 'zfssa_explorer_run')
+        pools = '/api/storage/v1/pools'
+        routes = {('GET', '/api/storage/v1/projects'): (200, PROJECTS),
+                  ('GET', pools + '/p0/projects/db/luns'):
+                  (200, {'luns': [share('luns', 'lun0'),
+                                  share('luns', 'lun1')]}),
+                  ('GET', pools + '/p1/projects/home%20dirs/luns'):
+                  (200, {'luns': [share('luns', 'lun2')]}),
+                  ('GET', pools + '/p0/projects/db/filesystems'):
+                  (200, {'filesystems': [share('filesystems', 'fs0')]})}
+        try:
+            with FakeAppliance(routes) as server:
+                items, fanned, fetched = explorer_items(
+                    server.url, ('root', 'password'), 10, False, session,
+                    True)
+                self.assertEqual(fanned, ('luns', 'filesystems'))
+                self.assertEqual(fetched, {'projects': PROJECTS})
+                self.assertEqual(len(items), len(ENDPOINTS) - 3 + 4)
+                self.assertFalse(any(item[1] == 'projects'
+                                     for _, item in items))
+                parts = [item for item in items if item[1][1] in fanned]
+                merged = dict((datatype, MergedCsv(datatype))
+                              for datatype in fanned)
+                with ExplorerArchive(rundir) as archive:
+                    pipeline = Pipeline(explorer_stages(
+                        archive, ('root', 'password'), 10, False, session,
+                        4, merged=merged))
+                    outcomes = dict((outcome.key[1], outcome) for outcome
+                                    in pipeline.run(parts))
+                    for csvfile in merged.values():
+                        csvfile.add(archive)
+                del routes[('GET', '/api/storage/v1/projects')]
+                _, fanned, fetched = explorer_items(
+                    server.url, ('root', 'password'), 10, False, session,
+                    True)
+                self.assertEqual((fanned, fetched), ((), {}))
+            self.assertEqual(outcomes['filesystems p1/home dirs'].stage,
+                             'render')
+            self.assertEqual(merged['luns'].parts, 2)
+            with ZipFile(rundir + '.zip') as outzip:
+                self.assertEqual(sorted(outzip.namelist()),
+                                 ['zfssa_explorer_run/filesystems.csv',
+                                  'zfssa_explorer_run/luns.csv'])
+                luns = outzip.read('zfssa_explorer_run/luns.csv').decode()
+                filesystems = outzip.read('zfssa_explorer_run/'
+                                          'filesystems.csv').decode()
+            name = ENDPOINTS['luns'].tables[0].headers.index('name')
+            self.assertEqual(sorted(line.split(';')[name] for line in
+                                    luns.splitlines()[2:]),
+                             ['lun0', 'lun1', 'lun2'])
+            self.assertEqual(len(filesystems.splitlines()), 3)
+            self.assertEqual(filesystems.count('sep=;'), 1)
+        finally:
+            shutil.rmtree(outputdir)
+            session.close()
+
+    def test_07_cleanup(self):
+        """A failing run resets the shared session and shuts the process
+        pool down."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.breaker = CircuitBreaker('zfssa', 3, 30)
+        shutdowns = []
+
+        class Pool(object):
+            def __init__(self, max_workers):
+                pass
+
+            def shutdown(self):
+                shutdowns.append(True)
+
+        def stages(*args, **kwargs):
+            raise RuntimeError("stages")
+
+        patched = {'read_yaml_file': lambda configfile: CONFIG,
+                   'get_session': lambda *args: session,
+                   'explorer_items': lambda *args: ([], (), {}),
+                   'explorer_stages': stages, 'ProcessPoolExecutor': Pool}
+        saved = dict((name, getattr(explorer, name)) for name in patched)
+        cwd = os.getcwd()
+        rundir = tempfile.mkdtemp()
+        args = Namespace(server='server.yml', progress=False, timeout=10,
+                         cert=False, adaptive=True, processes=2, deadline=60)
+        try:
+            for name, value in patched.items():
+                setattr(explorer, name, value)
+            os.chdir(rundir)
+            self.assertRaises(RuntimeError, run_explorer, args,
+                              logger=Logger())
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(rundir)
+            for name, value in saved.items():
+                setattr(explorer, name, value)
+        self.assertEqual(shutdowns, [True])
+        self.assertTrue(session.limiter is None)
+        self.assertTrue(session.deadline is None)
+        self.assertTrue(session.breaker.logger is None)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
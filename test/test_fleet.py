@@ -0,0 +1,138 @@
+"""Test fleet explorer functions"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from zfssa_utils.explorer import (fleet_cert, fleet_configs, fleet_summary,
+                                  run_fleet)
+from test.test_bulk import Namespace
+
+
+class FakeExplorer(object):
+    """Explorer stand-in sleeping delay seconds, counting the runs at once
+    and failing for the servers in errors."""
+
+    def __init__(self, delay=0.2, errors=None):
+        self.delay = delay
+        self.errors = errors or {}
+        self.running = 0
+        self.most = 0
+        self.deadlines = []
+        self.remaining = []
+        self.lock = threading.Lock()
+
+    def __call__(self, args, logger=None, deadline=None):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+            self.deadlines.append(deadline)
+            self.remaining.append(deadline.remaining())
+        try:
+            time.sleep(self.delay)
+            name = os.path.basename(args.server)
+            if name in self.errors:
+                raise self.errors[name]
+            return {'server': args.server, 'ip': name, 'duration': 0.2,
+                    'requests': 26, 'bytes': 2048, 'failed': 0,
+                    'missing': 0, 'zip': name + '.zip', 'endpoints': [],
+                    'error': None}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestFleet(unittest.TestCase):
+    """Test exploring many appliances at once."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.configs = []
+        for i in range(6):
+            name = os.path.join(self.tmpdir, 'zfssa{}.yml'.format(i))
+            with open(name, 'w') as config:
+                config.write("ip: 192.168.56.{}\n".format(150 + i))
+            self.configs.append(name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_00_configs(self):
+        """Directories and glob patterns give the .yml files, with the
+        certificate named like them when there is one."""
+        open(os.path.join(self.tmpdir, 'zfssa0.crt'), 'w').close()
+        open(os.path.join(self.tmpdir, 'notes.txt'), 'w').close()
+        self.assertEqual(fleet_configs(self.tmpdir), self.configs)
+        self.assertEqual(fleet_configs(os.path.join(self.tmpdir,
+                                                    'zfssa[12].yml')),
+                         self.configs[1:3])
+        self.assertEqual(fleet_cert(self.configs[0], True),
+                         os.path.join(self.tmpdir, 'zfssa0.crt'))
+        self.assertEqual(fleet_cert(self.configs[1], 'all.crt'), 'all.crt')
+        self.assertFalse(fleet_cert(self.configs[1], True))
+        self.assertFalse(fleet_cert(self.configs[0], False))
+
+    def test_01_concurrency(self):
+        """Appliances run at once up to the cap, results keep the config
+        order and the fleet summary is written to the metrics file."""
+        explorer = FakeExplorer()
+        args = Namespace(fleet=self.tmpdir, fleet_workers=3, timeout=10,
+                         cert=False, progress=False, deadline=30,
+                         metrics=os.path.join(self.tmpdir, 'fleet.json'))
+        start = time.time()
+        results = run_fleet(args, explorer=explorer)
+        self.assertTrue(time.time() - start < 0.2 * 6)
+        self.assertEqual(explorer.most, 3)
+        self.assertEqual([result['server'] for result in results],
+                         self.configs)
+        self.assertTrue(all(deadline.seconds == 30
+                            for deadline in explorer.deadlines))
+        with open(args.metrics) as metrics:
+            data = json.load(metrics)
+        self.assertEqual(len(data['appliances']), 6)
+        if not hasattr(sys.stdout, "getvalue"):
+            self.fail("need to run in buffered mode")
+        self.assertTrue("Fleet: appliances 6 with failures 0"
+                        in sys.stdout.getvalue())
+        self.assertTrue(os.path.exists('explorer_output.log'))
+
+    def test_02_failures(self):
+        """Appliances failing don't stop the others and are reported."""
+        explorer = FakeExplorer(delay=0, errors={
+            'zfssa1.yml': SystemExit("Yaml file: Format looks wrong"),
+            'zfssa4.yml': ValueError("bad ip")})
+        args = Namespace(fleet_workers=8, timeout=10, cert=False,
+                         progress=False)
+        results = run_fleet(args, self.configs[:5], explorer=explorer)
+        self.assertEqual([bool(result['error']) for result in results],
+                         [False, True, False, False, True])
+        lines = fleet_summary(results, 1)
+        self.assertTrue(lines[0].startswith(
+            "Fleet: appliances 5 with failures 2"))
+        self.assertTrue(lines[3].endswith(
+            "error: Yaml file: Format looks wrong"))
+        self.assertTrue(lines[2].endswith("ok"))
+        self.assertTrue("2 KB" in lines[2])
+
+    def test_03_deadline(self):
+        """Appliances waiting behind --fleet-workers get their whole
+        deadline once their run starts."""
+        explorer = FakeExplorer(delay=0.3)
+        args = Namespace(fleet_workers=1, timeout=10, cert=False,
+                         progress=False, deadline=0.5)
+        results = run_fleet(args, self.configs[:4], explorer=explorer)
+        self.assertEqual([result['error'] for result in results],
+                         [None] * 4)
+        self.assertEqual(len(explorer.remaining), 4)
+        self.assertTrue(all(remaining > 0.4
+                            for remaining in explorer.remaining))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Test HTTP/2 functions"""
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from zfssa_utils.common import fetch_stream, HEADER
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.luns import list_lun
+from test.fakeappliance import FakeAppliance
+from test.test_connection import LUN as LUNDATA, ROUTES
+from test.test_metrics import USERS, USERSPATH
+
+try:
+    import httpx
+    from test.fakeh2 import FakeH2Appliance, have_openssl
+except (ImportError, SyntaxError):
+    httpx = None
+
+ZAUTH = ('root', 'password')
+LUN = ['pool_0', 'unittest', 'lun01']
+LUNS = {('GET', '/api/storage/v1/pools/pool_0/projects/unittest/luns/'
+         'lun{:02d}'.format(i)): (200, LUNDATA) for i in range(20)}
+
+
+def list_many(session, url):
+    """List the 20 luns from 10 threads, returning the errors."""
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(
+            lambda i: list_lun(['pool_0', 'unittest', 'lun{:02d}'.format(i)],
+                               url, ZAUTH, 10, False, session), range(20)))
+    return [msg for err, msg in results if err]
+
+
+@unittest.skipIf(httpx is None, "needs httpx and h2 installed")
+class TestHttp2(unittest.TestCase):
+    """Test the httpx transport."""
+
+    def test_00_plain_http(self):
+        """Without TLS requests go through HTTP/1.1 with the same
+        results."""
+        session = ZfssaSession(zauth=ZAUTH, http2=True)
+        with FakeAppliance(ROUTES) as server:
+            err, msg = list_lun(LUN, server.url, ZAUTH, 10, False, session)
+            self.assertFalse(err)
+            self.assertTrue("lun 'lun01'" in msg)
+            err, _ = list_lun(['pool_0', 'unittest', 'missing'], server.url,
+                              ZAUTH, 10, False, session)
+            self.assertTrue(err)
+            headers = server.received[0][2]
+        self.assertEqual(headers['Authorization'][:6], 'Basic ')
+        stats = session.connection_stats()
+        self.assertEqual(stats['versions'], {'HTTP/1.1': 2})
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(session.stats.rows()[0]['statuses'],
+                         {'200': 1, '404': 1})
+        session.close()
+
+    def test_01_stream_gzip(self):
+        """Compressed and streamed bodies are decoded, wire bytes counted."""
+        session = ZfssaSession(zauth=ZAUTH, http2=True)
+        with FakeAppliance({('GET', USERSPATH): (200, USERS)},
+                           gzip=True) as server:
+            data, _ = fetch_stream(server.url + '/user/v1/users', ZAUTH,
+                                   HEADER, 10, 'users', False, session)
+            self.assertEqual(list(data['users']), USERS['users'])
+        _, wire, decoded = session.stats.totals()
+        self.assertTrue(0 < wire * 5 < decoded)
+        session.close()
+
+    def test_02_connection_error(self):
+        """httpx errors are raised as requests exceptions."""
+        session = ZfssaSession(zauth=ZAUTH, http2=True)
+        session.retry.retries = 0
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.get("http://127.0.0.1:9/api/user/v1/users", timeout=2)
+        session.close()
+
+    @unittest.skipUnless(httpx and have_openssl(), "needs openssl")
+    def test_03_multiplexed(self):
+        """Concurrent requests share one h2 connection."""
+        session = ZfssaSession(zauth=ZAUTH, http2=True)
+        with FakeH2Appliance(LUNS, delay=0.05) as server:
+            self.assertEqual(list_many(session, server.url), [])
+            self.assertEqual(server.connections, 1)
+            self.assertEqual(set(server.protocols), set(['HTTP/2']))
+        stats = session.connection_stats()
+        self.assertEqual(stats['versions'], {'HTTP/2': 20})
+        self.assertEqual(stats['opened'], 1)
+        self.assertTrue("Protocols: HTTP/2 20" in session.summary())
+        session.close()
+
+    @unittest.skipUnless(httpx and have_openssl(), "needs openssl")
+    def test_04_fallback(self):
+        """Appliances without h2 get HTTP/1.1 connections."""
+        session = ZfssaSession(zauth=ZAUTH, http2=True)
+        with FakeH2Appliance(LUNS, delay=0.05, http2=False) as server:
+            self.assertEqual(list_many(session, server.url), [])
+            self.assertTrue(server.connections > 1)
+        self.assertEqual(session.connection_stats()['versions'],
+                         {'HTTP/1.1': 20})
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
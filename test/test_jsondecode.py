@@ -0,0 +1,102 @@
+"""Test JSON decoding functions"""
+import json
+import unittest
+from zfssa_utils import jsondecode
+from zfssa_utils.common import build_response
+from test.test_connection import LUN
+
+USERS = {"users": [{"logname": u"user\u00e9{}".format(i), "uid": i,
+                    "roles": ["basic", "[x]"], "note": "a, b ] {c}"}
+                   for i in range(300)]}
+PAYLOAD = (b'{"lun": {"name": "lun01", "volsize": 1073741824, '
+           b'"sparse": true, "initiatorgroup": ["default"], '
+           b'"owner": "J\\u00fcrgen"}}')
+
+
+class ChunkedResponse(object):
+    """Response body given in chunks of chunk_size bytes."""
+
+    def __init__(self, body):
+        self.body = body
+        self.url = 'https://zfssa:215/api'
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class TestJsonDecode(unittest.TestCase):
+    """Test json backends."""
+
+    def tearDown(self):
+        jsondecode.set_backend()
+
+    def test_00_backends_agree(self):
+        """Every installed backend decodes bytes the same way."""
+        results = [jsondecode.BACKENDS[name](PAYLOAD)
+                   for name in jsondecode.available()]
+        self.assertEqual(results[0]['lun']['owner'], u'J\u00fcrgen')
+        for result in results:
+            self.assertEqual(result, results[0])
+
+    def test_01_response_json(self):
+        """Responses are decoded from their bytes by the selected backend."""
+        response = build_response('GET', 'https://zfssa:215/api', 200, 'OK',
+                                  {}, json.dumps(LUN).encode())
+        for name in jsondecode.available():
+            jsondecode.set_backend(name)
+            self.assertEqual(jsondecode.backend, name)
+            self.assertEqual(jsondecode.response_json(response), LUN)
+
+    def test_02_fastest_default(self):
+        """The fastest installed backend is the default."""
+        jsondecode.set_backend()
+        self.assertEqual(jsondecode.backend, jsondecode.available()[0])
+        self.assertEqual(jsondecode.available()[-1], 'json')
+
+    def test_03_missing_backend(self):
+        """Asking for a backend not installed exits."""
+        with self.assertRaises(SystemExit):
+            jsondecode.set_backend('nojson')
+
+    def test_04_invalid_json(self):
+        """Invalid bodies raise ValueError with every backend."""
+        for name in jsondecode.available():
+            jsondecode.set_backend(name)
+            with self.assertRaises(ValueError):
+                jsondecode.loads(b'<html>')
+
+
+    def test_05_stream_collection(self):
+        """Collection items are parsed one by one across chunk edges."""
+        body = json.dumps(USERS, indent=1).encode('utf-8')
+        for chunk_size in (1, 7, 4096):
+            response = ChunkedResponse(body)
+            data = jsondecode.stream_json(response, chunk_size)
+            self.assertEqual(list(data), ['users'])
+            self.assertFalse(isinstance(data['users'], list))
+            self.assertEqual(list(data['users']), USERS['users'])
+            self.assertTrue(response.closed)
+
+    def test_06_stream_other(self):
+        """Bodies that are not collections are decoded whole."""
+        for body in (PAYLOAD, b'{"users": []}', b'{"fault": {"code": 404}}'):
+            data = jsondecode.stream_json(ChunkedResponse(body), 5)
+            self.assertEqual({key: list(value) if key == 'users' else value
+                              for key, value in data.items()},
+                             json.loads(body.decode('utf-8')))
+
+    def test_07_stream_truncated(self):
+        """A collection cut in the middle raises ValueError."""
+        body = json.dumps(USERS).encode('utf-8')[:-500]
+        data = jsondecode.stream_json(ChunkedResponse(body), 64)
+        with self.assertRaises(ValueError):
+            list(data['users'])
+
+
+if __name__ == "__main__":
+    unittest.main()
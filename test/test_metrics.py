@@ -0,0 +1,148 @@
+"""Test Metrics functions"""
+import json
+import os
+import tempfile
+import unittest
+import requests
+from zfssa_utils.common import fetch, fetch_stream, HEADER
+from zfssa_utils.connection import ZfssaSession, report_summary
+from zfssa_utils.luns import list_lun
+from zfssa_utils.metrics import endpoint_name, datatype_name, RequestStats
+from test.fakeappliance import FakeAppliance
+from test.test_connection import ROUTES
+
+USERS = {"users": [{"logname": "user{}".format(i), "type": "local",
+                    "fullname": "User {}".format(i)} for i in range(500)]}
+USERSPATH = '/api/user/v1/users'
+ZAUTH = ('root', 'password')
+
+
+class TestMetrics(unittest.TestCase):
+    """Test per endpoint counters."""
+
+    def test_00_endpoint_name(self):
+        """Object names are replaced by '*'."""
+        self.assertEqual(endpoint_name('https://zfssa:215/api/storage/v1/'
+                                       'pools/pool_0/projects/p1/luns/lun01'),
+                         'storage/v1/pools/*/projects/*/luns/*')
+        self.assertEqual(endpoint_name('https://zfssa:215/api/storage/v1/'
+                                       'pools/pool_0/projects/p1/'
+                                       'snapshots'),
+                         'storage/v1/pools/*/projects/*/snapshots')
+        self.assertEqual(endpoint_name('https://zfssa:215/api/san/v1/fc/'
+                                       'initiator-groups'),
+                         'san/v1/fc/initiator-groups')
+        self.assertEqual(endpoint_name('https://zfssa:215/api/storage/v1/'
+                                       'pools/pool_0/projects/users/luns'),
+                         'storage/v1/pools/*/projects/*/luns')
+        self.assertEqual(datatype_name('storage/v1/pools/*/projects/*/'
+                                       'luns/*'), 'luns')
+        self.assertEqual(datatype_name('system/v1/version'), 'version')
+
+    def test_01_transfer_summary(self):
+        """Summary has the total first and the savings by endpoint."""
+        stats = RequestStats()
+        stats.record_bytes('GET', 'https://zfssa:215/api/user/v1/users', 250,
+                           1000)
+        stats.record_bytes('GET', 'https://zfssa:215/api/user/v1/users', 250,
+                           1000)
+        stats.record_bytes('GET', 'https://zfssa:215/api/system/v1/version',
+                           100, 100)
+        lines = stats.transfer_summary()
+        self.assertEqual(lines[0], "Transfer total: responses 3 wire 600 B "
+                         "decoded 2.05 KB saved 71%")
+        self.assertTrue("Transfer user/v1/users: responses 2 wire 500 B "
+                        "decoded 1.95 KB saved 75%" in lines)
+
+    def test_02_gzip(self):
+        """Compressed responses count less wire than decoded bytes."""
+        session = ZfssaSession(zauth=ZAUTH)
+        with FakeAppliance({('GET', USERSPATH): (200, USERS)},
+                           gzip=True) as server:
+            data, _ = fetch(server.url + '/user/v1/users', ZAUTH, HEADER, 10,
+                            'users', False, session)
+            self.assertEqual(data, USERS)
+            headers = server.received[0][2]
+        self.assertTrue('gzip' in headers['Accept-Encoding'])
+        count, wire, decoded = session.stats.totals()
+        self.assertEqual(count, 1)
+        self.assertTrue(wire * 5 < decoded)
+        session.close()
+
+    def test_03_stream(self):
+        """Streamed responses are counted when closed."""
+        session = ZfssaSession(zauth=ZAUTH)
+        with FakeAppliance({('GET', USERSPATH): (200, USERS)},
+                           gzip=True) as server:
+            data, _ = fetch_stream(server.url + '/user/v1/users', ZAUTH,
+                                   HEADER, 10, 'users', False, session)
+            self.assertEqual(list(data['users']), USERS['users'])
+        count, wire, decoded = session.stats.totals()
+        self.assertEqual(count, 1)
+        self.assertTrue(0 < wire * 5 < decoded)
+        session.close()
+
+    def test_04_no_compression(self):
+        """Compression can be disabled."""
+        session = ZfssaSession(zauth=ZAUTH, compression=False)
+        with FakeAppliance({('GET', USERSPATH): (200, USERS)},
+                           gzip=True) as server:
+            fetch(server.url + '/user/v1/users', ZAUTH, HEADER, 10, 'users',
+                  False, session)
+            headers = server.received[0][2]
+        self.assertEqual(headers['Accept-Encoding'], 'identity')
+        count, wire, decoded = session.stats.totals()
+        self.assertEqual(wire, decoded)
+        session.close()
+
+
+    def test_05_latency(self):
+        """Every request is timed and counted by method, endpoint and
+        status."""
+        session = ZfssaSession(zauth=ZAUTH)
+        with FakeAppliance(ROUTES, delay=0.05) as server:
+            for lun in ('lun01', 'lun01', 'missing'):
+                list_lun(['pool_0', 'unittest', lun], server.url, ZAUTH, 10,
+                         False, session)
+        row = session.stats.rows()[0]
+        self.assertEqual((row['method'], row['endpoint'], row['datatype']),
+                         ('GET', 'storage/v1/pools/*/projects/*/luns/*',
+                          'luns'))
+        self.assertEqual(row['count'], 3)
+        self.assertEqual(row['statuses'], {'200': 2, '404': 1})
+        self.assertTrue(0.05 <= row['p50'] <= row['p99'] <= row['max'])
+        table = session.stats.latency_summary()
+        self.assertTrue(table[0].startswith("Method Endpoint"))
+        self.assertTrue(table[1].endswith("200:2 404:1"))
+        session.close()
+
+    def test_06_errors(self):
+        """Connection errors are counted as error status."""
+        session = ZfssaSession(zauth=ZAUTH)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.get("http://127.0.0.1:9/api/user/v1/users", timeout=2)
+        self.assertEqual(session.stats.rows()[0]['statuses'], {'error': 1})
+        session.close()
+
+    def test_07_json(self):
+        """Metrics are written as JSON at the end of the run."""
+        session = ZfssaSession(zauth=ZAUTH)
+        handle, filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            with FakeAppliance({('GET', USERSPATH): (200, USERS)}) as server:
+                fetch(server.url + '/user/v1/users', ZAUTH, HEADER, 10,
+                      'users', False, session)
+            report_summary(session, metrics=filename)
+            with open(filename) as jsonfile:
+                data = json.load(jsonfile)
+        finally:
+            os.remove(filename)
+        self.assertEqual(data['totals']['responses'], 1)
+        self.assertEqual(data['endpoints'][0]['endpoint'], 'user/v1/users')
+        self.assertEqual(data['endpoints'][0]['statuses'], {'200': 1})
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Test pipeline functions"""
+import threading
+import time
+import unittest
+from zfssa_utils.deadline import Deadline
+from zfssa_utils.pipeline import Pipeline, Stage
+
+
+def sleeper(delay, fail=None):
+    """Return a stage function sleeping delay seconds, raising ValueError for
+    the value fail."""
+    def func(value):
+        time.sleep(delay)
+        if value == fail:
+            raise ValueError("bad value {}".format(value))
+        return value
+    return func
+
+
+class TestPipeline(unittest.TestCase):
+    """Test items run through bounded stages."""
+
+    def test_00_overlap(self):
+        """Stages work on different items at once, outcomes keep the last
+        value and every stage counts its items and busy time."""
+        pipeline = Pipeline([Stage('fetch', sleeper(0.1), 3, queuesize=0),
+                             Stage('render', sleeper(0.1)),
+                             Stage('archive', lambda value: value * 10)])
+        start = time.time()
+        outcomes = list(pipeline.run([(i, i) for i in range(6)]))
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertEqual(sorted(outcome.value for outcome in outcomes),
+                         [0, 10, 20, 30, 40, 50])
+        stats = pipeline.stats()
+        self.assertEqual([row['stage'] for row in stats],
+                         ['fetch', 'render', 'archive'])
+        self.assertEqual([row['items'] for row in stats], [6, 6, 6])
+        self.assertTrue(stats[1]['busy'] >= 0.6)
+        self.assertTrue(stats[1]['use'] > 60)
+        self.assertEqual(len(pipeline.summary()), 4)
+
+    def test_01_bounded(self):
+        """A slow stage holds the stages before it at the queue size."""
+        fetched = []
+        lock = threading.Lock()
+
+        def fetch(value):
+            with lock:
+                fetched.append(value)
+            return value
+
+        def render(value):
+            time.sleep(0.05)
+            with lock:
+                # fetched, queued and the one rendering
+                self.assertTrue(len(fetched) <= value + 3)
+            return value
+
+        pipeline = Pipeline([Stage('fetch', fetch, queuesize=0),
+                             Stage('render', render, queuesize=1)])
+        outcomes = list(pipeline.run([(i, i) for i in range(10)]))
+        self.assertEqual([outcome.value for outcome in outcomes],
+                         list(range(10)))
+        self.assertEqual(pipeline.stats()[1]['queue_max'], 1)
+
+    def test_02_errors(self):
+        """Failed items say the stage failing, the others go on."""
+        pipeline = Pipeline([Stage('fetch', sleeper(0), 2, queuesize=0),
+                             Stage('decode', sleeper(0, fail=3))])
+        outcomes = dict((outcome.key, outcome) for outcome in
+                        pipeline.run([(i, i) for i in range(5)]))
+        self.assertEqual(len(outcomes), 5)
+        self.assertEqual(outcomes[3].stage, 'decode')
+        self.assertTrue(isinstance(outcomes[3].error, ValueError))
+        self.assertEqual(outcomes[4].value, 4)
+        self.assertEqual(pipeline.stats()[1]['errors'], 1)
+
+    def test_03_deadline(self):
+        """Items not fetched by the deadline are skipped, the ones fetched
+        finish."""
+        pipeline = Pipeline([Stage('fetch', sleeper(0.2), 2, queuesize=0),
+                             Stage('render', sleeper(0.1))],
+                            Deadline(0.3))
+        start = time.time()
+        outcomes = list(pipeline.run([(i, i) for i in range(10)]))
+        self.assertTrue(time.time() - start < 0.8)
+        self.assertEqual(len(outcomes), 10)
+        done = [outcome.key for outcome in outcomes if not outcome.skipped]
+        self.assertEqual(sorted(done), [0, 1, 2, 3])
+        self.assertTrue(all(outcome.stage == 'fetch'
+                            for outcome in outcomes if outcome.skipped))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Test Retry functions"""
+import unittest
+import requests
+from zfssa_utils.retries import RetryPolicy, RetryBudget
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.snapshots import create_snap, delete_snap, list_snap
+from test.fakeappliance import FakeAppliance
+
+SNAPURL = '/api/storage/v1/pools/pool_0/projects/unittest/snapshots'
+SNAP = ['pool_0', 'unittest', '-', 'project', 'backup']
+
+
+class TestRetries(unittest.TestCase):
+    """Test retry policy and retries in sessions."""
+
+    def test_00_delay(self):
+        """Delay grows exponentially with jitter and a ceiling."""
+        policy = RetryPolicy(retries=5, backoff=1, max_backoff=4)
+        for attempt in range(5):
+            self.assertTrue(0 <= policy.delay(attempt) <=
+                            min(4, 2 ** attempt))
+
+    def test_01_budget(self):
+        """Budget stops retries for the whole run."""
+        policy = RetryPolicy(retries=3, budget=RetryBudget(2))
+        self.assertTrue(policy.allowed(0))
+        self.assertTrue(policy.allowed(0))
+        self.assertFalse(policy.allowed(0))
+        self.assertFalse(policy.allowed(3))
+        self.assertEqual(policy.budget.denied, 1)
+
+    def test_02_from_config(self):
+        """Policy is read from the server config."""
+        policy = RetryPolicy.from_config({'retries': 2, 'retry_budget': 7,
+                                          'retry_statuses': [503]})
+        self.assertEqual(policy.retries, 2)
+        self.assertEqual(policy.budget.left, 7)
+        self.assertTrue(policy.retryable(503))
+        self.assertFalse(policy.retryable(500))
+
+    def test_03_get_retried(self):
+        """GET answered with 503 is retried until success."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.retry = RetryPolicy(retries=3, backoff=0.01)
+        routes = {('GET', SNAPURL): (200, {"snapshots": [
+            {"name": "backup", "creation": "20180220T11:41:15",
+             "space_data": 1024, "space_unique": 0}]})}
+        with FakeAppliance(routes, {('GET', SNAPURL): 2}) as server:
+            err, msg = list_snap(SNAP, server.url, ('root', 'password'), 10,
+                                 False, session)
+        self.assertFalse(err)
+        self.assertTrue('SUCCESS' in msg)
+        self.assertEqual(session.retry.budget.spent, 2)
+        session.close()
+
+    def test_04_post_not_created(self):
+        """POST is retried when a GET confirms the object is absent."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.retry = RetryPolicy(retries=3, backoff=0.01)
+        routes = {('POST', SNAPURL): (201, {"snapshot": {"name": "backup"}})}
+        with FakeAppliance(routes, {('POST', SNAPURL): 1}) as server:
+            err, msg = create_snap(SNAP, server.url, ('root', 'password'),
+                                   10, False, session)
+            methods = [(method, path) for method, path, _, _
+                       in server.received]
+        self.assertFalse(err)
+        self.assertEqual(methods, [('POST', SNAPURL),
+                                   ('GET', SNAPURL + '/backup'),
+                                   ('POST', SNAPURL)])
+        session.close()
+
+    def test_05_post_created(self):
+        """POST is not retried when the object exists after the failure."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.retry = RetryPolicy(retries=3, backoff=0.01)
+        routes = {('GET', SNAPURL + '/backup'): (200, {"snapshot": {
+            "name": "backup"}})}
+        with FakeAppliance(routes, {('POST', SNAPURL): 1}) as server:
+            err, _ = create_snap(SNAP, server.url, ('root', 'password'),
+                                 10, False, session)
+            posts = [path for method, path, _, _ in server.received
+                     if method == 'POST']
+        self.assertFalse(err)
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(session.retry.budget.spent, 0)
+        session.close()
+
+    def test_06_delete_confirmed(self):
+        """DELETE is not sent again when a GET finds the object gone, and
+        retried while the object is still there."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.retry = RetryPolicy(retries=3, backoff=0.01)
+        failures = {('DELETE', SNAPURL + '/backup'): 1}
+        with FakeAppliance({}, dict(failures)) as server:
+            err, _ = delete_snap(SNAP, server.url, ('root', 'password'),
+                                 10, False, session)
+            methods = [method for method, _, _, _ in server.received]
+        self.assertFalse(err)
+        self.assertEqual(methods, ['DELETE', 'GET'])
+        routes = {('GET', SNAPURL + '/backup'): (200, {"snapshot": {
+            "name": "backup"}}), ('DELETE', SNAPURL + '/backup'): (204, {})}
+        with FakeAppliance(routes, dict(failures)) as server:
+            err, _ = delete_snap(SNAP, server.url, ('root', 'password'),
+                                 10, False, session)
+            methods = [method for method, _, _, _ in server.received]
+        self.assertFalse(err)
+        self.assertEqual(methods, ['DELETE', 'GET', 'DELETE'])
+        session.close()
+
+    def test_07_put_read_timeout(self):
+        """PUT is not sent again after a read timeout."""
+        session = ZfssaSession(zauth=('root', 'password'))
+        session.retry = RetryPolicy(retries=3, backoff=0.01)
+        with FakeAppliance({}, delay=0.5) as server:
+            self.assertRaises(requests.exceptions.ReadTimeout, session.put,
+                              server.url + SNAPURL[4:] + '/backup',
+                              data='{}', timeout=0.1)
+            puts = [path for method, path, _, _ in server.received
+                    if method == 'PUT']
+        self.assertEqual(len(puts), 1)
+        self.assertEqual(session.retry.budget.spent, 0)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
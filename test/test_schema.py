@@ -0,0 +1,92 @@
+"""Test endpoint schema functions"""
+import csv
+import io
+import unittest
+from zfssa_utils.common import urls_constructor
+from zfssa_utils.schema import (compile_row, parse_column, Blank, Column,
+                                Endpoint, Table, ENDPOINTS)
+
+POOLS = {'pools': [{'status': 'online', 'profile': 'mirror', 'name': 'p0',
+                    'usage': {'available': 10240, 'used': 2048},
+                    'peer': '-', 'owner': 'zfssa', 'asn': 'a1'},
+                   {'status': 'exported', 'name': 'p1', 'peer': '-',
+                    'owner': 'zfssa', 'asn': 'a1', 'href': '/p1'}]}
+
+
+class TestSchema(unittest.TestCase):
+    """Test the declared endpoints and their row extractors."""
+
+    def test_00_columns(self):
+        """Column specs give headers, optional and human size columns."""
+        self.assertEqual(parse_column('name'),
+                         [Column('name', None, 'name', False, False)])
+        self.assertEqual(parse_column('source.encryption?'),
+                         [Column('src_encryption', 'source', 'encryption',
+                                 True, False)])
+        self.assertEqual([column.header for column in
+                          parse_column('usage.free+')],
+                         ['usage_free', 'usage_free (Human)'])
+        self.assertEqual(parse_column('recordsize%=rs'),
+                         [Column('rs', None, 'recordsize', False, True)])
+
+    def test_01_rows(self):
+        """Rows missing optional fields get '-', missing required fields
+        fail, blanked columns are '-' without being read."""
+        columns = [column for spec in ['name', 'volsize+', 'source.dedup',
+                                       'writelimit?']
+                   for column in parse_column(spec)]
+        extract = compile_row(columns)
+        self.assertEqual(extract({'name': 'lun01', 'volsize': 1048576,
+                                  'source': {'dedup': 'local'},
+                                  'writelimit': 0}),
+                         ['lun01', 1048576, '1 MB', 'local', 0])
+        self.assertEqual(extract({'name': 'lun02', 'volsize': 1024,
+                                  'source': {'dedup': 'local'}}),
+                         ['lun02', 1024, '1 KB', 'local', '-'])
+        with self.assertRaises(KeyError):
+            extract({'name': 'lun03', 'source': {'dedup': 'local'}})
+        blanked = compile_row(columns, ('volsize', 'source'))
+        self.assertEqual(blanked({'name': 'lun04'}),
+                         ['lun04', '-', '-', '-', '-'])
+
+    def test_02_tables(self):
+        """Tables read a dict as one row, lists and blank variants."""
+        table = Table('pools', ['status', 'profile', 'name',
+                                'usage.available+', 'href?'],
+                      blank=Blank('status', 'exported', ('profile',
+                                                         'usage')))
+        self.assertEqual(list(table.rows(POOLS)),
+                         [['online', 'mirror', 'p0', 10240, '10 KB', '-'],
+                          ['exported', '-', 'p1', '-', '-', '/p1']])
+        endpoint = Endpoint('cluster', 'hardware/v1/cluster', [
+            Table('cluster', ['state']),
+            Table('cluster.resources', ['owner', 'href'])])
+        output = io.StringIO() if str is not bytes else io.BytesIO()
+        endpoint.write(csv.writer(output, delimiter=';'),
+                       {'cluster': {'state': 'AKCS_CLUSTERED',
+                                    'resources': [{'owner': 'a',
+                                                   'href': '/r1'},
+                                                  {'owner': 'b',
+                                                   'href': '/r2'}]}})
+        self.assertEqual(output.getvalue().splitlines(),
+                         ['state', 'AKCS_CLUSTERED', 'owner;href',
+                          'a;/r1', 'b;/r2'])
+
+    def test_03_registry(self):
+        """Every registered endpoint is collected by the explorer."""
+        urls = urls_constructor("https://zfssa:215/api")
+        self.assertEqual(len(urls), len(ENDPOINTS))
+        self.assertEqual(urls[0], ("https://zfssa:215/api/system/v1/version",
+                                   "version"))
+        self.assertTrue(("https://zfssa:215/api/san/v1/fc/target-groups",
+                         "fc_target-groups") in urls)
+        headers = ENDPOINTS['pools'].tables[0].headers
+        self.assertEqual(len(headers), 23)
+        self.assertEqual(headers[3:5], ['usage_available',
+                                        'usage_available (Human)'])
+        self.assertTrue('secondary_cache' in
+                        ENDPOINTS['luns'].tables[0].headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
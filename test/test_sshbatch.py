@@ -0,0 +1,187 @@
+"""Test SSH batch functions"""
+import time
+import unittest
+from zfssa_utils.bulk import run_bulk
+from zfssa_utils.connection import ZfssaSession
+from zfssa_utils.filesystems import create_filesystems
+from zfssa_utils.luns import create_lun, delete_lun, list_lun
+from zfssa_utils.projects import create_project
+from zfssa_utils.snapshots import create_snap, delete_snap
+from zfssa_utils.sshbatch import (build_script, compile_create_lun,
+                                  compile_update, parse_result, run_ssh,
+                                  paramiko)
+from zfssa_utils.updates import update_entry
+from test.fakessh import FakeSshAppliance
+from test.test_bulk import Namespace
+from test.test_deadline import output_lines
+
+ZAUTH = ('root', 'password')
+PROJECT = ['pool_0', 'unittest', '/export/unittest', '10g', '10g', 'gzip',
+           'latency', 'False', '128k', 'False', 'True', 'True', 'nobody',
+           'other', '750', '128k', '1g', 'on', 'off']
+FS = ['pool_0', 'unittest', 'fs10', '/export/unittest/fs10', '2g', '1g',
+      'lzjb', 'latency', 'False', '128k', 'False', 'False', 'root', 'other',
+      '750', 'rw=@192.168.56.101/24:@192.168.56.1/24', 'on']
+
+
+def lun(name):
+    """Return a create luns csv line."""
+    return ['pool_0', 'unittest', name, '1g', '128k', 'False', 'default',
+            'cluster-test', 'gzip', 'latency', 'False']
+
+
+def run(server, func, entries, **kwargs):
+    """Run entries through run_ssh, returning their results by index."""
+    results = {}
+    kwargs.setdefault('accept_host_key', True)
+    run_ssh(func, entries, server.url, ZAUTH, 10,
+            lambda index, err, msg: results.update({index: (err, msg)}),
+            port=server.port, **kwargs)
+    return results
+
+
+@unittest.skipIf(paramiko is None, "needs paramiko")
+class TestSshBatch(unittest.TestCase):
+    """Test csv files run as one appliance CLI script."""
+
+    def test_00_compile(self):
+        """Csv lines compile to CLI commands, bad lines fail at once."""
+        line = compile_create_lun(lun('lun01'))
+        self.assertEqual(line.commands[:4],
+                         ['shares set pool="pool_0"', 'shares',
+                          'select unittest', 'lun lun01'])
+        self.assertTrue('set sparse=false' in line.commands)
+        self.assertEqual(line.commands[-1], 'commit')
+        update = compile_update(['lun', 'lun10;unittest;pool_0',
+                                 'compression;lzjb', 'sparse;True'])
+        self.assertEqual(update.commands[-3:], ['set compression="lzjb"',
+                                                'set sparse=true', 'commit'])
+        script = build_script([(0, line), (1, update)])
+        self.assertTrue(script.startswith("script\n"))
+        self.assertTrue(script.endswith("\n.\n"))
+        self.assertEqual(parse_result("ZU 1 FAIL volsize must be set\n"),
+                         (1, "volsize must be set"))
+        self.assertEqual(parse_result("ZU 0 OK\n"), (0, None))
+        self.assertEqual(parse_result("Last login: today"), None)
+
+    def test_01_provision(self):
+        """A whole provisioning job runs in a single SSH session, failed
+        lines don't stop the next ones."""
+        with FakeSshAppliance() as server:
+            projects = run(server, create_project, [PROJECT, PROJECT])
+            filesystems = run(server, create_filesystems, [FS])
+            luns = run(server, create_lun,
+                       [lun('lun{:02d}'.format(i)) for i in range(50)] +
+                       [['pool_0', 'unittest', 'short']])
+            snaps = run(server, create_snap,
+                        [['pool_0', 'unittest', 'fs10', 'filesystem', 's1'],
+                         ['pool_0', 'unittest', 'lun01', 'lun', 's1'],
+                         ['pool_0', 'missing', '-', 'project', 's1']])
+            project = server.shares.pools['pool_0']['unittest']
+        self.assertEqual(len(server.scripts), 4)
+        self.assertFalse(projects[0][0])
+        self.assertTrue("project 'unittest' pool 'pool_0'" in projects[0][1])
+        self.assertTrue(projects[1][0])
+        self.assertTrue("already exists" in projects[1][1])
+        self.assertEqual(project['properties']['sharenfs'], 'on')
+        self.assertFalse(filesystems[0][0])
+        self.assertEqual(project['filesystems']['fs10']['properties']
+                         ['sharenfs'], FS[15])
+        self.assertEqual(len(project['luns']), 50)
+        self.assertFalse(any(luns[i][0] for i in range(50)))
+        self.assertTrue(luns[50][0])
+        self.assertTrue("It needs to be 11 columns long" in luns[50][1])
+        self.assertEqual([snaps[i][0] for i in range(3)],
+                         [False, False, True])
+        self.assertTrue("project 'missing' not found" in snaps[2][1])
+
+    def test_02_delete_update(self):
+        """Deletes and updates report every line."""
+        with FakeSshAppliance() as server:
+            run(server, create_project, [PROJECT])
+            run(server, create_lun, [lun('lun01'), lun('lun02')])
+            run(server, create_snap,
+                [['pool_0', 'unittest', 'lun01', 'lun', 's1']])
+            updates = run(server, update_entry,
+                          [['lun', 'lun01;unittest;pool_0',
+                            'compression;lzjb'],
+                           ['lun', 'lun09;unittest;pool_0',
+                            'compression;lzjb'],
+                           ['lun', 'lun01;unittest'],
+                           ['project', '-;unittest;pool_0',
+                            'logbias;throughput']])
+            snaps = run(server, delete_snap,
+                        [['pool_0', 'unittest', 'lun01', 'lun', 's1']])
+            deleted = run(server, delete_lun,
+                          [['pool_0', 'unittest', 'lun02'],
+                           ['pool_0', 'unittest', 'lun09']])
+            project = server.shares.pools['pool_0']['unittest']
+        self.assertEqual([updates[i][0] for i in range(4)],
+                         [False, True, True, False])
+        self.assertTrue("lun 'lun01' project 'unittest' pool 'pool_0' - "
+                        "updates: compression 'lzjb'" in updates[0][1])
+        self.assertTrue("Wrong type in file format" in updates[2][1])
+        self.assertEqual(project['properties']['logbias'], 'throughput')
+        self.assertEqual(project['luns']['lun01']['properties']
+                         ['compression'], 'lzjb')
+        self.assertFalse(snaps[0][0])
+        self.assertEqual(project['luns']['lun01']['snapshots'], set())
+        self.assertEqual([deleted[i][0] for i in range(2)], [False, True])
+        self.assertEqual(list(project['luns']), ['lun01'])
+
+    def test_03_connection_errors(self):
+        """Lines fail with the error when the session can't be opened."""
+        with FakeSshAppliance(credentials=('root', 'other')) as server:
+            results = run(server, create_lun, [lun('lun01'), lun('lun02')])
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(err for err, _ in results.values()))
+        self.assertTrue("Authentication failed" in results[1][1])
+        with self.assertRaises(SystemExit):
+            run(server, list_lun, [lun('lun01')])
+        # the password is not sent to a host that can't be verified
+        with FakeSshAppliance() as server:
+            results = run(server, create_lun, [lun('lun01')],
+                          accept_host_key=False)
+            self.assertEqual(server.scripts, [])
+        self.assertTrue(results[0][0])
+        self.assertTrue("not found in known_hosts" in results[0][1])
+
+    def test_04_run_bulk(self):
+        """Bulk commands run with --ssh, lines without a result by the
+        deadline fail."""
+        session = ZfssaSession(zauth=ZAUTH)
+        with FakeSshAppliance(delay=0.1) as server:
+            run_bulk(create_project, [PROJECT], server.url, ZAUTH, session,
+                     Namespace(timeout=10, cert=False, progress=False,
+                               ssh=True, ssh_port=server.port,
+                               ssh_accept_host_key=True),
+                     "Creating projects", None)
+            start = time.time()
+            run_bulk(create_lun, [lun('lun{:02d}'.format(i))
+                                  for i in range(20)],
+                     server.url, ZAUTH, session,
+                     Namespace(timeout=10, cert=False, progress=False,
+                               ssh=True, ssh_port=server.port,
+                               ssh_accept_host_key=True, deadline=1),
+                     "Creating luns", None)
+            self.assertTrue(time.time() - start < 2)
+            # lists keep using the REST api
+            run_bulk(list_lun, [['pool_0', 'unittest', 'lun01']],
+                     server.url, ZAUTH, session,
+                     Namespace(timeout=1, cert=False, progress=False,
+                               ssh=True, ssh_port=server.port,
+                               ssh_accept_host_key=True),
+                     "Listing luns", None)
+        lines = output_lines(self)
+        self.assertTrue("LIST" in lines.pop())
+        self.assertEqual(len(lines), 21)
+        self.assertTrue("CREATE - SUCCESS - project 'unittest'" in lines[0])
+        self.assertTrue("CREATE - SUCCESS - lun 'lun00'" in lines[1])
+        self.assertTrue("lun 'lun19' project 'unittest' pool 'pool_0' - "
+                        "Error \"no result, run deadline of 1s exceeded\""
+                        in lines[-1])
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
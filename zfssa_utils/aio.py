@@ -0,0 +1,430 @@
+"""Asyncio functions
+
+Asyncio client running the list/create/delete/update functions with many
+requests in flight from one process (python 3 and aiohttp only).
+
+The row functions are reused as they are: every time one of them needs a
+response it is replayed with the responses already received, so messages
+and (err, msg) results are exactly the same as in the serial run.
+"""
+import asyncio
+import base64
+import functools
+import json
+import ssl
+import time
+import requests
+from zfssa_utils.breaker import CircuitOpenError
+from zfssa_utils.common import HEADER, build_response, msgdeco
+from zfssa_utils.deadline import DeadlineExceeded, INTERRUPTED
+from zfssa_utils.connection import TOKENHEADER
+from zfssa_utils.metrics import RequestStats
+from zfssa_utils.retries import RetryPolicy
+from zfssa_utils.luns import create_lun, list_lun, delete_lun
+from zfssa_utils.snapshots import create_snap
+from zfssa_utils.filesystems import create_filesystems
+from zfssa_utils.projects import create_project
+from zfssa_utils.updates import update_component
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class PendingRequest(Exception):
+    """Raised by ReplaySession when the row function needs a new response."""
+
+    def __init__(self, method, url, kwargs):
+        super(PendingRequest, self).__init__(method, url)
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+
+class ReplaySession(object):
+    """Session handing out already received responses in order."""
+
+    def __init__(self, responses, headers=None):
+        self.responses = responses
+        self.headers = headers or {}
+        self.index = 0
+
+    def request(self, method, url, **kwargs):
+        if self.index < len(self.responses):
+            response = self.responses[self.index]
+            self.index += 1
+            if isinstance(response, Exception):
+                raise response
+            return response
+        raise PendingRequest(method, url, kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+class AsyncZfssaClient(object):
+    """Asyncio ZFSSA client with a bounded number of in-flight requests."""
+
+    def __init__(self, zfsurl, zauth, timeout=100, verify=False, limit=64,
+                 headers=None, bucket=None, breaker=None, cassette=None,
+                 deadline=None, retry=None, auth_session=None, stats=None,
+                 limiter=None):
+        if aiohttp is None:
+            exit("Error: the asyncio engine needs aiohttp installed "
+                 "(pip install aiohttp)")
+        self.zfsurl = zfsurl
+        self.zauth = zauth
+        self.timeout = timeout
+        self.verify = verify
+        self.limit = limit
+        self.headers = headers or dict(HEADER)
+        self.bucket = bucket
+        self.breaker = breaker
+        self.cassette = cassette
+        self.deadline = deadline
+        self.retry = retry or RetryPolicy()
+        self.auth_session = auth_session
+        self.stats = stats or RequestStats()
+        self.limiter = limiter
+        self.waiters = []
+        self.semaphore = None
+        self.session = None
+        self.inflight = {}
+        self.shared = 0
+
+    async def __aenter__(self):
+        if self.verify:
+            sslcontext = ssl.create_default_context(cafile=self.verify)
+        else:
+            sslcontext = False
+        self.semaphore = asyncio.Semaphore(self.limit)
+        connector = aiohttp.TCPConnector(limit=self.limit, ssl=sslcontext)
+        headers = dict(self.headers)
+        if TOKENHEADER not in headers:
+            credentials = "{}:{}".format(*self.zauth).encode()
+            headers['Authorization'] = "Basic {}".format(
+                base64.b64encode(credentials).decode())
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             headers=headers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def request(self, method, url, data=None, headers=None,
+                      timeout=None, **_):
+        """Send one request, returning a requests.Response or the
+        requests exception the serial run would have raised. Identical GET
+        requests in flight share one call."""
+        if method != 'GET':
+            return await self._retried(method, url, data, headers, timeout)
+        key = (url, tuple(sorted((headers or {}).items())))
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._retried(method, url, data,
+                                                       headers, timeout))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.shared += 1
+        response = await asyncio.shield(task)
+        if isinstance(response, Exception):
+            return response
+        return build_response(method, url, response.status_code,
+                              response.reason, response.headers,
+                              response.content)
+
+    async def _retried(self, method, url, data, headers, timeout):
+        """Send request retrying the failures allowed by the retry policy,
+        like ZfssaSession._retried: POST requests are only retried when a
+        GET for the named object confirms it was not created, DELETE
+        requests while a GET finds the object. PUT requests are not retried
+        after errors, a timeout may come after the appliance applied
+        them."""
+        attempt = 0
+        while True:
+            response = await self._authed(method, url, data, headers,
+                                          timeout)
+            if isinstance(response, (CircuitOpenError, DeadlineExceeded)):
+                return response
+            if isinstance(response, Exception):
+                if not isinstance(response, self.retry.exceptions):
+                    return response
+            elif not self.retry.retryable(response.status_code):
+                return response
+            if attempt < self.retry.retries and method.upper() == 'POST':
+                absent, existing = await self._confirm_absent(
+                    url, data, headers, timeout)
+                if existing is not None:
+                    return existing
+                if not absent:
+                    attempt = self.retry.retries
+            elif attempt < self.retry.retries and method.upper() == 'DELETE':
+                present, deleted = await self._confirm_present(
+                    url, headers, timeout)
+                if deleted is not None:
+                    return deleted
+                if not present:
+                    attempt = self.retry.retries
+            elif method.upper() == 'PUT' and isinstance(response, Exception):
+                attempt = self.retry.retries
+            if not self.retry.allowed(attempt):
+                return response
+            delay = self.retry.delay(attempt)
+            if self.deadline is not None:
+                delay = self.deadline.cap(delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _confirm_absent(self, url, data, headers, timeout):
+        """Look for the object a failed POST tried to create, returning
+        (absent, response) where response is the GET response when the
+        object exists."""
+        try:
+            name = json.loads(data or '{}')['name']
+        except (ValueError, KeyError, TypeError):
+            return False, None
+        response = await self._authed('GET', "{}/{}".format(url.rstrip('/'),
+                                                            name),
+                                      None, headers, timeout)
+        if isinstance(response, Exception):
+            return False, None
+        if response.status_code == 404:
+            return True, None
+        if response.ok:
+            return False, response
+        return False, None
+
+    async def _confirm_present(self, url, headers, timeout):
+        """Look for the object a failed DELETE tried to remove, returning
+        (present, response) where response is a 204 DELETE response when
+        the object is gone."""
+        response = await self._authed('GET', url, None, headers, timeout)
+        if isinstance(response, Exception):
+            return False, None
+        if response.status_code == 404:
+            return False, build_response('DELETE', url, 204, 'No Content',
+                                         {}, b'')
+        return response.ok, None
+
+    async def _authed(self, method, url, data, headers, timeout):
+        """Send one request with the session token, login again once
+        through auth_session when the appliance rejects an expired token
+        (401), like ZfssaSession._send."""
+        token = self.headers.get(TOKENHEADER)
+        if self.auth_session is None or token is None:
+            return await self._send(method, url, data, headers, timeout)
+        headers = dict(headers or {})
+        headers[TOKENHEADER] = token
+        response = await self._send(method, url, data, headers, timeout)
+        if isinstance(response, Exception) or response.status_code != 401:
+            return response
+        # login blocks, other requests go on while it runs
+        login = functools.partial(self.auth_session.login, expired=token,
+                                  timeout=timeout or self.timeout)
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, login)
+        except requests.exceptions.RequestException:
+            return response
+        if not self.auth_session.token:
+            return response
+        self.headers[TOKENHEADER] = headers[TOKENHEADER] = \
+            self.auth_session.token
+        return await self._send(method, url, data, headers, timeout)
+
+    async def _send(self, method, url, data, headers, timeout):
+        """Send one request, recording its latency, status and bytes in
+        stats like ZfssaSession._dispatch."""
+        if self.bucket is not None:
+            await asyncio.sleep(self.bucket.reserve())
+        timeout = timeout or self.timeout
+        async with self.semaphore:
+            # checked once a slot is free, time may be up or the circuit
+            # may have opened since
+            if self.deadline is not None:
+                try:
+                    timeout = self.deadline.timeout(timeout)
+                except DeadlineExceeded as error:
+                    return error
+            if self.breaker is not None:
+                try:
+                    self.breaker.before()
+                except CircuitOpenError as error:
+                    return error
+            if self.limiter is not None:
+                await self._acquire_slot()
+            start = time.time()
+            status = None
+            try:
+                if self.cassette is not None and \
+                        not self.cassette.recording:
+                    response = await self._replay(method, url, data)
+                    self._record(method, url, response, time.time() - start)
+                    if not isinstance(response, Exception):
+                        status = response.status_code
+                    return response
+                client_timeout = aiohttp.ClientTimeout(total=timeout)
+                try:
+                    async with self.session.request(
+                            method, url, data=data, headers=headers,
+                            timeout=client_timeout) as resp:
+                        body = await resp.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    if self.breaker is not None:
+                        self.breaker.failure()
+                    self.stats.record(method, url, None, time.time() - start)
+                    return requests.exceptions.ConnectionError(
+                        "{} {} - {!r}".format(method, url, error))
+                status = resp.status
+            finally:
+                if self.limiter is not None:
+                    self._release_slot(time.time() - start, status)
+        latency = time.time() - start
+        if self.breaker is not None:
+            self.breaker.success()
+        # aiohttp decodes gzip, Content-Length is what the wire carried
+        wire = resp.content_length or len(body)
+        self.stats.record(method, url, resp.status, latency)
+        self.stats.record_bytes(method, url, wire, len(body))
+        if self.cassette is not None:
+            self.cassette.add(method, url, data, resp.status, resp.reason,
+                              resp.headers, body, wire, latency)
+        return build_response(method, url, resp.status, resp.reason,
+                              resp.headers, body)
+
+    async def _acquire_slot(self):
+        """Wait for a request slot of the adaptive limiter, the requests of
+        this loop free them in _release_slot."""
+        while not self.limiter.try_acquire():
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            await waiter
+
+    def _release_slot(self, latency, status):
+        self.limiter.release(latency, status)
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _record(self, method, url, response, latency):
+        """Record a replayed response or error in stats."""
+        if isinstance(response, Exception):
+            self.stats.record(method, url, None, latency)
+            return
+        self.stats.record(method, url, response.status_code, latency)
+        self.stats.record_bytes(method, url, len(response.content),
+                                len(response.content))
+
+    async def _replay(self, method, url, data):
+        item = self.cassette.find(method, url, data)
+        if item is None:
+            return self.cassette.not_found(method, url)
+        await asyncio.sleep(self.cassette.delay(item))
+        return self.cassette.response(item, url)
+
+    async def call(self, func, *args, **kwargs):
+        """Run a row function replaying it until all its requests were
+        answered, returning its (err, msg) result."""
+        responses = []
+        while True:
+            try:
+                return func(*args, session=ReplaySession(responses,
+                                                         self.headers),
+                            **kwargs)
+            except PendingRequest as pending:
+                responses.append(await self.request(pending.method,
+                                                    pending.url,
+                                                    **pending.kwargs))
+
+    async def create_lun(self, fileline):
+        return await self.call(create_lun, fileline, self.zfsurl, self.zauth,
+                               self.timeout, self.verify)
+
+    async def list_lun(self, fileline):
+        return await self.call(list_lun, fileline, self.zfsurl, self.zauth,
+                               self.timeout, self.verify)
+
+    async def delete_lun(self, fileline):
+        return await self.call(delete_lun, fileline, self.zfsurl, self.zauth,
+                               self.timeout, self.verify)
+
+    async def create_snap(self, snap):
+        return await self.call(create_snap, snap, self.zfsurl, self.zauth,
+                               self.timeout, self.verify)
+
+    async def create_filesystems(self, fileline):
+        return await self.call(create_filesystems, fileline, self.zfsurl,
+                               self.zauth, self.timeout, self.verify)
+
+    async def create_project(self, fileline):
+        return await self.call(create_project, fileline, self.zfsurl,
+                               self.zauth, self.timeout, self.verify)
+
+    async def update_component(self, component_type, fullurl, data,
+                               **kwargs):
+        return await self.call(update_component, component_type, fullurl,
+                               self.zauth, self.timeout, data, self.verify,
+                               **kwargs)
+
+
+async def _run_entries(client, func, entries, callback):
+    async def run_one(index, entry):
+        try:
+            err, msg = await client.call(func, entry, client.zfsurl,
+                                         client.zauth, client.timeout,
+                                         client.verify)
+        except Exception as error:
+            err, msg = True, msgdeco('FAIL', 'RUN', "entry {} - Error \"{}\""
+                                     .format(entry, error))
+        callback(index, err, msg)
+
+    async with client:
+        await asyncio.gather(*[run_one(index, entry)
+                               for index, entry in enumerate(entries)])
+
+
+def run_async(func, entries, zfsurl, zauth, timeout, verify, limit, callback,
+              headers=None, bucket=None, breaker=None, cassette=None,
+              deadline=None, retry=None, auth_session=None, stats=None,
+              limiter=None):
+    """Run row function func for every entry with up to limit requests in
+    flight and the rate allowed by bucket, calling callback(index, err, msg)
+    as every entry finishes. Requests fail at once while breaker is open
+    or once deadline stopped the run, are retried as allowed by the retry
+    policy and are recorded or replayed by cassette. An expired session
+    token in headers is renewed through auth_session, the ZfssaSession
+    giving it. Every request sent is recorded in stats. With an adaptive
+    limiter the requests in flight are also bounded by its limit. On
+    KeyboardInterrupt with a deadline the entries still running are
+    cancelled without calling callback."""
+    client = AsyncZfssaClient(zfsurl, zauth, timeout=timeout, verify=verify,
+                              limit=limit, headers=headers, bucket=bucket,
+                              breaker=breaker, cassette=cassette,
+                              deadline=deadline, retry=retry,
+                              auth_session=auth_session, stats=stats,
+                              limiter=limiter)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(_run_entries(client, func, entries, callback))
+    try:
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        if deadline is None:
+            raise
+        deadline.cancel(INTERRUPTED)
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+    finally:
+        loop.close()
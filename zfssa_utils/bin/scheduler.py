@@ -26,6 +26,12 @@ def create_parser():
                         help="progress bar", required=False)
     parser.add_argument("--timeout", type=int, help="connection timeout",
                         required=False, default=100)
+    parser.add_argument("--deadline", type=float,
+                        help=("seconds given to every explorer, so it ends "
+                              "before the next one"), required=False)
+    parser.add_argument("-w", "--workers", type=int, required=False,
+                        default=zfssa_utils.explorer.FLEETWORKERS,
+                        help="appliances explored at once")
     parser.add_argument("-t", "--time", nargs='+',
                         help=("24Hr time where the Job should be launched, "
                               "example: \"18:00\" \"21:00\""),
@@ -44,32 +50,16 @@ def get_zfssalist(directory):
 
 
 def launch_explorers(zfssalist, args):
-    """Launch explorers from a zfsssa list"""
+    """Launch explorers from a zfsssa list, args.workers at once"""
     for zfssa in zfssalist:
-        if args.cert:
-            certfile = zfssa.replace(".yml", ".crt")
-            exists = os.path.exists(certfile)
-            if exists:
-                argsforexplorer = Namespace(server=zfssa,
-                                            subparser_name='EXPLORER',
-                                            progress=args.progress,
-                                            timeout=args.timeout,
-                                            cert=certfile)
-            else:
-                print("No certificate validation for: {}".format(zfssa))
-                argsforexplorer = Namespace(server=zfssa,
-                                            subparser_name='EXPLORER',
-                                            progress=args.progress,
-                                            timeout=args.timeout,
-                                            cert=False)
-        else:
-            argsforexplorer = Namespace(server=zfssa,
-                                        subparser_name='EXPLORER',
-                                        progress=args.progress,
-                                        timeout=args.timeout,
-                                        cert=False)
         print("Explorer for '{}' launched".format(zfssa.split('.')[0]))
-        zfssa_utils.explorer.run_explorer(argsforexplorer)
+    argsforexplorer = Namespace(subparser_name='EXPLORER',
+                                progress=args.progress,
+                                timeout=args.timeout,
+                                deadline=args.deadline,
+                                fleet_workers=args.workers,
+                                cert=args.cert)
+    zfssa_utils.explorer.run_fleet(argsforexplorer, zfssalist)
 
 
 class Namespace:
@@ -2,8 +2,10 @@ import os
 import sys
 from zfssa_utils import __version__
 from zfssa_utils import __file__ as zfssa_utils_file
+from zfssa_utils.cassette import Cassette
 from zfssa_utils.common import create_parser, check_files_exists, pager
-from zfssa_utils.explorer import run_explorer
+from zfssa_utils.connection import use_cassette
+from zfssa_utils.explorer import run_explorer, run_fleet
 from zfssa_utils.projects import run_projects
 from zfssa_utils.luns import run_luns
 from zfssa_utils.snapshots import run_snaps
@@ -39,11 +41,20 @@ def main():
             arglist.append(args.file)
     except Exception:
         pass
+    if args.replay:
+        arglist.append(args.replay)
     msg = check_files_exists(arglist)
     if msg:
         exit(msg)
+    if args.record or args.replay:
+        use_cassette(Cassette(args.record or args.replay,
+                              record=bool(args.record),
+                              latency=args.replay_latency))
     if args.subparser_name == 'EXPLORER':
-        run_explorer(args)
+        if args.fleet:
+            run_fleet(args)
+        else:
+            run_explorer(args)
     elif args.subparser_name == 'PROJECTS':
         run_projects(args)
     elif args.subparser_name == 'LUNS':
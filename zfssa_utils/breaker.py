@@ -0,0 +1,107 @@
+"""Circuit breaker functions
+
+Stop sending requests to an appliance after consecutive connection errors
+or timeouts, failing them at once, and probe it again after a while.
+
+Optional values read from the server config file (YAML):
+
+breaker_failures: int # consecutive errors opening the circuit (default 5,
+                      # 0 disables the breaker)
+breaker_reset: float # seconds before a probe is sent (default 30)
+"""
+from __future__ import print_function
+import sys
+import threading
+import time
+from requests.exceptions import ConnectionError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALFOPEN = 'half-open'
+
+
+class CircuitOpenError(ConnectionError):
+    """Request not sent because the appliance circuit is open."""
+
+
+class CircuitBreaker(object):
+    """Thread safe circuit breaker for one appliance."""
+
+    def __init__(self, name, failures=5, reset=30, logger=None):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.logger = logger
+        self.state = CLOSED
+        self.consecutive = 0
+        self.opened_at = 0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return the breaker described in the server config, None when
+        disabled."""
+        failures = config.get('breaker_failures', 5)
+        if not failures:
+            return None
+        return cls(config['ip'], failures, config.get('breaker_reset', 30))
+
+    def before(self):
+        """Raise CircuitOpenError unless a request can be sent now."""
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            wait = self.opened_at + self.reset - time.time()
+            if self.state == OPEN and wait <= 0:
+                self._set_state(HALFOPEN, "probing")
+            if self.state == HALFOPEN and not self.probing:
+                self.probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(
+                "Circuit open for appliance {} after {} consecutive "
+                "connection errors, next probe in {:.0f}s"
+                .format(self.name, self.consecutive, max(wait, 0)))
+
+    def success(self):
+        """Record a request answered by the appliance."""
+        with self.lock:
+            self.consecutive = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED, "appliance answered")
+
+    def cancel(self):
+        """Forget the probe of a request that failed before reaching the
+        appliance."""
+        with self.lock:
+            self.probing = False
+
+    def failure(self):
+        """Record a connection error or timeout."""
+        with self.lock:
+            self.consecutive += 1
+            if self.state == HALFOPEN or (self.state == CLOSED and
+                                          self.consecutive >= self.failures):
+                self.probing = False
+                self.opened += 1
+                self.opened_at = time.time()
+                self._set_state(OPEN, "{} consecutive connection errors"
+                                .format(self.consecutive))
+
+    def _set_state(self, state, reason):
+        msg = "Circuit {} -> {} for appliance {} ({})".format(
+            self.state, state, self.name, reason)
+        self.state = state
+        if self.logger:
+            self.logger.warning(msg)
+        else:
+            print(msg, file=sys.stderr)
+
+    def summary(self):
+        """Return a list of lines describing the breaker state."""
+        return ["Circuit breaker: {} opened {} failed fast {}"
+                .format(self.state, self.opened, self.rejected)]
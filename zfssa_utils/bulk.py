@@ -0,0 +1,186 @@
+"""Bulk functions
+
+Run a row function (list/create/delete/update) over every csv entry and
+print or log the (err, msg) results.
+"""
+from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
+import six
+from zfssa_utils.common import (createprogress, CreateLogger, CONCURRENCY,
+                                COLORGREEN, COLORRED, RESETCOLOR, msgdeco)
+from zfssa_utils.connection import report_summary
+from zfssa_utils.concurrency import AdaptiveLimiter, ADAPTIVEMAX
+from zfssa_utils.deadline import Deadline, INTERRUPTED, iter_completed
+
+
+class ResultWriter(object):
+    """Print results or log them updating a progress bar, in csv order or as
+    they complete. Only the thread collecting results should use it."""
+
+    def __init__(self, title, logfile, progress, count, ordered=True):
+        self.progress = progress
+        self.ordered = ordered
+        self.pending = {}
+        self.next_index = 0
+        self.done = 0
+        self.seen = set()
+        if progress:
+            self.progbar = createprogress(count)
+            self.logger = CreateLogger(logfile)
+        else:
+            self.progbar = self.logger = None
+            print("#" * 79)
+            print(title)
+            print("#" * 79)
+
+    def write(self, index, err, msg):
+        """Receive the result for entry number index."""
+        self.done += 1
+        self.seen.add(index)
+        if self.progbar:
+            self.progbar.update(self.done)
+        if not self.ordered:
+            self._emit(err, msg)
+            return
+        self.pending[index] = (err, msg)
+        while self.next_index in self.pending:
+            self._emit(*self.pending.pop(self.next_index))
+            self.next_index += 1
+
+    def _emit(self, err, msg):
+        if self.logger:
+            if err:
+                self.logger.warning(msg.replace(COLORRED, "")
+                                    .replace(RESETCOLOR, ""))
+            else:
+                self.logger.info(msg.replace(COLORGREEN, "")
+                                 .replace(RESETCOLOR, ""))
+        else:
+            print(msg)
+            print("=" * 79)
+
+    def missing(self, count):
+        """Return the indexes of the count entries without a result."""
+        return [index for index in range(count) if index not in self.seen]
+
+    def close(self, session, metrics=None):
+        """Finish progress bar and report the session summary."""
+        if self.progbar:
+            self.progbar.finish()
+            report_summary(session, self.logger, metrics)
+            self.logger.shutdown()
+        else:
+            report_summary(session, metrics=metrics)
+
+
+def run_bulk(func, entries, zfsurl, zauth, session, args, title, logfile):
+    """Run func(entry, zfsurl, zauth, timeout, verify, session) for every
+    entry, serially, in a thread pool (--workers), through the asyncio
+    engine (--async) or as one appliance CLI script over SSH (--ssh, lists
+    keep using the REST api). With --adaptive the threads, or the asyncio
+    requests in flight, are bounded by an AIMD limiter on the session.
+    With --deadline the whole run gets that many seconds, the entries not
+    started when time is up or on Ctrl-C are reported as not run. An entry
+    raising an error is reported as failed, the run goes on."""
+    writer = ResultWriter(title, logfile, args.progress, len(entries),
+                          not getattr(args, 'as_completed', False))
+    session.deadline = Deadline(getattr(args, 'deadline', None))
+    if session.breaker is not None:
+        session.breaker.logger = writer.logger
+    try:
+        _run_engine(func, entries, zfsurl, zauth, session, args, writer)
+        writer.close(session, getattr(args, 'metrics', None))
+    finally:
+        session.limiter = None
+        session.deadline = None
+        if session.breaker is not None:
+            session.breaker.logger = None
+
+
+def _run_engine(func, entries, zfsurl, zauth, session, args, writer):
+    """Run func for every entry with the engine chosen in args, writing
+    the results."""
+    timeout = args.timeout
+    verify = args.cert
+    workers = getattr(args, 'workers', 1)
+    deadline = session.deadline
+    if getattr(args, 'adaptive', False):
+        if getattr(args, 'asyncio', False):
+            maximum = getattr(args, 'concurrency', CONCURRENCY)
+        else:
+            if workers <= 1:
+                workers = ADAPTIVEMAX
+            maximum = workers
+        session.limiter = AdaptiveLimiter(initial=min(4, maximum),
+                                          maximum=maximum,
+                                          logger=writer.logger)
+    ssh = getattr(args, 'ssh', False)
+    if ssh:
+        from zfssa_utils.sshbatch import run_ssh, SSHPORT, COMPILERS
+        # lists keep using the REST api
+        ssh = func in COMPILERS
+    if ssh:
+        run_ssh(func, entries, zfsurl, zauth, timeout, writer.write,
+                port=getattr(args, 'ssh_port', SSHPORT), deadline=deadline,
+                accept_host_key=getattr(args, 'ssh_accept_host_key', False))
+    elif getattr(args, 'asyncio', False):
+        if six.PY2:
+            exit("Error: --async needs python 3")
+        from zfssa_utils.aio import run_async
+        headers = dict(session.headers)
+        headers.update(session.auth_headers(timeout))
+        try:
+            run_async(func, entries, zfsurl, zauth, timeout, verify,
+                      getattr(args, 'concurrency', CONCURRENCY), writer.write,
+                      headers=headers, bucket=session.bucket,
+                      breaker=session.breaker, cassette=session.cassette,
+                      deadline=deadline, retry=session.retry,
+                      auth_session=session, stats=session.stats,
+                      limiter=session.limiter)
+        finally:
+            # writes sent by the asyncio engine don't go through the session
+            if session.cache is not None:
+                session.cache.clear()
+        for index in writer.missing(len(entries)):
+            writer.write(index, True, _not_run(entries[index], deadline))
+    elif workers > 1:
+        session.ensure_pool_size(workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for index, entry in enumerate(entries):
+                future = executor.submit(func, entry, zfsurl, zauth, timeout,
+                                         verify, session)
+                futures[future] = index
+            for future in iter_completed(futures, deadline):
+                index = futures[future]
+                if future.cancelled():
+                    err, msg = True, _not_run(entries[index], deadline)
+                elif future.exception() is not None:
+                    err, msg = True, _failed(entries[index],
+                                             future.exception())
+                else:
+                    err, msg = future.result()
+                writer.write(index, err, msg)
+    else:
+        for index, entry in enumerate(entries):
+            if deadline.stopped:
+                err, msg = True, _not_run(entry, deadline)
+            else:
+                try:
+                    err, msg = func(entry, zfsurl, zauth, timeout, verify,
+                                    session)
+                except KeyboardInterrupt:
+                    deadline.cancel(INTERRUPTED)
+                    err, msg = True, _not_run(entry, deadline)
+                except Exception as error:
+                    err, msg = True, _failed(entry, error)
+            writer.write(index, err, msg)
+
+
+def _not_run(entry, deadline):
+    return msgdeco('FAIL', 'RUN', "entry {} {}".format(entry, deadline.skip()))
+
+
+def _failed(entry, error):
+    return msgdeco('FAIL', 'RUN', "entry {} - Error \"{}\""
+                   .format(entry, error))
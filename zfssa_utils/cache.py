@@ -0,0 +1,276 @@
+"""Cache functions
+
+Time based cache for GET responses of endpoints that seldom change, kept in
+memory (LRU) and optionally on disk so scheduled runs can share it. Expired
+entries are revalidated with If-None-Match/If-Modified-Since when the
+appliance sent an ETag or Last-Modified header.
+
+Optional values read from the server config file (YAML):
+
+cache: bool # cache GET responses (default True, --no-cache disables it)
+cache_ttl: dict # seconds by endpoint name, e.g. {users: 600, luns: 30},
+                # 0 disables the endpoint (default TTLS)
+cache_size: int # max responses kept in memory (default 256)
+cache_dir: str # directory to keep responses between runs, as JSON files
+               # (default none)
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from requests.structures import CaseInsensitiveDict
+from zfssa_utils.common import build_response
+from zfssa_utils.metrics import endpoint_name, datatype_name
+
+CACHESIZE = 256
+# Endpoints seldom changed by the bulk subcommands, storage and problems
+# are not cached unless given in cache_ttl. Snapshots are kept for a few
+# seconds so listing many of them doesn't fetch the same filesystem again,
+# creating or deleting one forgets its collection.
+TTLS = {'version': 3600,
+        'cluster': 300,
+        'datalinks': 300,
+        'devices': 300,
+        'interfaces': 300,
+        'routes': 300,
+        'routing': 300,
+        'snapshots': 30,
+        'initiators': 300,
+        'initiator-groups': 300,
+        'targets': 300,
+        'target-groups': 300,
+        'users': 300}
+
+
+class CacheEntry(object):
+    """GET response stored with the time it was received."""
+
+    def __init__(self, url, status, reason, headers, content, stored=None):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.stored = stored or time.time()
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.url, response.status_code, response.reason,
+                   response.headers, response.content)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['url'], data['status'], data['reason'],
+                   data['headers'], base64.b64decode(data['content']),
+                   data['stored'])
+
+    def to_dict(self):
+        """Return the entry as JSON serializable values, the content in
+        base64."""
+        return {'url': self.url, 'status': self.status,
+                'reason': self.reason, 'headers': dict(self.headers),
+                'content': base64.b64encode(self.content).decode('ascii'),
+                'stored': self.stored}
+
+    def response(self):
+        """Return a new requests.Response with the stored content."""
+        return build_response('GET', self.url, self.status, self.reason,
+                              self.headers, self.content)
+
+    def validators(self):
+        """Return the conditional request headers for this entry."""
+        headers = {}
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+
+class MemoryStore(object):
+    """Thread safe LRU store of cache entries by url."""
+
+    def __init__(self, size=CACHESIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.pop(url, None)
+            if entry is not None:
+                self.entries[url] = entry
+            return entry
+
+    def set(self, url, entry):
+        with self.lock:
+            self.entries.pop(url, None)
+            self.entries[url] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, url):
+        with self.lock:
+            self.entries.pop(url, None)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+
+class DiskStore(MemoryStore):
+    """LRU store backed by one JSON file per url and user in directory,
+    accounts of the same appliance don't share their responses. The urls
+    stored by a user are listed in an index file, so finding the entries
+    to forget doesn't read every file."""
+
+    def __init__(self, directory, size=CACHESIZE, user=None):
+        super(DiskStore, self).__init__(size)
+        self.directory = directory
+        self.user = user or ''
+        self.index_lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.index_path = os.path.join(directory, "{}.index".format(
+            hashlib.sha1(self.user.encode('utf-8')).hexdigest()))
+        try:
+            with open(self.index_path) as indexfile:
+                self.index = set(json.load(indexfile))
+        except (IOError, OSError, ValueError, TypeError):
+            self.index = set()
+
+    def _path(self, url):
+        key = u"{}\n{}".format(self.user, url)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, "{}.json".format(name))
+
+    def _write(self, path, data):
+        with open(path + '.tmp', 'w') as output:
+            json.dump(data, output)
+        os.rename(path + '.tmp', path)
+
+    def _update_index(self, add=None, remove=None):
+        with self.index_lock:
+            if add is not None:
+                if add in self.index:
+                    return
+                self.index.add(add)
+            elif remove in self.index:
+                self.index.discard(remove)
+            else:
+                return
+            self._write(self.index_path, sorted(self.index))
+
+    def get(self, url):
+        entry = super(DiskStore, self).get(url)
+        if entry is None:
+            try:
+                with open(self._path(url)) as cachefile:
+                    entry = CacheEntry.from_dict(json.load(cachefile))
+            except (IOError, OSError, ValueError, KeyError, TypeError):
+                return None
+            super(DiskStore, self).set(url, entry)
+        return entry
+
+    def set(self, url, entry):
+        super(DiskStore, self).set(url, entry)
+        self._write(self._path(url), entry.to_dict())
+        self._update_index(add=url)
+
+    def delete(self, url):
+        super(DiskStore, self).delete(url)
+        try:
+            os.remove(self._path(url))
+        except OSError:
+            pass
+        self._update_index(remove=url)
+
+    def keys(self):
+        with self.index_lock:
+            urls = set(self.index)
+        return list(urls | set(super(DiskStore, self).keys()))
+
+
+class ResponseCache(object):
+    """Serve GET responses from store while fresh, revalidate them when
+    expired and forget them when the same path is written."""
+
+    def __init__(self, store=None, ttls=None):
+        self.store = store or MemoryStore()
+        self.ttls = dict(TTLS)
+        self.ttls.update(ttls or {})
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return the cache described in the server config."""
+        size = config.get('cache_size', CACHESIZE)
+        if config.get('cache_dir'):
+            store = DiskStore(config['cache_dir'], size,
+                              config.get('username'))
+        else:
+            store = MemoryStore(size)
+        cache = cls(store, config.get('cache_ttl'))
+        cache.enabled = config.get('cache', True)
+        return cache
+
+    def ttl(self, url):
+        """Return seconds url responses are fresh, by the name of its
+        endpoint's collection (metrics.datatype_name), object names such as
+        a lun called 'version' are never taken for an endpoint."""
+        return self.ttls.get(datatype_name(endpoint_name(url)), 0)
+
+    def _count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, send, url, kwargs):
+        """Return the response for GET url, calling send(url, **kwargs) when
+        there is no fresh entry."""
+        ttl = self.ttl(url)
+        if not self.enabled or ttl <= 0:
+            return send(url, **kwargs)
+        entry = self.store.get(url)
+        if entry is not None and time.time() - entry.stored < ttl:
+            self._count('hits')
+            return entry.response()
+        self._count('misses')
+        if entry is not None and entry.validators():
+            headers = dict(kwargs.get('headers') or {})
+            headers.update(entry.validators())
+            kwargs = dict(kwargs, headers=headers)
+        response = send(url, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self._count('revalidated')
+            entry.stored = time.time()
+            self.store.set(url, entry)
+            return entry.response()
+        if response.status_code == 200:
+            self.store.set(url, CacheEntry.from_response(response))
+        return response
+
+    def invalidate(self, url):
+        """Forget the responses under url and the ones url belongs to."""
+        url = url.rstrip('/') + '/'
+        for key in self.store.keys():
+            path = key.rstrip('/') + '/'
+            if path.startswith(url) or url.startswith(path):
+                self.store.delete(key)
+
+    def clear(self):
+        """Forget every response."""
+        for key in self.store.keys():
+            self.store.delete(key)
+
+    def summary(self):
+        """Return a list of lines describing the cache usage."""
+        return ["Cache: hits {} misses {} revalidated {}"
+                .format(self.hits, self.misses, self.revalidated)]
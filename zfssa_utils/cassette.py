@@ -0,0 +1,239 @@
+"""Cassette functions
+
+Record the requests sent to an appliance, with their responses and timings,
+in a cassette file (JSON) and replay them offline at the recorded speed,
+scaled or with no latency, so explorer and bulk commands can be profiled
+and compared between releases without an appliance.
+
+Requests are matched by method, path, query and body, the appliance address
+is ignored. Identical requests get the recorded responses in order, the last
+one once they run out.
+"""
+from __future__ import print_function, division
+import base64
+import json
+import threading
+import time
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib.parse import urlparse
+
+VERSION = 1
+# headers describing the wire encoding, bodies are kept decoded
+DROPHEADERS = frozenset(['content-encoding', 'content-length',
+                         'transfer-encoding', 'set-cookie'])
+TOKENHEADER = 'x-auth-session'
+
+
+def _key(method, url, body):
+    parsed = urlparse(url)
+    path = parsed.path + ('?' + parsed.query if parsed.query else '')
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    return (method.upper(), path, body or '')
+
+
+def _encode(content):
+    try:
+        return {'body': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'body_base64': base64.b64encode(content).decode()}
+
+
+def _decode(item):
+    if 'body_base64' in item:
+        return base64.b64decode(item['body_base64'])
+    return item['body'].encode('utf-8')
+
+
+class RecordedBody(object):
+    """File like body of a recorded response, as requests reads it."""
+
+    def __init__(self, content, wire):
+        self.content = content
+        self.wire = wire
+        self.pos = 0
+
+    def stream(self, chunk_size=None, decode_content=True):
+        chunk_size = chunk_size or len(self.content) or 1
+        while self.pos < len(self.content):
+            chunk = self.content[self.pos:self.pos + chunk_size]
+            self.pos += len(chunk)
+            yield chunk
+
+    def read(self, amt=None, decode_content=True):
+        end = len(self.content) if amt is None else self.pos + amt
+        chunk = self.content[self.pos:end]
+        self.pos += len(chunk)
+        return chunk
+
+    def tell(self):
+        """Return the recorded wire bytes once the body is read."""
+        if self.pos >= len(self.content):
+            return self.wire
+        return self.wire * self.pos // len(self.content)
+
+    def close(self):
+        pass
+
+
+class Cassette(object):
+    """Thread safe cassette file, recording or replaying. Replayed
+    responses wait their recorded time multiplied by latency (0 answers at
+    once)."""
+
+    def __init__(self, filename, record=False, latency=1.0):
+        self.filename = filename
+        self.recording = record
+        self.latency = latency
+        self.interactions = []
+        self.queues = {}
+        self.replayed = 0
+        self.missing = 0
+        self.saved = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        if not record:
+            self.load()
+
+    def load(self):
+        """Read the interactions of the cassette file."""
+        with open(self.filename) as cassette:
+            data = json.load(cassette)
+        self.interactions = data['interactions']
+        for item in self.interactions:
+            key = _key(item['method'], item['url'], item['request_body'])
+            self.queues.setdefault(key, []).append(item)
+
+    def save(self):
+        """Write the interactions recorded to the cassette file."""
+        with self.lock:
+            if not self.recording or self.saved == len(self.interactions):
+                return
+            data = {'version': VERSION, 'interactions': self.interactions}
+            with open(self.filename, 'w') as cassette:
+                json.dump(data, cassette, indent=1, sort_keys=True)
+            self.saved = len(self.interactions)
+
+    def add(self, method, url, body, status, reason, headers, content, wire,
+            elapsed):
+        """Record one interaction, returning it."""
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        kept = {}
+        for name, value in headers.items():
+            if name.lower() in DROPHEADERS:
+                continue
+            if name.lower() == TOKENHEADER:
+                value = 'recorded'
+            kept[name] = value
+        item = {'method': method.upper(), 'url': url,
+                'request_body': body or '', 'status': status,
+                'reason': reason, 'headers': kept, 'wire': wire,
+                'elapsed': round(elapsed, 6),
+                'offset': round(time.time() - self.started, 6)}
+        item.update(_encode(content))
+        with self.lock:
+            self.interactions.append(item)
+        return item
+
+    def find(self, method, url, body):
+        """Return the next recorded interaction for a request, None when
+        there is none."""
+        with self.lock:
+            queue = self.queues.get(_key(method, url, body))
+            if not queue:
+                self.missing += 1
+                return None
+            self.replayed += 1
+            return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    def delay(self, item):
+        """Return the seconds to wait before answering with item."""
+        return item['elapsed'] * self.latency
+
+    def response(self, item, url, request=None):
+        """Return a requests.Response for a recorded interaction."""
+        response = requests.Response()
+        response.status_code = item['status']
+        response.reason = item['reason']
+        response.headers = CaseInsensitiveDict(item['headers'])
+        response.raw = RecordedBody(_decode(item), item['wire'])
+        response.url = url
+        response.encoding = 'utf-8'
+        response.request = request or requests.Request(item['method'],
+                                                       url).prepare()
+        return response
+
+    def not_found(self, method, url, request=None):
+        """Return the exception of a request missing in the cassette."""
+        return requests.exceptions.ConnectionError(
+            "No response for {} {} in cassette {}"
+            .format(method, url, self.filename), request=request)
+
+    def adapter(self, adapter):
+        """Return the adapter to mount in a session sending through
+        adapter."""
+        if self.recording:
+            return RecordingAdapter(self, adapter)
+        return ReplayAdapter(self)
+
+    def summary(self):
+        """Return a list of lines describing the cassette usage."""
+        if self.recording:
+            return ["Cassette: recorded {} to {}"
+                    .format(len(self.interactions), self.filename)]
+        return ["Cassette: replayed {} missing {} from {}"
+                .format(self.replayed, self.missing, self.filename)]
+
+
+class RecordingAdapter(BaseAdapter):
+    """Send through adapter recording every response read whole."""
+
+    def __init__(self, cassette, adapter):
+        super(RecordingAdapter, self).__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        start = time.time()
+        response = self.adapter.send(request, stream=True, timeout=timeout,
+                                     verify=verify, cert=cert,
+                                     proxies=proxies)
+        content = response.content
+        elapsed = time.time() - start
+        try:
+            wire = response.raw.tell()
+        except AttributeError:
+            wire = len(content)
+        response.close()
+        item = self.cassette.add(request.method, request.url, request.body,
+                                 response.status_code, response.reason,
+                                 response.headers, content, wire, elapsed)
+        return self.cassette.response(item, request.url, request)
+
+    def close(self):
+        self.adapter.close()
+        self.cassette.save()
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answer from the cassette without sending anything."""
+
+    def __init__(self, cassette):
+        super(ReplayAdapter, self).__init__()
+        self.cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        item = self.cassette.find(request.method, request.url, request.body)
+        if item is None:
+            raise self.cassette.not_found(request.method, request.url,
+                                          request)
+        time.sleep(self.cassette.delay(item))
+        return self.cassette.response(item, request.url, request)
+
+    def close(self):
+        pass
@@ -6,10 +6,14 @@ import subprocess
 import csv
 import six
 import requests
+from requests.structures import CaseInsensitiveDict
 from urllib3.exceptions import InsecureRequestWarning
 import yaml
 from colorama import init, Fore
 from progressbar import ProgressBar, AdaptiveETA, Bar, Percentage
+from zfssa_utils.jsondecode import response_json, stream_json
+# response_size lives with the csv columns, still imported from here
+from zfssa_utils.schema import ENDPOINTS, response_size
 if six.PY2:
     import zfssa_utils.argparse_py2_modified as argparse
 else:
@@ -22,6 +26,9 @@ else:
 requests.urllib3.disable_warnings(InsecureRequestWarning)
 
 HEADER = {"Content-Type": "application/json"}
+CONCURRENCY = 64  # max in-flight requests for the asyncio engine
+EXPLORERWORKERS = 4  # explorer threads without --workers
+AUTO = 'auto'
 # TIMEOUT = 100  # seconds
 PROJECTLOGFILE = "projects_output.log"
 LUNLOGFILE = "luns_output.log"
@@ -65,17 +72,6 @@ def read_csv_file(filename):
     return csvlist
 
 
-def response_size(nbytes):
-    """Return size in a human readable format."""
-    suffixes = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
-    i = 0
-    while nbytes >= 1024 and i < len(suffixes)-1:
-        nbytes /= 1024.
-        i += 1
-    f = ('{:.2f}'.format(nbytes)).rstrip('0').rstrip('.')
-    return '{} {}'.format(f, suffixes[i])
-
-
 def exists(data, key):
     """Return a value if does exists or return a hyphen (-) if not."""
     try:
@@ -95,14 +91,44 @@ def check_files_exists(filelist):
     return None
 
 
-def fetch(url, zauth, header, timeout, datatype, verify):
+def fetch_response(url, zauth, header, timeout, verify, session=requests):
+    """Fetch url from zfs api, returning the response with its body read."""
+    req = session.get(url, timeout=timeout, auth=zauth,
+                      verify=verify, headers=header)
+    req.content  # reads the body, releasing the connection
+    return req
+
+
+def fetch(url, zauth, header, timeout, datatype, verify, session=requests):
     """Fetch data from zfs api, returning a tuple (data, datatype)"""
-    req = requests.get(url, timeout=timeout, auth=zauth,
-                       verify=verify, headers=header)
-    data = req.json()
+    req = fetch_response(url, zauth, header, timeout, verify, session)
+    data = response_json(req)
     return data, datatype
 
 
+def fetch_stream(url, zauth, header, timeout, datatype, verify,
+                 session=requests):
+    """Fetch data from zfs api as it arrives, returning a tuple (data,
+    datatype) where collections are iterators over their items."""
+    req = session.get(url, timeout=timeout, auth=zauth,
+                      verify=verify, headers=header, stream=True)
+    return stream_json(req), datatype
+
+
+def build_response(method, url, status, reason, headers, body):
+    """Return a requests.Response from its status, headers and body."""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response._content_consumed = True  # close() has no connection to free
+    response.url = url
+    response.encoding = 'utf-8'
+    response.request = requests.Request(method, url).prepare()
+    return response
+
+
 def createprogress(count):
     """Return progress Bar"""
     widgets = [Percentage(),
@@ -113,6 +139,52 @@ def createprogress(count):
     return pbar
 
 
+def workers_value(value):
+    """Parse --workers of EXPLORER, a number of threads or 'auto'."""
+    if value == AUTO:
+        return value
+    try:
+        workers = int(value)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        raise argparse.ArgumentTypeError("'{}' is not a number of workers "
+                                         "or 'auto'".format(value))
+    return workers
+
+
+def add_engine_arguments(parser):
+    """Add the execution engine arguments shared by bulk subcommands."""
+    parser.add_argument("--async", dest="asyncio", action="store_true",
+                        help="run requests through the asyncio engine "
+                        "(needs aiohttp)", required=False)
+    parser.add_argument("--concurrency", type=int, required=False,
+                        default=CONCURRENCY,
+                        help="max in-flight requests with --async")
+    parser.add_argument("-w", "--workers", type=int, required=False,
+                        default=1, help="threads running csv lines "
+                        "concurrently")
+    parser.add_argument("--adaptive", action="store_true", required=False,
+                        help="adjust requests in flight to the appliance "
+                        "latency and errors (--workers, or --concurrency "
+                        "with --async, is the maximum)")
+    parser.add_argument("--ssh", action="store_true", required=False,
+                        help="send the whole csv file as one appliance CLI "
+                        "script over SSH (needs paramiko)")
+    parser.add_argument("--ssh-port", dest="ssh_port", type=int,
+                        required=False, default=22,
+                        help="appliance SSH port with --ssh")
+    parser.add_argument("--ssh-accept-host-key", dest="ssh_accept_host_key",
+                        action="store_true", required=False,
+                        help="accept appliance host keys not in known_hosts "
+                        "with --ssh (the password is sent to an unverified "
+                        "host)")
+    parser.add_argument("--as-completed", dest="as_completed",
+                        action="store_true", required=False,
+                        help="print results as they complete instead of in "
+                        "csv order")
+
+
 def create_parser():
     """
     Create program arguments parser.
@@ -130,6 +202,25 @@ def create_parser():
                         required=False, default=100)
     parser.add_argument("--cert", type=str, help="use certificate",
                         required=False, default=False)
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                        help="don't use cached responses", required=False)
+    parser.add_argument("--metrics", type=str, required=False,
+                        help="write request metrics by endpoint to this "
+                        "file (JSON)")
+    parser.add_argument("--deadline", type=float, required=False,
+                        help="seconds given to the whole explorer or bulk "
+                        "run, requests left are not sent")
+    cassette_args = parser.add_mutually_exclusive_group()
+    cassette_args.add_argument("--record", type=str, required=False,
+                               help="record requests and responses to this "
+                               "cassette file (JSON)")
+    cassette_args.add_argument("--replay", type=str, required=False,
+                               help="answer requests from this cassette "
+                               "file instead of the appliance")
+    parser.add_argument("--replay-latency", dest="replay_latency",
+                        type=float, required=False, default=1.0,
+                        help="multiply recorded response times when "
+                        "replaying (0 answers at once)")
     parser.add_argument("--doc", action="store_true",
                         help="program documentation", required=False)
 
@@ -137,10 +228,41 @@ def create_parser():
 
     # Explorer arguments
     explorer_args = subparser.add_parser("EXPLORER")
-    explorer_args.add_argument("-s", "--server", type=str, required=True,
-                               help="Server config file (YAML)")
+    servers = explorer_args.add_mutually_exclusive_group(required=True)
+    servers.add_argument("-s", "--server", type=str,
+                         help="Server config file (YAML)")
+    servers.add_argument("--fleet", type=str,
+                         help="directory or glob pattern of server config "
+                         "files (YAML) explored concurrently")
+    explorer_args.add_argument("--fleet-workers", dest="fleet_workers",
+                               type=int, required=False, default=8,
+                               help="appliances explored at once with "
+                               "--fleet")
     explorer_args.add_argument("-p", "--progress", action="store_true",
                                help="progress bar", required=False)
+    explorer_args.add_argument("-w", "--workers", type=workers_value,
+                               required=False,
+                               help="threads collecting endpoints ({} by "
+                               "default), 'auto' sizes them from the "
+                               "appliance latency and errors"
+                               .format(EXPLORERWORKERS))
+    explorer_args.add_argument("--adaptive", action="store_true",
+                               required=False,
+                               help="same as --workers auto, --workers "
+                               "N is then the maximum")
+    explorer_args.add_argument("--stream", action="store_true",
+                               required=False,
+                               help="write csv rows as the items arrive "
+                               "instead of loading whole responses")
+    explorer_args.add_argument("--processes", type=int, required=False,
+                               help="processes decoding and rendering big "
+                               "responses to csv, using more than one core "
+                               "(ignored with --stream)")
+    explorer_args.add_argument("--fan-out", dest="fan_out",
+                               action="store_true", required=False,
+                               help="list the projects, then collect luns "
+                               "and filesystems project by project in "
+                               "parallel, merged in the same csv files")
 
     # Projects arguments
     proj_args = subparser.add_parser("PROJECTS")
@@ -154,6 +276,8 @@ def create_parser():
                            help=("Don't ask for confirmation when deleting "
                                  "Projects"), required=False)
 
+    add_engine_arguments(proj_args)
+
     proj_opers = proj_args.add_mutually_exclusive_group(required=True)
     proj_opers.add_argument("--create", action="store_true",
                             help="Create Projects specified in csv file")
@@ -174,6 +298,8 @@ def create_parser():
                          help=("Don't ask for confirmation when deleting "
                                "Filesystems"), required=False)
 
+    add_engine_arguments(fs_args)
+
     fs_opers = fs_args.add_mutually_exclusive_group(required=True)
     fs_opers.add_argument("--create", action="store_true",
                           help="Create Filesystems specified in csv file")
@@ -194,6 +320,8 @@ def create_parser():
                            help=("Don't ask for confirmation when deleting "
                                  "Luns"), required=False)
 
+    add_engine_arguments(luns_args)
+
     luns_opers = luns_args.add_mutually_exclusive_group(required=True)
     luns_opers.add_argument("--create", action="store_true",
                             help="Create Luns specified in csv file")
@@ -213,6 +341,7 @@ def create_parser():
     snaps_args.add_argument("--noconfirm", action="store_true",
                             help=("Don't ask for confirmation when deleting "
                                   "Snapshots"), required=False)
+    add_engine_arguments(snaps_args)
     snaps_opers = snaps_args.add_mutually_exclusive_group(required=True)
     snaps_opers.add_argument("--create", action="store_true",
                              help="Create Snapshots specified in csv file")
@@ -258,6 +387,8 @@ def create_parser():
                              help=("Don't ask for confirmation when updating a"
                                    "component"), required=False)
 
+    add_engine_arguments(update_args)
+
     parsed_args = parser.parse_args()
     return parsed_args
 
@@ -265,33 +396,8 @@ def create_parser():
 def urls_constructor(zfsip):
     """Return full URL list (tuples: url, datatype) from defined IP or
     hostname"""
-    urls_group = [("{}/system/v1/version".format(zfsip), "version"),
-                  ("{}/hardware/v1/cluster".format(zfsip), "cluster"),
-                  ("{}/problem/v1/problems".format(zfsip), "problems"),
-                  ("{}/network/v1/datalinks".format(zfsip), "datalinks"),
-                  ("{}/network/v1/devices".format(zfsip), "devices"),
-                  ("{}/network/v1/interfaces".format(zfsip), "interfaces"),
-                  ("{}/network/v1/routes".format(zfsip), "routes"),
-                  ("{}/network/v1/routing".format(zfsip), "routing"),
-                  ("{}/storage/v1/pools".format(zfsip), "pools"),
-                  ("{}/storage/v1/projects".format(zfsip), "projects"),
-                  ("{}/storage/v1/luns".format(zfsip), "luns"),
-                  ("{}/storage/v1/filesystems".format(zfsip), "filesystems"),
-                  ("{}/san/v1/fc/initiators".format(zfsip), "fc_initiators"),
-                  ("{}/san/v1/fc/initiator-groups".format(zfsip),
-                   "fc_initiator-groups"),
-                  ("{}/san/v1/fc/targets".format(zfsip), "fc_targets"),
-                  ("{}/san/v1/fc/target-groups".format(zfsip),
-                   "fc_target-groups"),
-                  ("{}/san/v1/iscsi/initiators".format(zfsip),
-                   "iscsi_initiators"),
-                  ("{}/san/v1/iscsi/initiator-groups".format(zfsip),
-                   "iscsi_initiator-groups"),
-                  ("{}/san/v1/iscsi/targets".format(zfsip), "iscsi_targets"),
-                  ("{}/san/v1/iscsi/target-groups".format(zfsip),
-                   "iscsi_target-groups"),
-                  ("{}/user/v1/users".format(zfsip), "users")]
-    return urls_group
+    return [(endpoint.url(zfsip), name)
+            for name, endpoint in ENDPOINTS.items()]
 
 
 class CreateLogger(object):
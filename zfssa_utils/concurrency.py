@@ -0,0 +1,205 @@
+"""Concurrency functions
+
+AIMD (additive increase, multiplicative decrease) controller for the number
+of requests in flight against one appliance, a singleflight group making
+concurrent identical calls share one request and a token bucket limiting the
+request rate.
+"""
+from __future__ import division
+import threading
+import time
+from collections import deque
+
+ADAPTIVEMAX = 32  # default max in-flight requests for adaptive runs
+OVERLOAD = (429, 503)
+
+
+def percentile(values, pct):
+    """Return the pct percentile (0-100) of values, None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = int(round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class AdaptiveLimiter(object):
+    """Limit requests in flight, growing the limit by one every round of
+    fast 2xx responses and halving it on timeouts, 429/503 and when the
+    p95 latency rises over tolerance times the best p95 seen."""
+
+    def __init__(self, initial=4, minimum=1, maximum=ADAPTIVEMAX,
+                 backoff=0.5, window=20, tolerance=2.0, logger=None):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.logger = logger
+        self.latencies = deque(maxlen=window)
+        self.baseline = None
+        self.in_flight = 0
+        self.decreases = 0
+        self.start = time.time()
+        self.last_decrease = 0
+        self.history = [(0.0, int(self.limit))]
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """Wait until there is room for one more request."""
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """Take a request slot without waiting, returning whether there was
+        room for it."""
+        with self.cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, status=None):
+        """Release a request slot, status None means timeout or connection
+        error."""
+        with self.cond:
+            self.in_flight -= 1
+            if status is None or status in OVERLOAD:
+                self._decrease("status {}".format(status or "error"))
+            elif 200 <= status < 300:
+                self.latencies.append(latency)
+                p95 = percentile(self.latencies, 95)
+                if len(self.latencies) == self.latencies.maxlen:
+                    if self.baseline is None or p95 < self.baseline:
+                        self.baseline = p95
+                if self.baseline and p95 > self.baseline * self.tolerance:
+                    self._decrease("p95 {:.3f}s".format(p95))
+                else:
+                    self._set_limit(self.limit + 1 / int(self.limit),
+                                    "fast responses")
+            self.cond.notify_all()
+
+    def cancel(self):
+        """Release a request slot that never got an answer to judge, like
+        an interrupted request."""
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def _decrease(self, reason):
+        now = time.time()
+        # one decrease per round trip, the requests already in flight were
+        # sent with the old limit.
+        cooldown = percentile(self.latencies, 95) or 0.1
+        if now - self.last_decrease < cooldown:
+            return
+        self.last_decrease = now
+        self.decreases += 1
+        self.latencies.clear()
+        self._set_limit(self.limit * self.backoff, reason)
+
+    def _set_limit(self, limit, reason):
+        previous = int(self.limit)
+        self.limit = min(max(limit, self.minimum), self.maximum)
+        if int(self.limit) != previous:
+            elapsed = time.time() - self.start
+            self.history.append((elapsed, int(self.limit)))
+            if self.logger:
+                self.logger.info("Concurrency {} -> {} at {:.1f}s ({})"
+                                 .format(previous, int(self.limit), elapsed,
+                                         reason))
+
+    def summary(self):
+        """Return a list of lines describing the concurrency used."""
+        limits = [limit for _, limit in self.history]
+        timeline = ", ".join("{:.1f}s={}".format(elapsed, limit)
+                             for elapsed, limit in self.history[-20:])
+        return ["Concurrency: initial {} min {} max {} final {} "
+                "decreases {}".format(limits[0], min(limits), max(limits),
+                                      limits[-1], self.decreases),
+                "Concurrency timeline: {}".format(timeline)]
+
+
+class _Call(object):
+    """One request in flight and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run func once for concurrent callers with the same key, the others
+    wait and get the same result (or exception)."""
+
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return (result, leader) where leader is False when the result
+        was shared from another caller."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+        try:
+            call.result = func()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, True
+
+
+class TokenBucket(object):
+    """Thread safe rate limit of rate requests per second with bursts of up
+    to burst requests."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.requests = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning the seconds to wait before sending."""
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            self.requests += 1
+            delay = max(0.0, -self.tokens / self.rate)
+            self.waited += delay
+            return delay
+
+    def acquire(self):
+        """Wait until a request can be sent."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def summary(self):
+        """Return a list of lines describing the waits done."""
+        return ["Rate limit: {:g} rps burst {} requests {} waited {:.1f}s"
+                .format(self.rate, self.burst, self.requests, self.waited)]
@@ -0,0 +1,611 @@
+"""Connection functions
+
+Keep-alive HTTPS sessions shared by every call made to the same appliance.
+
+Optional values read from the server config file (YAML):
+
+pool_size: int # max connections kept open to the appliance (default 10)
+headers: dict # extra headers sent with every request
+token_auth: bool # login once and send the X-Auth-Session token instead of
+                 # basic auth on every request (default False)
+compression: bool # ask for gzip/deflate responses (default True)
+http2: bool # send through httpx negotiating HTTP/2, HTTP/1.1 when the
+            # appliance doesn't offer it (default False)
+rate_limit: float # max requests per second to the appliance, shared by
+                  # every session and thread of the process (default none)
+rate_burst: int # requests sent at once before rate_limit applies (default
+                # rate_limit)
+
+Response cache values are described in zfssa_utils.cache and circuit
+breaker values in zfssa_utils.breaker.
+"""
+from __future__ import print_function
+import atexit
+import hashlib
+import sys
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.exceptions import InsecureRequestWarning
+from zfssa_utils.breaker import CircuitBreaker, CircuitOpenError
+from zfssa_utils.cache import ResponseCache
+from zfssa_utils.common import HEADER, build_response
+from zfssa_utils.concurrency import SingleFlight, TokenBucket
+from zfssa_utils.deadline import DeadlineExceeded
+from zfssa_utils.http2 import Http2Adapter
+from zfssa_utils.metrics import RequestStats
+from zfssa_utils.retries import RetryPolicy
+
+# to disable warning
+# InsecureRequestWarning: Unverified HTTPS request is being made.
+# Adding certificate verification is strongly advised. See:
+# https://urllib3.readthedocs.io/en/latest/advanced-usage.html#ssl-warnings
+requests.urllib3.disable_warnings(InsecureRequestWarning)
+
+POOLSIZE = 10
+TOKENHEADER = "X-Auth-Session"
+
+_SESSIONS = {}
+_BUCKETS = {}
+_BREAKERS = {}
+_CASSETTE = None
+_SESSIONS_LOCK = threading.Lock()
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter keeping track of the connection pools used to send."""
+
+    def __init__(self, *args, **kwargs):
+        self.used_pools = set()
+        super(CountingAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        response = super(CountingAdapter, self).send(request, **kwargs)
+        pool = getattr(response.raw, '_pool', None)
+        if pool is not None:
+            self.used_pools.add(pool)
+        return response
+
+    def share_stats(self, adapter):
+        """Keep counting on the pools of the adapter replaced."""
+        self.used_pools = adapter.used_pools
+
+    def connection_stats(self):
+        """Return a dict with requests sent, connections opened and reused."""
+        pools = list(self.used_pools)
+        sent = sum(pool.num_requests for pool in pools)
+        opened = sum(pool.num_connections for pool in pools)
+        return {'requests': sent, 'opened': opened,
+                'reused': max(sent - opened, 0)}
+
+
+class _NoAuth(AuthBase):
+    """Send no credentials, the session token header is used instead."""
+
+    def __call__(self, request):
+        return request
+
+
+class _TokenState(object):
+    """Session token of an appliance session, shared by its run sessions."""
+
+    def __init__(self):
+        self.url = None
+        self.token = None
+        self.logins = 0
+        self.lock = threading.Lock()
+
+
+class ZfssaSession(requests.Session):
+    """Keep-alive session for one appliance."""
+
+    def __init__(self, zauth=None, verify=False, headers=None,
+                 pool_size=POOLSIZE, cache=None, compression=True,
+                 http2=False, cassette=None):
+        super(ZfssaSession, self).__init__()
+        self.auth = zauth
+        self.verify = verify
+        self.headers.update(HEADER)
+        if compression:
+            self.headers['Accept-Encoding'] = 'gzip, deflate'
+        else:
+            self.headers['Accept-Encoding'] = 'identity'
+        if headers:
+            self.headers.update(headers)
+        self.limiter = None
+        self.bucket = None
+        self.breaker = None
+        self.deadline = None
+        self.retry = RetryPolicy()
+        self.cache = cache
+        self.inflight = SingleFlight()
+        self.stats = RequestStats()
+        self.use_cache = True
+        self.tokens = _TokenState()
+        self.parent = None
+        self.http2 = http2
+        self.cassette = cassette
+        self.pool_size = pool_size
+        self._mount(self._adapter(pool_size))
+
+    @property
+    def token(self):
+        return self.tokens.token
+
+    @token.setter
+    def token(self, token):
+        self.tokens.token = token
+
+    @property
+    def token_url(self):
+        return self.tokens.url
+
+    @token_url.setter
+    def token_url(self, url):
+        self.tokens.url = url
+
+    def for_run(self):
+        """Return a session for one run sending through the connections of
+        this one and sharing its cache, session token and GETs in flight,
+        with its own retry policy, stats, limiter and deadline. Closing it
+        leaves this session open."""
+        run = object.__new__(type(self))
+        run.__dict__.update(self.__dict__)
+        run.parent = self.parent or self
+        run.retry = RetryPolicy()
+        run.stats = RequestStats()
+        run.limiter = None
+        run.deadline = None
+        return run
+
+    def _adapter(self, size):
+        if self.http2:
+            return Http2Adapter(size)
+        return CountingAdapter(pool_connections=size, pool_maxsize=size)
+
+    def _mount(self, adapter):
+        """Send through adapter, or through the cassette recording or
+        replaying when there is one."""
+        self.adapter = adapter
+        if self.cassette is not None:
+            adapter = self.cassette.adapter(adapter)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def ensure_pool_size(self, size):
+        """Grow the connection pool so size threads can keep their
+        connections open. The adapter replaced is closed, connections in
+        use are closed once their response is read."""
+        if self.parent is not None:
+            self.parent.ensure_pool_size(size)
+            self.adapter = self.parent.adapter
+            self.pool_size = self.parent.pool_size
+            return
+        if size <= self.pool_size:
+            return
+        replaced = self.adapter
+        adapter = self._adapter(size)
+        adapter.share_stats(replaced)
+        self.pool_size = size
+        self._mount(adapter)
+        replaced.close()
+
+    def request(self, method, url, *args, **kwargs):
+        """Send request, GET responses come from the cache when there is
+        one and writes forget the cached responses of their path, runs
+        without use_cache still forget them. Streamed responses are never
+        cached nor shared."""
+        if method.upper() in ('GET', 'HEAD'):
+            if args or kwargs.get('stream') or method.upper() == 'HEAD':
+                return self._retried(method, url, *args, **kwargs)
+            if self.cache is not None and self.use_cache:
+                return self.cache.get(self._get, url, kwargs)
+            return self._get(url, **kwargs)
+        try:
+            return self._retried(method, url, *args, **kwargs)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
+
+    def _get(self, url, **kwargs):
+        """Send GET url once for all the threads asking for it at the same
+        time, every thread gets its own copy of the response."""
+        key = (url, tuple(sorted((kwargs.get('headers') or {}).items())))
+
+        def send():
+            response = self._retried('GET', url, **kwargs)
+            response.content  # read the body before sharing it
+            return response
+
+        response, leader = self.inflight.do(key, send)
+        if leader:
+            return response
+        return build_response('GET', response.url, response.status_code,
+                              response.reason, response.headers,
+                              response.content)
+
+    def _retried(self, method, url, *args, **kwargs):
+        """Send request retrying failures allowed by the retry policy.
+
+        POST requests are only retried when a GET for the named object
+        confirms it was not created, if it was, the GET response is
+        returned instead. DELETE requests are only retried while a GET
+        finds the object, a 404 means it was deleted and a 204 response is
+        returned. PUT requests are not retried after a read timeout, the
+        appliance may have applied them."""
+        attempt = 0
+        while True:
+            error = response = None
+            try:
+                response = self._send(method, url, *args, **kwargs)
+            except (CircuitOpenError, DeadlineExceeded):
+                raise
+            except self.retry.exceptions as exc:
+                error = exc
+            if error is None and not self.retry.retryable(
+                    response.status_code):
+                return response
+            if attempt < self.retry.retries and method.upper() == 'POST':
+                absent, existing = self._confirm_absent(url, kwargs)
+                if existing is not None:
+                    return existing
+                if not absent:
+                    attempt = self.retry.retries
+            elif attempt < self.retry.retries and method.upper() == 'DELETE':
+                present, deleted = self._confirm_present(url, kwargs)
+                if deleted is not None:
+                    return deleted
+                if not present:
+                    attempt = self.retry.retries
+            elif method.upper() == 'PUT' and \
+                    isinstance(error, requests.exceptions.ReadTimeout):
+                attempt = self.retry.retries
+            if not self.retry.allowed(attempt):
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            delay = self.retry.delay(attempt)
+            if self.deadline is not None:
+                delay = self.deadline.cap(delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _confirm_absent(self, url, kwargs):
+        """Look for the object a failed POST tried to create, returning
+        (absent, response) where response is the GET response when the
+        object exists."""
+        try:
+            name = json.loads(kwargs.get('data') or '{}')['name']
+            response = self._send('GET', "{}/{}".format(url.rstrip('/'),
+                                                        name),
+                                  auth=kwargs.get('auth'),
+                                  verify=kwargs.get('verify'),
+                                  headers=kwargs.get('headers'),
+                                  timeout=kwargs.get('timeout'))
+        except (ValueError, KeyError, TypeError,
+                requests.exceptions.RequestException):
+            return False, None
+        if response.status_code == 404:
+            return True, None
+        if response.ok:
+            return False, response
+        return False, None
+
+    def _confirm_present(self, url, kwargs):
+        """Look for the object a failed DELETE tried to remove, returning
+        (present, response) where response is a 204 DELETE response when
+        the object is gone."""
+        try:
+            response = self._send('GET', url, auth=kwargs.get('auth'),
+                                  verify=kwargs.get('verify'),
+                                  headers=kwargs.get('headers'),
+                                  timeout=kwargs.get('timeout'))
+        except requests.exceptions.RequestException:
+            return False, None
+        response.close()
+        if response.status_code == 404:
+            return False, build_response('DELETE', url, 204, 'No Content',
+                                         {}, b'')
+        return response.ok, None
+
+    def enable_token_auth(self, zfsurl):
+        """Use a session token from zfsurl access service instead of basic
+        auth."""
+        self.token_url = "{}/access/v1".format(zfsurl)
+
+    def login(self, expired=None, timeout=None):
+        """Get a new session token unless another thread already replaced
+        the expired one. Falls back to basic auth if no token is given."""
+        with self.tokens.lock:
+            if self.token is not None and self.token != expired:
+                return
+            response = self._dispatch('POST', self.token_url, auth=self.auth,
+                                      timeout=timeout)
+            response.raise_for_status()
+            self.tokens.logins += 1
+            self.token = response.headers.get(TOKENHEADER)
+            if not self.token:
+                self.token_url = None
+
+    def logout(self):
+        """Release the session token on the appliance."""
+        with self.tokens.lock:
+            if self.token_url and self.token:
+                try:
+                    self._dispatch('DELETE', self.token_url, timeout=10,
+                                   auth=_NoAuth(),
+                                   headers={TOKENHEADER: self.token})
+                except requests.exceptions.RequestException:
+                    pass
+            self.token = None
+
+    def auth_headers(self, timeout=None):
+        """Return the token header to send from other clients, empty when
+        using basic auth or when login fails."""
+        try:
+            if self.token_url and self.token is None:
+                self.login(timeout=timeout)
+        except requests.exceptions.RequestException:
+            return {}
+        if self.token_url:
+            return {TOKENHEADER: self.token}
+        return {}
+
+    def close(self):
+        if self.parent is not None:
+            return
+        self.logout()
+        super(ZfssaSession, self).close()
+
+    def _send(self, method, url, *args, **kwargs):
+        """Send one request with the session token when enabled, login
+        again once if the token expired (401)."""
+        if not self.token_url:
+            return self._dispatch(method, url, *args, **kwargs)
+        if self.token is None:
+            self.login(timeout=kwargs.get('timeout'))
+        if not self.token_url:
+            return self._dispatch(method, url, *args, **kwargs)
+        token = self.token
+        kwargs['auth'] = _NoAuth()
+        headers = dict(kwargs.get('headers') or {})
+        headers[TOKENHEADER] = token
+        kwargs['headers'] = headers
+        response = self._dispatch(method, url, *args, **kwargs)
+        if response.status_code == 401:
+            response.close()
+            self.login(expired=token, timeout=kwargs.get('timeout'))
+            headers[TOKENHEADER] = self.token
+            response = self._dispatch(method, url, *args, **kwargs)
+        return response
+
+    def _dispatch(self, method, url, *args, **kwargs):
+        """Send one request, waiting for a slot when there is a limiter, and
+        record its latency, status and bytes. Fails at once while the circuit
+        breaker is open, the timeout shrinks to the run deadline. The limiter
+        slot and the breaker probe are given back whatever stops the
+        request, Ctrl-C included."""
+        if self.deadline is not None:
+            kwargs['timeout'] = self.deadline.timeout(kwargs.get('timeout'))
+        if self.breaker is not None:
+            self.breaker.before()
+        try:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            if self.limiter is not None:
+                self.limiter.acquire()
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.cancel()
+            raise
+        start = time.time()
+        try:
+            response = super(ZfssaSession, self).request(method, url, *args,
+                                                         **kwargs)
+        except requests.exceptions.RequestException as error:
+            latency = time.time() - start
+            stopped = isinstance(error, DeadlineExceeded)
+            if self.limiter is not None:
+                if stopped:
+                    self.limiter.cancel()
+                else:
+                    self.limiter.release(latency)
+            if self.breaker is not None:
+                if not stopped and isinstance(
+                        error, (requests.exceptions.ConnectionError,
+                                requests.exceptions.Timeout)):
+                    self.breaker.failure()
+                else:
+                    self.breaker.cancel()
+            self.stats.record(method, url, None, latency)
+            if self.deadline is not None and self.deadline.stopped and \
+                    isinstance(error, requests.exceptions.Timeout):
+                raise DeadlineExceeded("Request stopped, {}"
+                                       .format(self.deadline.message()))
+            raise
+        except BaseException:
+            if self.limiter is not None:
+                self.limiter.cancel()
+            if self.breaker is not None:
+                self.breaker.cancel()
+            raise
+        latency = time.time() - start
+        if self.breaker is not None:
+            self.breaker.success()
+        if self.limiter is not None:
+            self.limiter.release(latency, response.status_code)
+        self.stats.record(method, url, response.status_code, latency)
+        self._count_bytes(method, url, response, kwargs.get('stream'))
+        return response
+
+    def _count_bytes(self, method, url, response, stream):
+        """Record wire and decoded bytes of response, streamed responses
+        are counted as they are read and recorded when closed."""
+        if not stream:
+            decoded = len(response.content)
+            self.stats.record_bytes(method, url,
+                                    _wire_bytes(response, decoded), decoded)
+            return
+        decoded = [0]
+        iter_content = response.iter_content
+        close = response.close
+
+        def counted_iter_content(chunk_size=1, decode_unicode=False):
+            for chunk in iter_content(chunk_size, decode_unicode):
+                decoded[0] += len(chunk)
+                yield chunk
+
+        def counted_close():
+            if decoded:
+                self.stats.record_bytes(method, url,
+                                        _wire_bytes(response, decoded[0]),
+                                        decoded[0])
+                del decoded[:]
+            close()
+
+        response.iter_content = counted_iter_content
+        response.close = counted_close
+
+    def connection_stats(self):
+        """Return a dict with requests sent, connections opened and reused."""
+        return self.adapter.connection_stats()
+
+    def summary(self):
+        """Return a list of lines describing the session usage."""
+        stats = self.connection_stats()
+        lines = ["Connections: requests {} opened {} reused {}"
+                 .format(stats['requests'], stats['opened'], stats['reused'])]
+        if stats.get('versions'):
+            lines.append("Protocols: {}".format(" ".join(
+                "{} {}".format(version, count) for version, count in
+                sorted(stats['versions'].items()))))
+        if self.limiter:
+            lines.extend(self.limiter.summary())
+        if self.bucket:
+            lines.extend(self.bucket.summary())
+        if self.breaker and (self.breaker.opened or self.breaker.rejected):
+            lines.extend(self.breaker.summary())
+        if self.retry.retries:
+            lines.extend(self.retry.summary())
+        if self.token_url:
+            lines.append("Session token: logins {}"
+                         .format(self.tokens.logins))
+        if self.cache is not None and self.cache.enabled and self.use_cache:
+            lines.extend(self.cache.summary())
+        if self.cassette is not None:
+            lines.extend(self.cassette.summary())
+        if self.deadline is not None:
+            lines.extend(self.deadline.summary())
+        if self.inflight.shared:
+            lines.append("Coalesced: requests {}"
+                         .format(self.inflight.shared))
+        if self.stats.endpoints:
+            lines.extend(self.stats.summary())
+        return lines
+
+
+def _wire_bytes(response, default):
+    """Return the body bytes read from the socket for response."""
+    try:
+        return response.raw.tell()
+    except AttributeError:
+        return default
+
+
+def get_session(config, verify=False, cache=True):
+    """Return a session for one run on the appliance in config, sending
+    through the session shared by the runs with the same credentials
+    (created the first time). Every run gets its own retry budget and
+    request stats, cache False skips the response cache for the run."""
+    credentials = hashlib.sha256(u"{}\n{}".format(
+        config['username'], config['password']).encode('utf-8')).hexdigest()
+    key = (config['ip'], config['username'], credentials, verify)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = ZfssaSession(zauth=(config['username'],
+                                          config['password']),
+                                   verify=verify,
+                                   headers=config.get('headers'),
+                                   pool_size=config.get('pool_size',
+                                                        POOLSIZE),
+                                   cache=ResponseCache.from_config(config),
+                                   compression=config.get('compression',
+                                                          True),
+                                   http2=config.get('http2', False),
+                                   cassette=_CASSETTE)
+            if config.get('token_auth'):
+                session.enable_token_auth("https://{}:215/api"
+                                          .format(config['ip']))
+            _SESSIONS[key] = session
+        run = session.for_run()
+        run.retry = RetryPolicy.from_config(config)
+        run.bucket = _rate_limit(config)
+        run.breaker = _breaker(config)
+        run.use_cache = cache and config.get('cache', True)
+    return run
+
+
+def _rate_limit(config):
+    """Return the token bucket of the appliance in config, None without
+    rate_limit. Call holding _SESSIONS_LOCK."""
+    rate = config.get('rate_limit')
+    if not rate:
+        return None
+    burst = config.get('rate_burst')
+    bucket = _BUCKETS.get(config['ip'])
+    if bucket is None or bucket.rate != rate or (burst and
+                                                  bucket.burst != burst):
+        bucket = _BUCKETS[config['ip']] = TokenBucket(rate, burst)
+    return bucket
+
+
+def _breaker(config):
+    """Return the circuit breaker of the appliance in config, None when
+    disabled. Call holding _SESSIONS_LOCK."""
+    breaker = CircuitBreaker.from_config(config)
+    if breaker is None:
+        return None
+    current = _BREAKERS.get(config['ip'])
+    if current is None or (current.failures, current.reset) != (
+            breaker.failures, breaker.reset):
+        current = _BREAKERS[config['ip']] = breaker
+    return current
+
+
+def use_cassette(cassette):
+    """Record or replay through cassette in the sessions created from now
+    on, None sends to the appliances again."""
+    global _CASSETTE
+    _CASSETTE = cassette
+
+
+def close_sessions():
+    """Close and forget every shared session."""
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+        _BUCKETS.clear()
+        _BREAKERS.clear()
+
+
+atexit.register(close_sessions)
+
+
+def report_summary(session, logger=None, metrics=None, lines=()):
+    """Send session summary lines, then lines, to logger or to stderr (stdout
+    is kept for operation results), and the request stats to metrics file as
+    JSON."""
+    for line in session.summary() + list(lines):
+        if logger:
+            logger.info(line)
+        else:
+            print(line, file=sys.stderr)
+    if metrics:
+        session.stats.write_json(metrics)
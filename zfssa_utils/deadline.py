@@ -0,0 +1,118 @@
+"""Deadline functions
+
+Total time budget of an explorer or bulk run: every request timeout shrinks
+to the time left, requests fail at once once it is spent or the run was
+interrupted (Ctrl-C), and the entries not started yet are cancelled.
+"""
+import threading
+import time
+from concurrent.futures import as_completed, TimeoutError
+from requests.exceptions import ConnectionError
+
+EXPIRED = 'expired'
+INTERRUPTED = 'interrupted'
+
+
+class DeadlineExceeded(ConnectionError):
+    """Request not sent because the run deadline expired or the run was
+    interrupted."""
+
+
+class Deadline(object):
+    """Thread safe time budget of seconds (None for no limit) that can be
+    cancelled."""
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.started = time.time()
+        self.reason = None
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the time budget now, keeping a cancel already made."""
+        self.started = time.time()
+
+    def remaining(self):
+        """Return the seconds left, None without limit."""
+        if self.seconds is None:
+            return None
+        return self.started + self.seconds - time.time()
+
+    @property
+    def stopped(self):
+        """True once the run must stop."""
+        if self.reason is None:
+            remaining = self.remaining()
+            if remaining is not None and remaining <= 0:
+                self.cancel(EXPIRED)
+        return self.reason is not None
+
+    def cancel(self, reason=INTERRUPTED):
+        """Stop the run, keeping the first reason given."""
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+
+    def message(self):
+        """Return why the run stopped."""
+        if self.reason == EXPIRED:
+            return "run deadline of {:g}s exceeded".format(self.seconds)
+        return "run interrupted"
+
+    def timeout(self, timeout):
+        """Return timeout shrunk to the time left, raise DeadlineExceeded
+        once the run must stop."""
+        if self.stopped:
+            raise DeadlineExceeded("Request not sent, {}"
+                                   .format(self.message()))
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if isinstance(timeout, tuple):
+            return tuple(remaining if value is None else min(value,
+                                                             remaining)
+                         for value in timeout)
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def cap(self, seconds):
+        """Return seconds to wait, no longer than the time left."""
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return max(min(seconds, remaining), 0)
+
+    def skip(self):
+        """Count one entry not run, returning its message."""
+        with self.lock:
+            self.skipped += 1
+        return "not run, {}".format(self.message())
+
+    def summary(self):
+        """Return a list of lines describing why the run stopped."""
+        if self.reason is None:
+            return []
+        return ["Run stopped: {} after {:.1f}s, entries not run {}"
+                .format(self.message(), time.time() - self.started,
+                        self.skipped)]
+
+
+def iter_completed(futures, deadline):
+    """Yield futures as they complete until deadline stops the run (time
+    spent or KeyboardInterrupt), then cancel the ones not started and yield
+    every future left, cancelled or finishing."""
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=deadline.remaining()):
+            pending.discard(future)
+            yield future
+    except TimeoutError:
+        deadline.cancel(EXPIRED)
+    except KeyboardInterrupt:
+        deadline.cancel(INTERRUPTED)
+    for future in pending:
+        future.cancel()
+    for future in pending:
+        yield future
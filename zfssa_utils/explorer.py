@@ -2,14 +2,43 @@
 
 Functions to generate ZFSSA explorers.
 """
-import os
+import codecs
+import copy
 import csv
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from zipfile import ZipFile
-from zfssa_utils.common import (exists, response_size, read_yaml_file,
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from zipfile import ZipFile, ZipInfo
+import six
+from requests.exceptions import RequestException
+from six.moves.urllib.parse import quote
+from zfssa_utils import __version__, jsondecode
+from zfssa_utils.common import (response_size, read_yaml_file,
                                 urls_constructor, createprogress, fetch,
-                                HEADER, CreateLogger, EXPLORERLOGFILE)
+                                fetch_response, fetch_stream, HEADER,
+                                CreateLogger, EXPLORERLOGFILE,
+                                EXPLORERWORKERS, AUTO)
+from zfssa_utils.connection import get_session, report_summary
+from zfssa_utils.concurrency import AdaptiveLimiter, ADAPTIVEMAX
+from zfssa_utils.deadline import Deadline, iter_completed
+from zfssa_utils.jsondecode import response_json
+from zfssa_utils.pipeline import Pipeline, Stage, QUEUESIZE
+from zfssa_utils.schema import ENDPOINTS
+
+INCOMPLETEFILE = "incomplete.txt"
+METADATAFILE = "explorer.json"
+FLEETWORKERS = 8
+SPOOLSIZE = 8 * 1024 * 1024
+PROCESSMIN = 256 * 1024  # smaller responses are rendered in the thread
+FANOUT = ('luns', 'filesystems')  # collected project by project
 
 
 def trimpath(outputdir, filename):
@@ -19,528 +48,347 @@ def trimpath(outputdir, filename):
     return os.path.join(zipdir, filename)
 
 
-def create_csv(data, datatype, outputdir):
-    """Create CSV files for data retrieved from zfssa."""
+class ExplorerArchive(object):
+    """Zip file of an explorer run, written instead of directory outputdir.
+    Members are spooled in memory (on disk past SPOOLSIZE bytes) while they
+    are written and copied to the zip once closed, one at a time."""
+
+    def __init__(self, outputdir):
+        self.outputdir = outputdir
+        self.filename = '{}.zip'.format(outputdir)
+        parent = os.path.dirname(outputdir)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        self.zipfile = ZipFile(self.filename, 'w')
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def open(self, filename):
+        """Return a text file for member filename, added when closed."""
+        spooled = SpooledFiles(self)
+        with spooled.open(filename) as output:
+            yield output
+        spooled.add()
+
+    def add(self, arcname, source):
+        """Copy file object source to member arcname."""
+        info = ZipInfo(arcname, time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        with self.lock:
+            if six.PY2:
+                self.zipfile.writestr(info, source.read())
+            else:
+                with self.zipfile.open(info, 'w') as member:
+                    shutil.copyfileobj(source, member)
+
+    def close(self):
+        """Write the zip directory."""
+        with self.lock:
+            self.zipfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SpooledFiles(object):
+    """Files written for an ExplorerArchive, kept spooled until add() copies
+    them to the zip."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.files = []
+
+    @contextmanager
+    def open(self, filename):
+        """Return a text file for filename, spooled when closed."""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOLSIZE)
+        output = spool if six.PY2 else codecs.getwriter('utf-8')(spool)
+        try:
+            yield output
+            output.flush()
+        except Exception:
+            spool.close()
+            raise
+        spool.seek(0)
+        self.files.append((filename, spool))
+
+    def extend(self, files):
+        """Spool files, a list of (filename, bytes) rendered elsewhere."""
+        for filename, data in files:
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOLSIZE)
+            spool.write(data)
+            spool.seek(0)
+            self.files.append((filename, spool))
+
+    def read(self):
+        """Return the files spooled as a list of (filename, bytes)."""
+        files = []
+        for filename, spool in self.files:
+            files.append((filename, spool.read()))
+            spool.close()
+        self.files = []
+        return files
+
+    def add(self):
+        """Copy the files spooled to the archive."""
+        try:
+            for filename, spool in self.files:
+                self.archive.add(trimpath(self.archive.outputdir, filename),
+                                 spool)
+        finally:
+            for _, spool in self.files:
+                spool.close()
+            self.files = []
+
+
+class MergedCsv(object):
+    """Csv file of a datatype collected in parts (--fan-out). The rows of a
+    part are rendered apart then appended under a lock, a part failing
+    leaves no rows behind."""
+
+    def __init__(self, datatype):
+        self.datatype = datatype
+        self.filename = '{}.csv'.format(datatype)
+        self.table = ENDPOINTS[datatype].tables[0]
+        self.parts = 0
+        self.lock = threading.Lock()
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOLSIZE)
+        self.spool.write(self._render([["sep=;"], self.table.headers]))
+
+    def _render(self, rows):
+        spooled = SpooledFiles(None)
+        with spooled.open(self.filename) as output:
+            writer = csv.writer(output, delimiter=';',
+                                quoting=csv.QUOTE_MINIMAL)
+            writer.writerows(rows)
+        return spooled.read()[0][1]
+
+    def write(self, data):
+        """Append the rows of data, the response of one part."""
+        rendered = self._render(self.table.rows(data))
+        with self.lock:
+            self.spool.write(rendered)
+            self.parts += 1
+
+    def add(self, archive):
+        """Copy the merged csv file to archive."""
+        with self.lock:
+            self.spool.seek(0)
+            try:
+                archive.add(trimpath(archive.outputdir, self.filename),
+                            self.spool)
+            finally:
+                self.spool.close()
+
+
+def output_file(outputdir, filename):
+    """Return file filename of an explorer run opened for writing, a member
+    of outputdir when it is an ExplorerArchive or SpooledFiles, else a file
+    in directory outputdir."""
+    if isinstance(outputdir, (ExplorerArchive, SpooledFiles)):
+        return outputdir.open(filename)
     if not os.path.exists(outputdir):
         os.makedirs(outputdir)
-    if datatype == "version":
-        d = data['version']
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(['href', 'nodename', 'mkt_product', 'product',
-                             'version', 'install_time', 'update_time',
-                             'boot_time', 'asn', 'csn', 'part', 'urn',
-                             'navname', 'navagent', 'http', 'ssl',
-                             'ak_version', 'os_version', 'bios_version',
-                             'sp_version'])
-            writer.writerow([d['href'], d['nodename'], d['mkt_product'],
-                             d['product'], d['version'], d['install_time'],
-                             d['update_time'], d['boot_time'], d['asn'],
-                             d['csn'], d['part'], d['urn'], d['navname'],
-                             d['navagent'], d['http'], d['ssl'],
-                             d['ak_version'], d['os_version'],
-                             d['bios_version'], d['sp_version']])
-    elif datatype == "cluster":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["state", "description", "peer_asn",
-                             "peer_hostname", "peer_state",
-                             "peer_description"])
-            writer.writerow([data['cluster']['state'],
-                             data['cluster']['description'],
-                             data['cluster']['peer_asn'],
-                             data['cluster']['peer_hostname'],
-                             data['cluster']['peer_state'],
-                             data['cluster']['peer_description']])
-            writer.writerow(["owner", "type", "user_label", "details", "href"])
-            for r in data['cluster']['resources']:
-                writer.writerow([r['owner'], r['type'], r['user_label'],
-                                 r['details'], r['href']])
-    elif datatype == "problems":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["uuid", "code", "diagnosed", "phoned_home",
-                             "severity", "type", "url", "description",
-                             "impact", "response", "action", "href"])
-            for d in data['problems']:
-                writer.writerow([d['uuid'], d['code'], d['diagnosed'],
-                                 d['phoned_home'], d['severity'], d['type'],
-                                 d['url'], d['description'], d['impact'],
-                                 d['response'], d['action'], d['href']])
-    elif datatype == "datalinks":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(['class', 'label', 'mac', 'links', 'pkey',
-                             'linkmode', 'mtu', 'id', 'speed', 'duplex',
-                             'datalink', 'href'])
-            for d in data['datalinks']:
-                writer.writerow([d['class'], d['label'], d['mac'], d['links'],
-                                 exists(d, 'pkey'), exists(d, 'linkmode'),
-                                 exists(d, 'mtu'), exists(d, 'id'),
-                                 exists(d, 'speed'), exists(d, 'duplex'),
-                                 d['datalink'], d['href']])
-    elif datatype == "devices":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(['speed', 'up', 'active', 'media', 'factory_mac',
-                             'port', 'guid', 'duplex', 'device', 'href'])
-            for d in data['devices']:
-                writer.writerow([d['speed'], d['up'], d['active'], d['media'],
-                                 d['factory_mac'], exists(d, 'port'),
-                                 exists(d, 'guid'), exists(d, 'duplex'),
-                                 d['device'], d['href']])
-    elif datatype == "interfaces":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(['state', 'curaddrs', 'class', 'label', 'enable',
-                             'admin', 'links', 'v4addrs', 'v4dhcp',
-                             'v4directnets', 'v6addrs', 'v6dhcp',
-                             'v6directnets', 'key', 'standbys', 'interface',
-                             'href'])
-            for d in data['interfaces']:
-                writer.writerow([d['state'], d['curaddrs'], d['class'],
-                                 d['label'], d['enable'], d['admin'],
-                                 d['links'], d['v4addrs'], d['v4dhcp'],
-                                 d['v4directnets'], d['v6addrs'], d['v6dhcp'],
-                                 d['v6directnets'], exists(d, 'key'),
-                                 exists(d, 'standbys'), d['interface'],
-                                 d['href']])
-    elif datatype == "routes":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["status", "family", "destination", "mask", "href",
-                             "interface", "type", "gateway"])
-            for d in data['routes']:
-                writer.writerow([d['status'], d['family'], d['destination'],
-                                 d['mask'], d['href'], d['interface'],
-                                 d['type'], d['gateway']])
-    elif datatype == "routing":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["href", "multihoming"])
-            writer.writerow([data['routing']['href'],
-                             data['routing']['multihoming']])
-    elif datatype == "pools":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(['status', 'profile', 'name', 'usage_available',
-                             'usage_available (Human)',
-                             'usage_usage_snapshots',
-                             'usage_usage_snapshots (Human)', 'usage_used',
-                             'usage_used (Human)', 'usage_compression',
-                             'usage_usage_data', 'usage_usage_data (Human)',
-                             'usage_free', 'usage_free (Human)',
-                             'usage_dedupratio', 'usage_total',
-                             'usage_total (Human)', 'usage_usage_total',
-                             'usage_usage_total (Human)', 'peer', 'href',
-                             'owner', 'asn'])
-            for d in data['pools']:
-                if d['status'] == "exported":
-                    writer.writerow([d['status'], "-", d['name'], "-", "-",
-                                     "-", "-", "-", "-", "-", "-", "-", "-",
-                                     "-", "-", "-", "-", "-", "-", d['peer'],
-                                     exists(d, 'href'), d['owner'], d['asn']])
-                else:
-                    u = d['usage']
-                    writer.writerow([d['status'], d['profile'], d['name'],
-                                     u['available'],
-                                     response_size(u['available']),
-                                     u['usage_snapshots'],
-                                     response_size(u['usage_snapshots']),
-                                     u['used'], response_size(u['used']),
-                                     u['compression'], u['usage_data'],
-                                     response_size(u['usage_data']), u['free'],
-                                     response_size(u['free']), u['dedupratio'],
-                                     u['total'], response_size(u['total']),
-                                     u['usage_total'],
-                                     response_size(u['usage_total']),
-                                     d['peer'], exists(d, 'href'),
-                                     d['owner'], d['asn']])
-    elif datatype == "projects":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(['snapdir', 'default_volblocksize',
-                             'defaultgroupquota', 'logbias', 'creation',
-                             'nodestroy', 'dedup', 'sharenfs', 'href',
-                             'sharesmb', 'default_permissions', 'mountpoint',
-                             'snaplabel', 'id', 'readonly', 'space_data',
-                             'space_data (Human)', 'compression',
-                             'defaultuserquota', 'src_snapdir', 'src_logbias',
-                             'src_dedup', 'src_sharenfs', 'src_sharesmb',
-                             'src_mountpoint', 'src_rrsrc_actions',
-                             'src_compression', 'src_sharetftp',
-                             'src_encryption', 'src_sharedav', 'src_copies',
-                             'src_aclinherit', 'src_shareftp', 'src_readonly',
-                             'src_keychangedate', 'src_secondarycache',
-                             'src_maxblocksize', 'src_exported', 'src_vscan',
-                             'src_reservation', 'src_atime', 'src_recordsize',
-                             'src_checksum', 'src_sharesftp', 'src_nbmand',
-                             'src_aclmode', 'src_rstchown', 'default_sparse',
-                             'encryption', 'aclmode', 'copies', 'aclinherit',
-                             'compressratio', 'shareftp', 'canonical_name',
-                             'recordsize', 'recordsize (Human)',
-                             'keychangedate', 'space_available',
-                             'space_available (Human)', 'secondarycache',
-                             'name', 'space_snapshots',
-                             'space_snapshots (Human)', 'space_unused_res',
-                             'space_unused_res (Human)', 'quota',
-                             'quota (Human)', 'maxblocksize',
-                             'maxblocksize (Human)', 'exported',
-                             'default_volsize', 'default_volsize (Human)',
-                             'vscan', 'reservation', 'reservation (Human)',
-                             'keystatus', 'atime', 'pool', 'default_user',
-                             'space_unused_res_shares',
-                             'space_unused_res_shares (Human)', 'sharetftp',
-                             'checksum', 'space_total', 'space_total (Human)',
-                             'default_group', 'sharesftp', 'rstchown',
-                             'sharedav', 'nbmand'])
-            for d in data['projects']:
-                s = d['source']
-                writer.writerow([d['snapdir'],
-                                 response_size(d['default_volblocksize']),
-                                 d['defaultgroupquota'], d['logbias'],
-                                 d['creation'], d['nodestroy'], d['dedup'],
-                                 d['sharenfs'], d['href'], d['sharesmb'],
-                                 d['default_permissions'], d['mountpoint'],
-                                 d['snaplabel'], d['id'], d['readonly'],
-                                 d['space_data'],
-                                 response_size(d['space_data']),
-                                 d['compression'], d['defaultuserquota'],
-                                 s['snapdir'], s['logbias'], s['dedup'],
-                                 s['sharenfs'], s['sharesmb'], s['mountpoint'],
-                                 exists(s, 'rrsrc_actions'), s['compression'],
-                                 s['sharetftp'], exists(s, 'encryption'),
-                                 s['sharedav'], s['copies'], s['aclinherit'],
-                                 s['shareftp'], s['readonly'],
-                                 s['keychangedate'], s['secondarycache'],
-                                 s['maxblocksize'], s['exported'], s['vscan'],
-                                 s['reservation'], s['atime'], s['recordsize'],
-                                 s['checksum'], s['sharesftp'], s['nbmand'],
-                                 s['aclmode'], s['rstchown'],
-                                 d['default_sparse'], d['encryption'],
-                                 d['aclmode'], d['copies'], d['aclinherit'],
-                                 d['compressratio'], d['shareftp'],
-                                 d['canonical_name'], d['recordsize'],
-                                 response_size(d['recordsize']),
-                                 d['keychangedate'], d['space_available'],
-                                 response_size(d['space_available']),
-                                 d['secondarycache'], d['name'],
-                                 d['space_snapshots'],
-                                 response_size(d['space_snapshots']),
-                                 d['space_unused_res'],
-                                 response_size(d['space_unused_res']),
-                                 d['quota'], response_size(d['quota']),
-                                 d['maxblocksize'],
-                                 response_size(d['maxblocksize']),
-                                 d['exported'], d['default_volsize'],
-                                 response_size(d['default_volsize']),
-                                 d['vscan'], d['reservation'],
-                                 response_size(d['reservation']),
-                                 d['keystatus'], d['atime'], d['pool'],
-                                 d['default_user'],
-                                 d['space_unused_res_shares'],
-                                 response_size(d['space_unused_res_shares']),
-                                 d['sharetftp'], d['checksum'],
-                                 d['space_total'],
-                                 response_size(d['space_total']),
-                                 d['default_group'], d['sharesftp'],
-                                 d['rstchown'], d['sharedav'], d['nbmand']])
-    elif datatype == "luns":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["logbias", "creation", "nodestroy",
-                             "assignednumber", "copies", "href", "fixednumber",
-                             "space_data", "space_data (Human)", "id",
-                             "writecache", "compression", "encryption",
-                             "dedup", "snaplabel", "compressratio",
-                             "src_compression", "src_encryption",
-                             "src_logbias", "src_dedup", "src_copies",
-                             "src_maxblocksize", "src_exported",
-                             "src_checksum", "src_keychangedate",
-                             "src_rrsrc_actions", "src_secondarycache",
-                             "space_total", "space_total (Human)", "lunumber",
-                             "keychangedate", "space_available",
-                             "space_available (Human)", "secondary_cache",
-                             "status", "space_snapshots",
-                             "space_snapshots (Human)", "lunguid",
-                             "maxblocksize", "maxblocksize (Human)",
-                             "exported", "initiatorgroup", "volsize",
-                             "volsize (Human)", "keystatus", "pool",
-                             "volblocksize", "volblocksize (Human)",
-                             "writelimit", "name", "checksum",
-                             "canonical_name", "project", "sparse",
-                             "targetgroup", "effectivewritelimit"])
-            for d in data['luns']:
-                s = d['source']
-                writer.writerow([d['logbias'], d['creation'], d['nodestroy'],
-                                 d['assignednumber'], d['copies'], d['href'],
-                                 d['fixednumber'], d['space_data'],
-                                 response_size(d['space_data']), d['id'],
-                                 d['writecache'], d['compression'],
-                                 d['encryption'], d['dedup'], d['snaplabel'],
-                                 d['compressratio'], s['compression'],
-                                 exists(s, 'encryption'), s['logbias'],
-                                 s['dedup'], s['copies'], s['maxblocksize'],
-                                 s['exported'], s['checksum'],
-                                 s['keychangedate'],
-                                 exists(s, 'rrsrc_actions'),
-                                 s['secondarycache'], d['space_total'],
-                                 response_size(d['space_total']),
-                                 d['lunumber'], d['keychangedate'],
-                                 d['space_available'],
-                                 response_size(d['space_available']),
-                                 d['secondarycache'], d['status'],
-                                 d['space_snapshots'],
-                                 response_size(d['space_snapshots']),
-                                 d['lunguid'], d['maxblocksize'],
-                                 response_size(d['maxblocksize']),
-                                 d['exported'], d['initiatorgroup'],
-                                 d['volsize'], response_size(d['volsize']),
-                                 d['keystatus'], d['pool'], d['volblocksize'],
-                                 response_size(d['volblocksize']),
-                                 exists(d, 'writelimit'), d['name'],
-                                 d['checksum'], d['canonical_name'],
-                                 d['project'], d['sparse'], d['targetgroup'],
-                                 exists(d, 'effectivewritelimit')])
-    elif datatype == "filesystems":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["snapdir", "logbias", "creation", "nodestroy",
-                             "dedup", "sharenfs", "sharesmb_abe", "sharesmb",
-                             "root_acl", "mountpoint", "casesensitivity",
-                             "snaplabel", "id", "readonly", "sharesmb_name",
-                             "space_data", "space_data (Human)", "compression",
-                             "sharetftp", "src_snapdir", "src_logbias",
-                             "src_dedup", "src_sharenfs", "src_sharesmb",
-                             "src_mountpoint", "src_rrsrc_actions",
-                             "src_compression", "src_sharetftp",
-                             "src_encryption", "src_sharedav", "src_copies",
-                             "src_aclinherit", "src_shareftp", "src_readonly",
-                             "src_keychangedate", "src_secondarycache",
-                             "src_maxblocksize", "src_exported", "src_vscan",
-                             "src_reservation", "src_atime", "src_recordsize",
-                             "src_checksum", "src_sharesftp", "src_nbmand",
-                             "src_aclmode", "src_rstchown", "encryption",
-                             "aclmode", "copies", "smbshareacl", "aclinherit",
-                             "compressratio", "shareftp", "canonical_name",
-                             "recordsize", "recordsize (Human)",
-                             "keychangedate", "space_available",
-                             "space_available (Human)", "root_group",
-                             "secondarycache", "root_user", "root_permissions",
-                             "shadow", "space_snapshots",
-                             "space_snapshots (Human)", "href",
-                             "space_unused_res", "space_unused_res (Human)",
-                             "quota", "quota (Human)", "utf8only",
-                             "sharesmb_dfsroot", "maxblocksize",
-                             "maxblocksize (Human)", "exported", "vscan",
-                             "reservation", "reservation (Human)", "keystatus",
-                             "atime", "pool", "quota_snap",
-                             "quota_snap (Human)", "space_unused_res_shares",
-                             "name", "checksum", "space_total",
-                             "space_total (Human)", "project", "normalization",
-                             "sharesftp", "rstchown", "reservation_snap",
-                             "reservation_snap (Human)", "sharedav", "nbmand"])
-            for d in data['filesystems']:
-                s = d['source']
-                writer.writerow([d['snapdir'], d['logbias'], d['creation'],
-                                 d['nodestroy'], d['dedup'], d['sharenfs'],
-                                 exists(d, 'sharesmb_abe'), d['sharesmb'],
-                                 exists(d, 'root_acl'), d['mountpoint'],
-                                 d['casesensitivity'], d['snaplabel'], d['id'],
-                                 d['readonly'], exists(d, 'sharesmb_name'),
-                                 d['space_data'],
-                                 response_size(d['space_data']),
-                                 d['compression'], d['sharetftp'],
-                                 s['snapdir'], s['logbias'], s['dedup'],
-                                 s['sharenfs'], s['sharesmb'], s['mountpoint'],
-                                 exists(s, 'rrsrc_actions'), s['compression'],
-                                 s['sharetftp'], exists(s, 'encryption'),
-                                 s['sharedav'], s['copies'], s['aclinherit'],
-                                 s['shareftp'], s['readonly'],
-                                 s['keychangedate'], s['secondarycache'],
-                                 s['maxblocksize'], s['exported'], s['vscan'],
-                                 s['reservation'], s['atime'], s['recordsize'],
-                                 s['checksum'], s['sharesftp'], s['nbmand'],
-                                 s['aclmode'], s['rstchown'], d['encryption'],
-                                 d['aclmode'], d['copies'],
-                                 exists(d, 'smbshareacl'), d['aclinherit'],
-                                 d['compressratio'], d['shareftp'],
-                                 d['canonical_name'], d['recordsize'],
-                                 response_size(d['recordsize']),
-                                 d['keychangedate'], d['space_available'],
-                                 response_size(d['space_available']),
-                                 d['root_group'], d['secondarycache'],
-                                 d['root_user'], d['root_permissions'],
-                                 d['shadow'], d['space_snapshots'],
-                                 response_size(d['space_snapshots']),
-                                 d['href'], d['space_unused_res'],
-                                 response_size(d['space_unused_res']),
-                                 d['quota'], response_size(d['quota']),
-                                 d['utf8only'], exists(d, 'sharesmb_dfsroot'),
-                                 d['maxblocksize'],
-                                 response_size(d['maxblocksize']),
-                                 d['exported'], d['vscan'], d['reservation'],
-                                 response_size(d['reservation']),
-                                 d['keystatus'], d['atime'], d['pool'],
-                                 d['quota_snap'],
-                                 response_size(d['quota_snap']),
-                                 exists(d, 'space_unused_res_shares'),
-                                 d['name'], d['checksum'], d['space_total'],
-                                 response_size(d['space_total']), d['project'],
-                                 d['normalization'], d['sharesftp'],
-                                 d['rstchown'], d['reservation_snap'],
-                                 response_size(d['reservation_snap']),
-                                 d['sharedav'], d['nbmand']])
-    elif datatype == "fc_initiators":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["alias", "initiator", "href"])
-            for d in data['initiators']:
-                writer.writerow([d['alias'], d['initiator'], d['href']])
-    elif datatype == "fc_initiator-groups":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["name", "initiators", "href"])
-            for d in data['groups']:
-                writer.writerow([d['name'], d['initiators'], d['href']])
-    elif datatype == "fc_targets":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["wwn", "port", "mode", "speed",
-                             "discovered_ports", "link_failure_count",
-                             "loss_of_sync_count", "loss_of_signal_count",
-                             "protocol_error_count", "invalid_tx_word_count",
-                             "invalid_crc_count", "href"])
-            for d in data['targets']:
-                writer.writerow([d['wwn'], d['port'], d['mode'], d['speed'],
-                                 d['discovered_ports'],
-                                 d['link_failure_count'],
-                                 d['loss_of_sync_count'],
-                                 d['loss_of_signal_count'],
-                                 d['protocol_error_count'],
-                                 d['invalid_tx_word_count'],
-                                 d['invalid_crc_count'], d['href']])
-    elif datatype == "fc_target-groups":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["name", "targets", "href"])
-            for d in data['groups']:
-                writer.writerow([exists(d, 'name'), exists(d, 'targets'),
-                                 exists(d, 'href')])
-    elif datatype == "iscsi_initiators":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["alias", "initiator", "chapuser", "chapsecret",
-                             "href"])
-            for d in data['initiators']:
-                writer.writerow([exists(d, 'alias'), exists(d, 'initiator'),
-                                 exists(d, 'chapuser'),
-                                 exists(d, 'chapsecret'), exists(d, 'href')])
-    elif datatype == "iscsi_initiator-groups":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["name", "initiators", "href"])
-            for d in data['groups']:
-                writer.writerow([exists(d, 'name'), exists(d, 'initiators'),
-                                 exists(d, 'href')])
-    elif datatype == "iscsi_targets":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["alias", "iqn", "auth", "targetchapuser",
-                             "targetchapsecret", "interfaces", "href"])
-            for d in data['targets']:
-                writer.writerow([exists(d, 'alias'), exists(d, 'iqn'),
-                                 exists(d, 'auth'),
-                                 exists(d, 'targetchapuser'),
-                                 exists(d, 'targetchapsecret'),
-                                 exists(d, 'interfaces'), exists(d, 'href')])
-    elif datatype == "iscsi_target-groups":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["name", "targets", "href"])
-            for d in data['groups']:
-                writer.writerow([exists(d, 'name'), exists(d, 'targets'),
-                                 exists(d, 'href')])
-    elif datatype == "users":
-        with open(os.path.join(outputdir, '{}.csv'.format(datatype)),
-                  'w') as csvfile:
-            writer = csv.writer(csvfile, delimiter=';',
-                                quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["sep=;"])
-            writer.writerow(["logname", "type", "uid", "fullname",
-                             "initial_password", "require_annotation",
-                             "roles", "kiosk_mode", "kiosk_screen", "href"])
-            for d in data['users']:
-                writer.writerow([d['logname'], d['type'], d['uid'],
-                                 d['fullname'], d['initial_password'],
-                                 d['require_annotation'], exists(d, 'roles'),
-                                 exists(d, 'kiosk_mode'),
-                                 exists(d, 'kiosk_screen'), d['href']])
-
-
-def run_explorer(args):
+    return open(os.path.join(outputdir, filename), 'w')
+
+
+def create_csv(data, datatype, outputdir):
+    """Create CSV files for data retrieved from zfssa, in directory outputdir
+    or in an ExplorerArchive. The columns of every datatype are declared in
+    zfssa_utils.schema."""
+    endpoint = ENDPOINTS.get(datatype)
+    if endpoint is None:
+        return
+    with output_file(outputdir, '{}.csv'.format(datatype)) as csvfile:
+        writer = csv.writer(csvfile, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(["sep=;"])
+        endpoint.write(writer, data)
+
+
+def stream_csv(url, zauth, timeout, datatype, verify, outputdir, session):
+    """Fetch url writing the csv rows while the response arrives, returning
+    a tuple (None, datatype)."""
+    data, datatype = fetch_stream(url, zauth, HEADER, timeout, datatype,
+                                  verify, session)
+    create_csv(data, datatype, outputdir)
+    return None, datatype
+
+
+def render_payload(body, datatype):
+    """Decode response body and render its csv file, returning a list of
+    (filename, bytes). Run by the processes of --processes, body is sent
+    as bytes rather than pickled decoded data."""
+    spooled = SpooledFiles(None)
+    create_csv(jsondecode.loads(body), datatype, spooled)
+    return spooled.read()
+
+
+def explorer_stages(archive, zauth, timeout, verify, session, workers,
+                    stream=False, pool=None, processes=1, merged=None):
+    """Return the pipeline stages of an explorer run for (url, datatype)
+    items: fetch on workers threads, decode, render the csv file and add
+    it to archive. With stream, collections are decoded and rendered while
+    they are fetched. With a process pool, responses of PROCESSMIN bytes or
+    more are decoded and rendered by one of its processes. Datatypes in
+    merged, a dict of MergedCsv, are appended to their merged csv file."""
+    merged = merged or {}
+
+    def fetch_item(item):
+        url, datatype = item
+        if stream and datatype in merged:
+            data, _ = fetch_stream(url, zauth, HEADER, timeout, datatype,
+                                   verify, session)
+            merged[datatype].write(data)
+            return SpooledFiles(archive), datatype
+        if stream:
+            spooled = SpooledFiles(archive)
+            stream_csv(url, zauth, timeout, datatype, verify, spooled,
+                       session)
+            return spooled, datatype
+        return fetch_response(url, zauth, HEADER, timeout, verify,
+                              session), datatype
+
+    def decode(item):
+        response, datatype = item
+        return response_json(response), datatype
+
+    def render(item):
+        data, datatype = item
+        spooled = SpooledFiles(archive)
+        if datatype in merged:
+            merged[datatype].write(data)
+        else:
+            create_csv(data, datatype, spooled)
+        return spooled, datatype
+
+    def render_pooled(item):
+        response, datatype = item
+        if datatype in merged or len(response.content) < PROCESSMIN:
+            return render(decode(item))
+        spooled = SpooledFiles(archive)
+        spooled.extend(pool.submit(render_payload, response.content,
+                                   datatype).result())
+        return spooled, datatype
+
+    def store(item):
+        spooled, datatype = item
+        spooled.add()
+        return datatype
+
+    stages = [Stage('fetch', fetch_item, workers, queuesize=0)]
+    if pool is not None and not stream:
+        stages.append(Stage('render', render_pooled, processes,
+                            queuesize=processes * QUEUESIZE))
+    elif not stream:
+        stages += [Stage('decode', decode), Stage('render', render)]
+    return stages + [Stage('archive', store)]
+
+
+def fanout_items(zfsip, zauth, timeout, verify, session):
+    """Return the pipeline items collecting the FANOUT datatypes project by
+    project, ((url, label), (url, datatype)) for every project the
+    appliance lists, and the projects listing."""
+    data, _ = fetch("{}/storage/v1/projects".format(zfsip), zauth, HEADER,
+                    timeout, 'projects', verify, session)
+    items = []
+    for datatype in FANOUT:
+        for project in data['projects']:
+            url = "{}/storage/v1/pools/{}/projects/{}/{}".format(
+                zfsip, quote(project['pool'], safe=''),
+                quote(project['name'], safe=''), datatype)
+            label = "{} {}/{}".format(datatype, project['pool'],
+                                      project['name'])
+            items.append(((url, label), (url, datatype)))
+    return items, data
+
+
+def explorer_items(zfsip, zauth, timeout, verify, session, fanout=False,
+                   logger=None):
+    """Return the pipeline items of an explorer run, ((url, label), (url,
+    datatype)), the datatypes fanned out and a dict of the datatypes
+    already fetched, by datatype. With fanout the FANOUT datatypes are
+    collected project by project, as a whole when the projects can't be
+    listed, and the projects listing is not fetched again."""
+    items = [(item, item) for item in urls_constructor(zfsip)]
+    if not fanout:
+        return items, (), {}
+    try:
+        parts, projects = fanout_items(zfsip, zauth, timeout, verify,
+                                       session)
+    except (RequestException, KeyError, ValueError) as error:
+        msg = "Listing projects failed, collecting {} as a whole: {}" \
+              .format(", ".join(FANOUT), error)
+        _report(logger, msg, msg, warning=True)
+        return items, (), {}
+    return [(key, item) for key, item in items
+            if item[1] not in FANOUT + ('projects',)] + parts, FANOUT, \
+        {'projects': projects}
+
+
+def write_incomplete(outputdir, deadline, missing):
+    """Write the datatypes not collected before the run stopped."""
+    with output_file(outputdir, INCOMPLETEFILE) as incomplete:
+        incomplete.write("Explorer incomplete, {}. Not collected:\n"
+                         .format(deadline.message()))
+        for datatype in sorted(missing):
+            incomplete.write("{}\n".format(datatype))
+
+
+def explorer_workers(args, session, logger=None):
+    """Return the threads of an explorer run. With --workers auto (or
+    --adaptive, --workers N being then the maximum) an AIMD limiter on
+    session sizes the requests in flight from the latency and errors."""
+    workers = getattr(args, 'workers', None)
+    if workers == AUTO or getattr(args, 'adaptive', False):
+        maximum = ADAPTIVEMAX if workers in (None, AUTO) else workers
+        session.limiter = AdaptiveLimiter(initial=min(EXPLORERWORKERS,
+                                                      maximum),
+                                          maximum=maximum, logger=logger)
+        workers = maximum
+    elif workers is None:
+        workers = EXPLORERWORKERS
+    session.ensure_pool_size(workers)
+    return workers
+
+
+def workers_metadata(workers, limiter=None):
+    """Return how the workers of an explorer run were chosen."""
+    if limiter is None:
+        return {'mode': 'fixed', 'workers': workers}
+    limits = [limit for _, limit in limiter.history]
+    return {'mode': AUTO, 'initial': limits[0], 'maximum': limiter.maximum,
+            'peak': max(limits), 'final': limits[-1],
+            'decreases': limiter.decreases,
+            'timeline': [[round(elapsed, 1), limit]
+                         for elapsed, limit in limiter.history]}
+
+
+def write_metadata(outputdir, metadata):
+    """Write the description of the explorer run (JSON)."""
+    data = dict(metadata, version=__version__)
+    with output_file(outputdir, METADATAFILE) as output:
+        json.dump(data, output, indent=1, sort_keys=True)
+
+
+def _report(logger, logged, printed, warning=False):
+    """Send a message to logger, or print its console version."""
+    if logger is None:
+        print(printed)
+    elif warning:
+        logger.warning(logged)
+    else:
+        logger.info(logged)
+
+
+def run_explorer(args, logger=None, deadline=None):
     """Run explorer from given configfile and create a zip file with all csv
-    files generated."""
+    files generated. Return a dict describing the run. Fleet runs give the
+    shared logger (messages are logged, no progress bar) and the deadline to
+    cancel."""
+    started = time.time()
     configfile = args.server
     config = read_yaml_file(configfile)
     zfsip = "https://{}:215/api".format(config['ip'])
@@ -548,59 +396,228 @@ def run_explorer(args):
     outputdir = os.path.join("data", "zfssa_explorer_{}_{}"
                              .format(config['ip'],
                                      datetime.now().strftime("%d%m%y_%H%M%S")))
-    group = urls_constructor(zfsip)
 
     progbar = None
+    fleet = logger is not None
     initial = 0
     timeout = args.timeout
     verify = args.cert
-    if args.progress:
-        progbar = createprogress(len(group))
+    session = get_session(config, verify,
+                          not getattr(args, 'no_cache', False))
+    if deadline is None:
+        deadline = Deadline(getattr(args, 'deadline', None))
+    missing = []
+    failed = []
+    stream = getattr(args, 'stream', False)
+    if args.progress and not fleet:
         logger = CreateLogger(EXPLORERLOGFILE)
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {}
-        for i in group:
-            url = i[0]
-            future = executor.submit(fetch, url, zauth, HEADER,
-                                     timeout, i[1], verify)
-            futures[future] = url
-
-        for future in as_completed(futures):
-            url = futures[future]
-            try:
-                data, datatype = future.result()
-            except Exception as exc:
+    session.deadline = deadline
+    if session.breaker is not None:
+        session.breaker.logger = logger
+    pool = None
+    try:
+        workers = explorer_workers(args, session, logger)
+        items, fanned, fetched = explorer_items(
+            zfsip, zauth, timeout, verify, session,
+            getattr(args, 'fan_out', False), logger)
+        merged = OrderedDict((datatype, MergedCsv(datatype))
+                             for datatype in fanned)
+        if args.progress and not fleet:
+            progbar = createprogress(len(items) + len(fetched))
+        processes = getattr(args, 'processes', None)
+        if processes and not stream:
+            pool = ProcessPoolExecutor(max_workers=processes)
+        with ExplorerArchive(outputdir) as archive:
+            for datatype, data in fetched.items():
+                try:
+                    create_csv(data, datatype, archive)
+                except Exception as error:
+                    failed.append(datatype)
+                    _report(logger, '"{}" - "{}"'.format(datatype, error),
+                            error, warning=True)
+                else:
+                    _report(logger, "Collecting '{}' for '{}'"
+                            .format(datatype, archive.filename),
+                            "++++ Creating csv for {} ++++".format(datatype))
                 if progbar:
-                    msg = '"{}" - "{}"'.format(url, exc)
-                    logger.warning(msg)
                     initial += 1
                     progbar.update(initial)
+            pipeline = Pipeline(explorer_stages(archive, zauth, timeout,
+                                                verify, session, workers,
+                                                stream, pool, processes,
+                                                merged),
+                                deadline)
+            for outcome in pipeline.run(items):
+                url, name = outcome.key
+                if outcome.skipped:
+                    missing.append(name)
+                    msg = "'{}' {}".format(name, deadline.skip())
+                    _report(logger, msg, msg, warning=True)
+                elif outcome.error is not None:
+                    failed.append(name)
+                    if deadline.stopped:
+                        missing.append(name)
+                    _report(logger, '"{}" - "{}"'.format(url, outcome.error),
+                            outcome.error, warning=True)
                 else:
-                    print(exc)
-            else:
+                    _report(logger, "Collecting '{}' for '{}'"
+                            .format(name, archive.filename),
+                            "++++ Creating csv for {} ++++".format(name))
                 if progbar:
-                    create_csv(data, datatype, outputdir)
-                    msg = "Collecting '{}' for '{}'".format(datatype,
-                                                            outputdir)
-                    logger.info(msg)
                     initial += 1
                     progbar.update(initial)
-                else:
-                    print("++++ Creating csv for {} ++++".format(datatype))
-                    create_csv(data, datatype, outputdir)
-        if args.progress:
-            progbar.finish()
-            logger.shutdown()
-        try:
-            with ZipFile('{}.zip'.format(outputdir), 'w') as outzip:
-                for root, _, files in os.walk(outputdir):
-                    for file in files:
-                        outzip.write(os.path.join(root, file),
-                                     trimpath(outputdir, file))
-                        os.remove(os.path.join(root, file))
-        except FileNotFoundError as err:
-            print("Nothing to compress: {}".format(err))
-        try:
-            os.rmdir(outputdir)
-        except FileNotFoundError as err:
-            print("Nothing to remove: {}".format(err))
+            if progbar:
+                progbar.finish()
+            for csvfile in merged.values():
+                csvfile.add(archive)
+            report_summary(session, logger, getattr(args, 'metrics', None),
+                           pipeline.summary())
+            if progbar:
+                logger.shutdown()
+            responses, wire, _ = session.stats.totals()
+            result = {'server': configfile, 'ip': config['ip'],
+                      'started': datetime.fromtimestamp(started).isoformat(),
+                      'duration': time.time() - started, 'requests': responses,
+                      'bytes': wire, 'failed': len(failed),
+                      'missing': len(missing),
+                      'workers': workers_metadata(workers, session.limiter),
+                      'stages': pipeline.stats(),
+                      'fanout': dict((datatype, csvfile.parts)
+                                     for datatype, csvfile in merged.items()),
+                      'zip': archive.filename, 'error': None}
+            write_metadata(archive, result)
+            if deadline.reason is not None:
+                write_incomplete(archive, deadline, missing)
+        result['endpoints'] = session.stats.rows()
+        return result
+    finally:
+        session.limiter = None
+        session.deadline = None
+        if session.breaker is not None:
+            session.breaker.logger = None
+        if pool is not None:
+            pool.shutdown()
+
+
+def fleet_configs(fleet):
+    """Return the server config files (.yml) in directory fleet or matching
+    the glob pattern fleet."""
+    if os.path.isdir(fleet):
+        return sorted(glob.glob(os.path.join(fleet, '*.yml')))
+    return sorted(glob.glob(fleet))
+
+
+def fleet_cert(configfile, cert):
+    """Return the certificate of an appliance: the .crt file named like its
+    config file when there is one, else cert when it is a file."""
+    if not cert:
+        return False
+    certfile = os.path.splitext(configfile)[0] + '.crt'
+    if os.path.exists(certfile):
+        return certfile
+    if isinstance(cert, six.string_types):
+        return cert
+    print("No certificate validation for: {}".format(configfile))
+    return False
+
+
+def fleet_summary(results, elapsed):
+    """Return the lines of the fleet summary, one row by appliance."""
+    errors = sum(1 for result in results
+                 if result['error'] or result.get('failed'))
+    lines = ["Fleet: appliances {} with failures {} in {:.1f}s"
+             .format(len(results), errors, elapsed),
+             "{:28}{:>8}{:>9}{:>11}{:>7}{:>8}  {}"
+             .format("appliance", "secs", "requests", "bytes", "failed",
+                     "missing", "status")]
+    for result in results:
+        if result['error']:
+            status = result['error']
+        elif result['missing']:
+            status = 'incomplete'
+        elif result['failed']:
+            status = 'failures'
+        else:
+            status = 'ok'
+        lines.append("{:28}{:>8.1f}{:>9}{:>11}{:>7}{:>8}  {}".format(
+            result['server'], result.get('duration', 0),
+            result.get('requests', 0),
+            response_size(result.get('bytes', 0)),
+            result.get('failed', 0), result.get('missing', 0), status))
+    return lines
+
+
+def _fleet_run(explorer, args, logger, deadline):
+    started = time.time()
+    # the budget of an appliance starts with its run, not while it waits
+    # behind --fleet-workers
+    deadline.start()
+    try:
+        return explorer(args, logger=logger, deadline=deadline)
+    except (Exception, SystemExit) as error:
+        return {'server': args.server, 'duration': time.time() - started,
+                'error': "error: {}".format(error)}
+
+
+def run_fleet(args, configs=None, explorer=run_explorer):
+    """Run the explorer of every server config file in configs or args.fleet
+    (a directory or a glob pattern), up to args.fleet_workers appliances at
+    once, and report a fleet summary. Every appliance gets its own deadline
+    and zip file, messages go to the explorer log file."""
+    if configs is None:
+        configs = fleet_configs(args.fleet)
+    if not configs:
+        exit("No server config files (.yml) found in {}"
+             .format(getattr(args, 'fleet', None)))
+    workers = min(getattr(args, 'fleet_workers', FLEETWORKERS), len(configs))
+    metrics = getattr(args, 'metrics', None)
+    logger = CreateLogger(EXPLORERLOGFILE)
+    progbar = createprogress(len(configs)) if args.progress else None
+    fleet = Deadline()
+    deadlines = []
+    results = []
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for configfile in configs:
+            runargs = copy.copy(args)
+            runargs.server = configfile
+            runargs.cert = fleet_cert(configfile, args.cert)
+            runargs.progress = False
+            runargs.metrics = None
+            deadline = Deadline(getattr(args, 'deadline', None))
+            deadlines.append(deadline)
+            future = executor.submit(_fleet_run, explorer, runargs, logger,
+                                     deadline)
+            futures[future] = configfile
+        for future in iter_completed(futures, fleet):
+            if fleet.stopped:
+                for deadline in deadlines:
+                    deadline.cancel(fleet.reason)
+            configfile = futures[future]
+            if future.cancelled():
+                result = {'server': configfile, 'error': fleet.skip()}
+            else:
+                result = future.result()
+            results.append(result)
+            msg = "Explorer for '{}' {}".format(
+                configfile, result['error'] or "done in {:.1f}s".format(
+                    result['duration']))
+            _report(logger, msg, msg, warning=bool(result['error']))
+            if progbar:
+                progbar.update(len(results))
+            else:
+                print(msg)
+    if progbar:
+        progbar.finish()
+    results.sort(key=lambda result: configs.index(result['server']))
+    elapsed = time.time() - started
+    for line in fleet_summary(results, elapsed):
+        logger.info(line)
+        print(line)
+    logger.shutdown()
+    if metrics:
+        with open(metrics, 'w') as output:
+            json.dump({'duration': elapsed, 'appliances': results}, output,
+                      indent=1, sort_keys=True)
+    return results
@@ -9,9 +9,10 @@ import requests
 from requests.exceptions import HTTPError, ConnectionError
 from urllib3.exceptions import InsecureRequestWarning
 from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
-                                read_csv_file, createprogress, CreateLogger,
-                                FSLOGFILE, msgdeco, COLORGREEN, COLORRED,
-                                RESETCOLOR)
+                                read_csv_file, FSLOGFILE, msgdeco)
+from zfssa_utils.connection import get_session
+from zfssa_utils.jsondecode import response_json
+from zfssa_utils.bulk import run_bulk
 
 # to disable warning
 # InsecureRequestWarning: Unverified HTTPS request is being made.
@@ -20,7 +21,8 @@ from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
 requests.urllib3.disable_warnings(InsecureRequestWarning)
 
 
-def list_filesystems(fileline, zfsurl, zauth, timeout, verify):
+def list_filesystems(fileline, zfsurl, zauth, timeout, verify,
+                     session=requests):
     """List/Show filesystems from line in csv format. (err, msg)"""
     # print(fileline)
     pool = project = fs = None
@@ -36,9 +38,9 @@ def list_filesystems(fileline, zfsurl, zauth, timeout, verify):
                .format(zfsurl, pool, project, fs))
     # print(fullurl)
     try:
-        req = requests.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
-                           timeout=timeout)
-        j = json.loads(req.text)
+        req = session.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
+                          timeout=timeout)
+        j = response_json(req)
         # print(json.dumps(j))
         req.close()
         req.raise_for_status()
@@ -83,7 +85,8 @@ def list_filesystems(fileline, zfsurl, zauth, timeout, verify):
                              .format(fs, project, pool, error))
 
 
-def create_filesystems(fileline, zfsurl, zauth, timeout, verify):
+def create_filesystems(fileline, zfsurl, zauth, timeout, verify,
+                       session=requests):
     """Create Filesystems from line in csv format. (err, msg)"""
     if len(fileline) != 17:
         return True, msgdeco('FAIL', 'CREATE', "Error in line {} It needs to "
@@ -109,10 +112,10 @@ def create_filesystems(fileline, zfsurl, zauth, timeout, verify):
                 "root_permissions": root_permissions,
                 "sharenfs": sharenfs,
                 "sharesmb": sharesmb}
-        req = requests.post(fullurl, data=json.dumps(data),
-                            auth=zauth, verify=verify, headers=HEADER,
-                            timeout=timeout)
-        j = json.loads(req.text)
+        req = session.post(fullurl, data=json.dumps(data),
+                           auth=zauth, verify=verify, headers=HEADER,
+                           timeout=timeout)
+        j = response_json(req)
         if 'fault' in j:
             if 'message' in j['fault']:
                 return True, msgdeco('FAIL', 'CREATE', "filesystem '{}' "
@@ -137,7 +140,8 @@ def create_filesystems(fileline, zfsurl, zauth, timeout, verify):
                              .format(fs, project, pool, error))
 
 
-def delete_filesystems(fileline, zfsurl, zauth, timeout, verify):
+def delete_filesystems(fileline, zfsurl, zauth, timeout, verify,
+                       session=requests):
     """Delete filesystem from line in csv format. (err, msg)"""
     if len(fileline) != 3:
         return True, msgdeco('FAIL', 'DELETE', "Error in line {} It needs to "
@@ -146,8 +150,8 @@ def delete_filesystems(fileline, zfsurl, zauth, timeout, verify):
     fullurl = ("{}/storage/v1/pools/{}/projects/{}/filesystems/{}"
                .format(zfsurl, pool, project, fs))
     try:
-        req = requests.delete(fullurl, auth=zauth,
-                              verify=verify, headers=HEADER, timeout=timeout)
+        req = session.delete(fullurl, auth=zauth,
+                             verify=verify, headers=HEADER, timeout=timeout)
         req.close()
         req.raise_for_status()
         return False, msgdeco('SUCCESS', 'DELETE', "filesystem '{}' project "
@@ -172,40 +176,17 @@ def run_filesystems(args):
     listfs = args.list
     createfs = args.create
     deletefs = args.delete
-    timeout = args.timeout
     verify = args.cert
     fslistfromfile = read_csv_file(csvfile)
     configfile = args.server
     config = read_yaml_file(configfile)
     zauth = (config['username'], config['password'])
+    session = get_session(config, verify,
+                          not getattr(args, 'no_cache', False))
     zfsurl = "https://{}:215/api".format(config['ip'])
-    initial = 0  # for progressbar
     if createfs:
-        if args.progress:
-            progbar = createprogress(len(fslistfromfile))
-            logger = CreateLogger(FSLOGFILE)
-            for entry in fslistfromfile:
-                err, msg = create_filesystems(entry, zfsurl,
-                                              zauth, timeout,
-                                              verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Creating filesystems")
-            print("#" * 79)
-            for entry in fslistfromfile:
-                print(create_filesystems(entry, zfsurl, zauth,
-                                         timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(create_filesystems, fslistfromfile, zfsurl, zauth,
+                 session, args, "Creating filesystems", FSLOGFILE)
     elif deletefs:
         if not args.noconfirm:
             print("You are about to destroy")
@@ -220,56 +201,8 @@ def run_filesystems(args):
                 pass
             else:
                 exit("Not confirmed, Exiting program")
-        if args.progress:
-            progbar = createprogress(len(fslistfromfile))
-            logger = CreateLogger(FSLOGFILE)
-            for entry in fslistfromfile:
-                err, msg = delete_filesystems(entry, zfsurl,
-                                              zauth, timeout,
-                                              verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Deleting filesystems")
-            print("#" * 79)
-            for entry in fslistfromfile:
-                print(delete_filesystems(entry, zfsurl,
-                                         zauth, timeout,
-                                         verify)[1])
-                print("=" * 79)
+        run_bulk(delete_filesystems, fslistfromfile, zfsurl, zauth,
+                 session, args, "Deleting filesystems", FSLOGFILE)
     elif listfs:
-        if args.progress:
-            progbar = createprogress(len(fslistfromfile))
-            logger = CreateLogger(FSLOGFILE)
-            for entry in fslistfromfile:
-                err, msg = list_filesystems(entry, zfsurl,
-                                            zauth, timeout,
-                                            verify)
-                initial += 1
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Listing filesystems")
-            print("#" * 79)
-            for entry in fslistfromfile:
-                print(list_filesystems(entry, zfsurl,
-                                       zauth, timeout,
-                                       verify)[1])
-                print("=" * 79)
+        run_bulk(list_filesystems, fslistfromfile, zfsurl, zauth,
+                 session, args, "Listing filesystems", FSLOGFILE)
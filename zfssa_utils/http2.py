@@ -0,0 +1,143 @@
+"""HTTP/2 functions
+
+Transport adapter sending the requests of a session through httpx, so
+concurrent requests share one multiplexed TLS connection when the appliance
+negotiates h2 and fall back to HTTP/1.1 keep-alive connections when it
+doesn't (needs httpx installed: pip install httpx[http2]).
+"""
+import ssl
+import threading
+import requests
+import six
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def _timeout(timeout):
+    """Return the httpx timeout of a requests timeout."""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _error(error, request):
+    """Return the requests exception of an httpx exception."""
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(error, request=request)
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(error, request=request)
+    return requests.exceptions.ConnectionError(error, request=request)
+
+
+class _Raw(object):
+    """File like body of a streamed httpx response, as requests reads it."""
+
+    def __init__(self, response, request):
+        self.response = response
+        self.request = request
+
+    def stream(self, chunk_size=None, decode_content=True):
+        try:
+            for chunk in self.response.iter_bytes(chunk_size):
+                yield chunk
+        except httpx.TransportError as error:
+            raise _error(error, self.request)
+
+    def read(self, amt=None, decode_content=True):
+        return b''.join(self.stream(amt))
+
+    def tell(self):
+        """Return the body bytes read from the connection so far."""
+        return self.response.num_bytes_downloaded
+
+    def close(self):
+        self.response.close()
+
+
+class Http2Adapter(BaseAdapter):
+    """requests adapter sending through httpx clients with HTTP/2 enabled,
+    keeping track of connections opened and protocols negotiated."""
+
+    def __init__(self, pool_size=10):
+        if httpx is None:
+            exit("Error: the http2 transport needs httpx installed "
+                 "(pip install httpx[http2])")
+        super(Http2Adapter, self).__init__()
+        self.pool_size = pool_size
+        self.clients = {}
+        self.counters = {'requests': 0, 'opened': 0, 'versions': {}}
+        self.lock = threading.Lock()
+
+    def share_stats(self, adapter):
+        """Keep counting on the counters of the adapter replaced."""
+        self.counters = adapter.counters
+        self.lock = adapter.lock
+
+    def _client(self, verify):
+        key = verify if isinstance(verify, six.string_types) else bool(verify)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                if isinstance(verify, six.string_types):
+                    verify = ssl.create_default_context(cafile=verify)
+                limits = httpx.Limits(max_connections=self.pool_size,
+                                      max_keepalive_connections=self.pool_size)
+                client = self.clients[key] = httpx.Client(
+                    http2=True, verify=verify, limits=limits)
+            return client
+
+    def _trace(self, event, _):
+        if event == 'connection.connect_tcp.complete':
+            with self.lock:
+                self.counters['opened'] += 1
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        client = self._client(verify)
+        try:
+            sent = client.build_request(request.method, request.url,
+                                        headers=dict(request.headers),
+                                        content=request.body,
+                                        timeout=_timeout(timeout),
+                                        extensions={'trace': self._trace})
+            answer = client.send(sent, stream=True)
+        except httpx.TransportError as error:
+            raise _error(error, request)
+        with self.lock:
+            self.counters['requests'] += 1
+            versions = self.counters['versions']
+            versions[answer.http_version] = versions.get(
+                answer.http_version, 0) + 1
+        response = requests.Response()
+        response.status_code = answer.status_code
+        response.reason = answer.reason_phrase
+        response.headers = CaseInsensitiveDict(answer.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _Raw(answer, request)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+        for client in clients:
+            client.close()
+
+    def connection_stats(self):
+        """Return a dict with requests sent, connections opened and reused,
+        and requests by protocol."""
+        with self.lock:
+            sent = self.counters['requests']
+            opened = self.counters['opened']
+            versions = dict(self.counters['versions'])
+        return {'requests': sent, 'opened': opened,
+                'reused': max(sent - opened, 0), 'versions': versions}
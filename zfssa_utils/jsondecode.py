@@ -0,0 +1,108 @@
+"""JSON decoding functions
+
+Decode appliance responses straight from their bytes with the fastest json
+library installed: orjson, ujson or the standard library json, or parse the
+items of collections one by one as the response arrives.
+
+The ZFSSA_JSON environment variable (orjson, ujson or json) selects the
+backend instead.
+"""
+import codecs
+import json
+import os
+import re
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+BACKENDS = OrderedDict([('orjson', orjson and orjson.loads),
+                        ('ujson', ujson and ujson.loads),
+                        ('json', json.loads)])
+
+CHUNKSIZE = 65536
+# collections are objects with a single list, {"luns": [{...}, {...}]}
+_COLLECTION = re.compile(r'\s*\{\s*"([^"\\]+)"\s*:\s*\[')
+_SPACE = re.compile(r'[\s,]*')
+
+backend = None
+loads = None
+
+
+def available():
+    """Return the names of the installed backends, fastest first."""
+    return [name for name, func in BACKENDS.items() if func is not None]
+
+
+def set_backend(name=None):
+    """Decode with backend name, the fastest installed when None."""
+    global backend, loads
+    if name is None:
+        name = available()[0]
+    if BACKENDS.get(name) is None:
+        exit("Error: json backend '{}' is not installed, available: {}"
+             .format(name, ", ".join(available())))
+    backend = name
+    loads = BACKENDS[name]
+
+
+def response_json(response):
+    """Return the decoded body of a requests response."""
+    return loads(response.content)
+
+
+def stream_json(response, chunk_size=CHUNKSIZE):
+    """Return the body of a streamed response. Collections come back as
+    {name: iterator} parsing one item at a time from the stream, any other
+    body is decoded as a whole."""
+    chunks = response.iter_content(chunk_size)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= 1024:
+            break
+    match = _COLLECTION.match(head[:1024].decode('utf-8', 'ignore'))
+    if match is None:
+        body = head + b''.join(chunks)
+        response.close()
+        return loads(body)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = decoder.decode(head)
+    return {match.group(1): _iter_items(response, chunks, decoder,
+                                        buf[match.end():])}
+
+
+def _iter_items(response, chunks, decoder, buf):
+    raw_decode = json.JSONDecoder().raw_decode
+    pos = 0
+    try:
+        while True:
+            pos = _SPACE.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                item, end = raw_decode(buf, pos)
+            except ValueError:
+                end = len(buf)
+            # a value ending the buffer may continue in the next chunk
+            if end < len(buf):
+                yield item
+                pos = end
+                continue
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("Truncated collection in {}"
+                                 .format(response.url))
+            buf = buf[pos:] + decoder.decode(chunk)
+            pos = 0
+    finally:
+        response.close()
+
+
+set_backend(os.environ.get('ZFSSA_JSON'))
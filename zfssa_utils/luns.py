@@ -9,10 +9,11 @@ from six.moves import input
 import requests
 from requests.exceptions import HTTPError, ConnectionError
 from urllib3.exceptions import InsecureRequestWarning
-from zfssa_utils.common import (HEADER, response_size, createprogress,
-                                CreateLogger, read_yaml_file,
-                                read_csv_file, LUNLOGFILE, msgdeco, COLORGREEN,
-                                COLORRED, RESETCOLOR)
+from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
+                                read_csv_file, LUNLOGFILE, msgdeco)
+from zfssa_utils.connection import get_session
+from zfssa_utils.jsondecode import response_json
+from zfssa_utils.bulk import run_bulk
 
 # to disable warning
 # InsecureRequestWarning: Unverified HTTPS request is being made.
@@ -21,7 +22,8 @@ from zfssa_utils.common import (HEADER, response_size, createprogress,
 requests.urllib3.disable_warnings(InsecureRequestWarning)
 
 
-def list_lun(fileline, zfsurl, zauth, timeout, verify):
+def list_lun(fileline, zfsurl, zauth, timeout, verify,
+             session=requests):
     """List/Show lun from line in csv format. (err, msg)"""
     pool = project = lun = None
     if len(fileline) == 3:
@@ -35,9 +37,9 @@ def list_lun(fileline, zfsurl, zauth, timeout, verify):
     fullurl = ("{}/storage/v1/pools/{}/projects/{}/luns/{}"
                .format(zfsurl, pool, project, lun))
     try:
-        req = requests.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
-                           timeout=timeout)
-        j = json.loads(req.text)
+        req = session.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
+                          timeout=timeout)
+        j = response_json(req)
         req.close()
         req.raise_for_status()
         return False, msgdeco('SUCCESS', 'LIST',
@@ -71,7 +73,8 @@ def list_lun(fileline, zfsurl, zauth, timeout, verify):
                              .format(lun, project, pool, error))
 
 
-def create_lun(fileline, zfsurl, zauth, timeout, verify):
+def create_lun(fileline, zfsurl, zauth, timeout, verify,
+               session=requests):
     """Create LUN from line in csv format. (err, msg)"""
     if len(fileline) != 11:
         return True, msgdeco('FAIL', 'CREATE', "Error in line {} It needs to "
@@ -90,10 +93,10 @@ def create_lun(fileline, zfsurl, zauth, timeout, verify):
                 "compression": compression,
                 "logbias": latency,
                 "nodestroy": ast.literal_eval(nodestroy)}
-        req = requests.post(fullurl, data=json.dumps(data),
-                            auth=zauth, verify=verify, headers=HEADER,
-                            timeout=timeout)
-        j = json.loads(req.text)
+        req = session.post(fullurl, data=json.dumps(data),
+                           auth=zauth, verify=verify, headers=HEADER,
+                           timeout=timeout)
+        j = response_json(req)
         if 'fault' in j:
             if 'message' in j['fault']:
                 return True, msgdeco('FAIL', 'CREATE', "lun '{}' project '{}' "
@@ -118,7 +121,8 @@ def create_lun(fileline, zfsurl, zauth, timeout, verify):
                              .format(lun, project, pool, error))
 
 
-def delete_lun(fileline, zfsurl, zauth, timeout, verify):
+def delete_lun(fileline, zfsurl, zauth, timeout, verify,
+               session=requests):
     """Delete lun from line in csv format. (err, msg)"""
     if len(fileline) != 3:
         return True, msgdeco('FAIL', 'DELETE', "Error in line {} It needs to "
@@ -127,8 +131,8 @@ def delete_lun(fileline, zfsurl, zauth, timeout, verify):
     fullurl = ("{}/storage/v1/pools/{}/projects/{}/luns/{}"
                .format(zfsurl, pool, project, lun))
     try:
-        req = requests.delete(fullurl, auth=zauth,
-                              verify=verify, headers=HEADER, timeout=timeout)
+        req = session.delete(fullurl, auth=zauth,
+                             verify=verify, headers=HEADER, timeout=timeout)
         req.close()
         req.raise_for_status()
         return False, msgdeco('SUCCESS', 'DELETE', "lun '{}' project '{}' pool"
@@ -153,37 +157,17 @@ def run_luns(args):
     listlun = args.list
     createlun = args.create
     deletelun = args.delete
-    timeout = args.timeout
     verify = args.cert
     lunlistfromfile = read_csv_file(csvfile)
     configfile = args.server
     config = read_yaml_file(configfile)
     zauth = (config['username'], config['password'])
+    session = get_session(config, verify,
+                          not getattr(args, 'no_cache', False))
     zfsurl = "https://{}:215/api".format(config['ip'])
-    initial = 0
     if createlun:
-        if args.progress:
-            progbar = createprogress(len(lunlistfromfile))
-            logger = CreateLogger(LUNLOGFILE)
-            for entry in lunlistfromfile:
-                err, msg = create_lun(entry, zfsurl, zauth, timeout, verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Creating luns")
-            print("#" * 79)
-            for entry in lunlistfromfile:
-                print(create_lun(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(create_lun, lunlistfromfile, zfsurl, zauth, session, args,
+                 "Creating luns", LUNLOGFILE)
     elif deletelun:
         if not args.noconfirm:
             print("You are about to destroy")
@@ -198,48 +182,8 @@ def run_luns(args):
                 pass
             else:
                 exit("Not confirmed, Exiting program")
-        if args.progress:
-            progbar = createprogress(len(lunlistfromfile))
-            logger = CreateLogger(LUNLOGFILE)
-            for entry in lunlistfromfile:
-                err, msg = delete_lun(entry, zfsurl, zauth, timeout, verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Deleting luns")
-            print("#" * 79)
-            for entry in lunlistfromfile:
-                print(delete_lun(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(delete_lun, lunlistfromfile, zfsurl, zauth, session, args,
+                 "Deleting luns", LUNLOGFILE)
     elif listlun:
-        if args.progress:
-            progbar = createprogress(len(lunlistfromfile))
-            logger = CreateLogger(LUNLOGFILE)
-            for entry in lunlistfromfile:
-                err, msg = list_lun(entry, zfsurl, zauth, timeout, verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Listing luns")
-            print("#" * 79)
-            for entry in lunlistfromfile:
-                print(list_lun(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(list_lun, lunlistfromfile, zfsurl, zauth, session, args,
+                 "Listing luns", LUNLOGFILE)
@@ -0,0 +1,170 @@
+"""Metrics functions
+
+Per endpoint latency, status and byte counters of the requests sent to one
+appliance.
+"""
+from __future__ import division
+import json
+import threading
+from six.moves.urllib.parse import urlparse
+from zfssa_utils.common import response_size
+from zfssa_utils.concurrency import percentile
+
+# collections whose next path segment is an object name
+COLLECTIONS = frozenset(['pools', 'projects', 'luns', 'filesystems',
+                         'snapshots', 'users', 'datalinks', 'devices',
+                         'interfaces', 'routes', 'problems', 'initiators',
+                         'initiator-groups', 'targets', 'target-groups'])
+
+
+def endpoint_name(url):
+    """Return the url path below /api with object names replaced by '*',
+    e.g. storage/v1/pools/*/projects/*/luns/*"""
+    segments = urlparse(url).path.strip('/').split('/')
+    if segments and segments[0] == 'api':
+        segments = segments[1:]
+    names = []
+    for segment in segments:
+        # an object named like a collection doesn't name the next segment
+        if names and names[-1] in COLLECTIONS:
+            segment = '*'
+        names.append(segment)
+    return '/'.join(names)
+
+
+def datatype_name(endpoint):
+    """Return the kind of data of an endpoint, its last collection or its
+    last path segment."""
+    segments = endpoint.split('/')
+    for segment in reversed(segments):
+        if segment in COLLECTIONS:
+            return segment
+    return segments[-1]
+
+
+class _Endpoint(object):
+    """Counters of one method and endpoint."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.responses = 0
+        self.wire = 0
+        self.decoded = 0
+
+
+class RequestStats(object):
+    """Thread safe latencies and statuses of the requests sent, and bytes
+    received as sent on the wire (maybe compressed) and once decoded, by
+    method and endpoint."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def _endpoint(self, method, url):
+        key = (method.upper(), endpoint_name(url))
+        endpoint = self.endpoints.get(key)
+        if endpoint is None:
+            endpoint = self.endpoints[key] = _Endpoint()
+        return endpoint
+
+    def record(self, method, url, status, latency):
+        """Add one request answered with status (None for connection
+        errors and timeouts) after latency seconds."""
+        status = str(status or 'error')
+        with self.lock:
+            endpoint = self._endpoint(method, url)
+            endpoint.latencies.append(latency)
+            endpoint.statuses[status] = endpoint.statuses.get(status, 0) + 1
+
+    def record_bytes(self, method, url, wire, decoded):
+        """Add one response of wire bytes and decoded bytes."""
+        with self.lock:
+            endpoint = self._endpoint(method, url)
+            endpoint.responses += 1
+            endpoint.wire += wire
+            endpoint.decoded += decoded
+
+    def totals(self):
+        """Return (responses, wire, decoded) for every endpoint."""
+        with self.lock:
+            values = list(self.endpoints.values())
+        return (sum(value.responses for value in values),
+                sum(value.wire for value in values),
+                sum(value.decoded for value in values))
+
+    def rows(self):
+        """Return a dict for every method and endpoint, latencies in
+        seconds."""
+        rows = []
+        with self.lock:
+            for (method, name), value in sorted(self.endpoints.items()):
+                latencies = value.latencies
+                rows.append({'method': method, 'endpoint': name,
+                             'datatype': datatype_name(name),
+                             'count': len(latencies),
+                             'responses': value.responses,
+                             'statuses': dict(value.statuses),
+                             'p50': percentile(latencies, 50),
+                             'p95': percentile(latencies, 95),
+                             'p99': percentile(latencies, 99),
+                             'max': max(latencies) if latencies else None,
+                             'wire_bytes': value.wire,
+                             'decoded_bytes': value.decoded})
+        return rows
+
+    def transfer_summary(self):
+        """Return a list of lines with the bytes received, total first."""
+        endpoints = {}
+        for row in self.rows():
+            stats = endpoints.setdefault(row['endpoint'], [0, 0, 0])
+            stats[0] += row['responses']
+            stats[1] += row['wire_bytes']
+            stats[2] += row['decoded_bytes']
+        lines = []
+        rows = [('total', self.totals())] + sorted(endpoints.items())
+        for name, (count, wire, decoded) in rows:
+            if not decoded:
+                continue
+            saved = 100 - wire * 100 / decoded
+            lines.append("Transfer {}: responses {} wire {} decoded {} "
+                         "saved {:.0f}%".format(name, count,
+                                                response_size(wire),
+                                                response_size(decoded),
+                                                saved))
+        return lines
+
+    def latency_summary(self):
+        """Return the lines of a table with count, latency percentiles (ms),
+        bytes and statuses by method and endpoint."""
+        lines = ["{:7}{:42}{:>7}{:>8}{:>8}{:>8}{:>8}{:>11}  {}"
+                 .format("Method", "Endpoint", "Count", "p50", "p95", "p99",
+                         "Max", "Bytes", "Status")]
+        for row in self.rows():
+            latencies = ["{:.0f}".format(row[key] * 1000)
+                         if row[key] is not None else "-"
+                         for key in ('p50', 'p95', 'p99', 'max')]
+            statuses = " ".join("{}:{}".format(status, count) for
+                                status, count in
+                                sorted(row['statuses'].items()))
+            lines.append("{:7}{:42}{:>7}{:>8}{:>8}{:>8}{:>8}{:>11}  {}"
+                         .format(row['method'], row['endpoint'],
+                                 row['count'], latencies[0], latencies[1],
+                                 latencies[2], latencies[3],
+                                 response_size(row['wire_bytes']),
+                                 statuses))
+        return lines
+
+    def summary(self):
+        """Return a list of lines with the transfer and latency summary."""
+        return self.transfer_summary() + self.latency_summary()
+
+    def write_json(self, filename):
+        """Write the rows and totals to filename as JSON."""
+        responses, wire, decoded = self.totals()
+        data = {'endpoints': self.rows(),
+                'totals': {'responses': responses, 'wire_bytes': wire,
+                           'decoded_bytes': decoded}}
+        with open(filename, 'w') as jsonfile:
+            json.dump(data, jsonfile, indent=2, sort_keys=True)
@@ -0,0 +1,173 @@
+"""Pipeline functions
+
+Run items through stages (fetch, decode, render, archive), every stage with
+its own threads reading a bounded queue fed by the stage before it: one item
+downloads while another one renders, and a slow stage holds the stages
+before it instead of piling up their results in memory.
+"""
+from __future__ import division
+import threading
+import time
+from collections import namedtuple
+from six.moves import queue
+from zfssa_utils.deadline import INTERRUPTED
+
+QUEUESIZE = 4
+POLL = 0.2
+_DONE = object()
+
+# what became of an item: the value returned by the last stage, or the error
+# raised and the stage raising it, skipped when the run stopped before
+Outcome = namedtuple('Outcome', 'key value error stage skipped')
+
+
+class Stage(object):
+    """Step of a pipeline running func(value) on threads, counting the
+    depth of its input queue (0 for unbounded) and the time spent in
+    func."""
+
+    def __init__(self, name, func, threads=1, queuesize=QUEUESIZE):
+        self.name = name
+        self.func = func
+        self.threads = threads
+        self.queue = queue.Queue(queuesize)
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.puts = 0
+        self.depth = 0
+        self.depth_max = 0
+        self.lock = threading.Lock()
+
+    def put(self, item):
+        """Queue item, waiting while the queue is full."""
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        with self.lock:
+            self.puts += 1
+            self.depth += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def run(self, value):
+        """Return func(value), counting the time spent and errors."""
+        start = time.time()
+        try:
+            return self.func(value)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            with self.lock:
+                self.items += 1
+                self.busy += time.time() - start
+
+    def stats(self, elapsed):
+        """Return a dict of the stage counters, busy in seconds and use in
+        percent of the time of its threads."""
+        with self.lock:
+            use = 100 * self.busy / (elapsed * self.threads) \
+                if elapsed else 0
+            return {'stage': self.name, 'threads': self.threads,
+                    'items': self.items, 'errors': self.errors,
+                    'busy': round(self.busy, 3), 'use': round(use, 1),
+                    'queue_avg': round(self.depth / self.puts, 2)
+                    if self.puts else 0,
+                    'queue_max': self.depth_max}
+
+
+class Pipeline(object):
+    """Stages run one after the other for every item. With a deadline,
+    items not fetched yet when the run stops are skipped."""
+
+    def __init__(self, stages, deadline=None):
+        self.stages = stages
+        self.deadline = deadline
+        self.done = queue.Queue()
+        self.stopped = threading.Event()
+        self.elapsed = 0
+
+    def _work(self, index):
+        stage = self.stages[index]
+        following = None
+        if index + 1 < len(self.stages):
+            following = self.stages[index + 1]
+        while True:
+            item = stage.queue.get()
+            if item is _DONE:
+                return
+            key, value = item
+            if self.stopped.is_set() or (index == 0 and
+                                         self.deadline is not None and
+                                         self.deadline.stopped):
+                self.done.put(Outcome(key, None, None, stage.name, True))
+                continue
+            try:
+                value = stage.run(value)
+            except Exception as exc:
+                self.done.put(Outcome(key, None, exc, stage.name, False))
+                continue
+            if following is None:
+                self.done.put(Outcome(key, value, None, None, False))
+            else:
+                following.put((key, value))
+
+    def run(self, items):
+        """Yield the Outcome of every (key, value) item as it leaves the
+        pipeline. Ctrl-C cancels the deadline, the items left are
+        skipped."""
+        started = time.time()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            threads.append([])
+            for _ in range(stage.threads):
+                thread = threading.Thread(target=self._work, args=(index,))
+                thread.daemon = True
+                thread.start()
+                threads[index].append(thread)
+        pending = 0
+        for item in items:
+            self.stages[0].put(item)
+            pending += 1
+        try:
+            while pending:
+                try:
+                    outcome = self.done.get(timeout=POLL)
+                except queue.Empty:
+                    continue
+                except KeyboardInterrupt:
+                    if self.deadline is None:
+                        raise
+                    self.deadline.cancel(INTERRUPTED)
+                    continue
+                pending -= 1
+                yield outcome
+        finally:
+            if pending:
+                self.stopped.set()
+            # a stage ends once the one before can't queue items anymore
+            for stage, workers in zip(self.stages, threads):
+                for _ in workers:
+                    stage.queue.put(_DONE)
+                for thread in workers:
+                    thread.join()
+            self.elapsed = time.time() - started
+
+    def stats(self):
+        """Return the counters of every stage."""
+        return [stage.stats(self.elapsed) for stage in self.stages]
+
+    def summary(self):
+        """Return the lines of a table with the items, errors, busy time,
+        use and input queue depth of every stage."""
+        lines = ["{:10}{:>8}{:>7}{:>7}{:>9}{:>7}{:>10}{:>10}"
+                 .format("Stage", "Threads", "Items", "Errors", "Busy",
+                         "Use", "Queue avg", "Queue max")]
+        for row in self.stats():
+            lines.append("{:10}{:>8}{:>7}{:>7}{:>8.2f}s{:>6.0f}%{:>10.1f}"
+                         "{:>10}".format(row['stage'], row['threads'],
+                                         row['items'], row['errors'],
+                                         row['busy'], row['use'],
+                                         row['queue_avg'],
+                                         row['queue_max']))
+        return lines
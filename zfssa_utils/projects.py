@@ -9,9 +9,10 @@ import requests
 from requests.exceptions import HTTPError, ConnectionError
 from urllib3.exceptions import InsecureRequestWarning
 from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
-                                read_csv_file, createprogress, CreateLogger,
-                                PROJECTLOGFILE, msgdeco, COLORGREEN, COLORRED,
-                                RESETCOLOR)
+                                read_csv_file, PROJECTLOGFILE, msgdeco)
+from zfssa_utils.connection import get_session
+from zfssa_utils.jsondecode import response_json
+from zfssa_utils.bulk import run_bulk
 
 # to disable warning
 # InsecureRequestWarning: Unverified HTTPS request is being made.
@@ -20,7 +21,8 @@ from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
 requests.urllib3.disable_warnings(InsecureRequestWarning)
 
 
-def list_projects(fileline, zfsurl, zauth, timeout, verify):
+def list_projects(fileline, zfsurl, zauth, timeout, verify,
+                  session=requests):
     """List/Show projects from line in csv format. (err, msg)"""
     pool = project = None
     if len(fileline) == 2:
@@ -34,9 +36,9 @@ def list_projects(fileline, zfsurl, zauth, timeout, verify):
     fullurl = ("{}/storage/v1/pools/{}/projects/{}"
                .format(zfsurl, pool, project))
     try:
-        req = requests.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
-                           timeout=timeout)
-        j = json.loads(req.text)
+        req = session.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
+                          timeout=timeout)
+        j = response_json(req)
         req.close()
         req.raise_for_status()
         return False, msgdeco('SUCCESS', 'LIST', "project '{}' pool "
@@ -82,7 +84,8 @@ def list_projects(fileline, zfsurl, zauth, timeout, verify):
                              "\"{}\"".format(project, pool, error))
 
 
-def create_project(fileline, zfsurl, zauth, timeout, verify):
+def create_project(fileline, zfsurl, zauth, timeout, verify,
+                   session=requests):
     """Create Project from line in csv format. (err, msg)"""
     if len(fileline) != 19:
         return True, msgdeco('FAIL', 'CREATE', "Error in line {} It needs to "
@@ -112,10 +115,10 @@ def create_project(fileline, zfsurl, zauth, timeout, verify):
                 "default_volsize": default_volsize,
                 "sharenfs": sharenfs,
                 "sharesmb": sharesmb}
-        req = requests.post(fullurl, data=json.dumps(data),
-                            auth=zauth, verify=verify, headers=HEADER,
-                            timeout=timeout)
-        j = json.loads(req.text)
+        req = session.post(fullurl, data=json.dumps(data),
+                           auth=zauth, verify=verify, headers=HEADER,
+                           timeout=timeout)
+        j = response_json(req)
         if 'fault' in j:
             if 'message' in j['fault']:
                 return True, msgdeco('FAIL', 'CREATE', "project '{}' pool '{}'"
@@ -137,7 +140,8 @@ def create_project(fileline, zfsurl, zauth, timeout, verify):
                              " \"{}\"".format(project, pool, error))
 
 
-def delete_project(fileline, zfsurl, zauth, timeout, verify):
+def delete_project(fileline, zfsurl, zauth, timeout, verify,
+                   session=requests):
     """Delete project from line in csv format. (err, msg)"""
     if len(fileline) != 2:
         return True, msgdeco('FAIL', 'DELETE', "Error in line {} It needs to "
@@ -146,9 +150,9 @@ def delete_project(fileline, zfsurl, zauth, timeout, verify):
     fullurl = ("{}/storage/v1/pools/{}/projects/{}"
                .format(zfsurl, pool, project))
     try:
-        req = requests.delete(fullurl, auth=zauth,
-                              verify=verify, headers=HEADER,
-                              timeout=timeout)
+        req = session.delete(fullurl, auth=zauth,
+                             verify=verify, headers=HEADER,
+                             timeout=timeout)
         req.close()
         req.raise_for_status()
         return False, msgdeco('SUCCESS', 'DELETE', "project '{}' pool '{}'"
@@ -171,39 +175,17 @@ def run_projects(args):
     listprojects = args.list
     createproject = args.create
     deleteproject = args.delete
-    timeout = args.timeout
     verify = args.cert
     projectlistfromfile = read_csv_file(csvfile)
     configfile = args.server
     config = read_yaml_file(configfile)
     zauth = (config['username'], config['password'])
+    session = get_session(config, verify,
+                          not getattr(args, 'no_cache', False))
     zfsurl = "https://{}:215/api".format(config['ip'])
-    initial = 0  # for progressbar
     if createproject:
-        if args.progress:
-            progbar = createprogress(len(projectlistfromfile))
-            logger = CreateLogger(PROJECTLOGFILE)
-            for entry in projectlistfromfile:
-                err, msg = create_project(entry, zfsurl,
-                                          zauth, timeout,
-                                          verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Creating projects")
-            print("#" * 79)
-            for entry in projectlistfromfile:
-                print(create_project(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(create_project, projectlistfromfile, zfsurl, zauth,
+                 session, args, "Creating projects", PROJECTLOGFILE)
     elif deleteproject:
         if not args.noconfirm:
             print("You are about to destroy")
@@ -218,50 +200,8 @@ def run_projects(args):
                 pass
             else:
                 exit("Not confirmed, Exiting program")
-        if args.progress:
-            progbar = createprogress(len(projectlistfromfile))
-            logger = CreateLogger(PROJECTLOGFILE)
-            for entry in projectlistfromfile:
-                err, msg = delete_project(entry, zfsurl,
-                                          zauth, timeout,
-                                          verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Deleting projects")
-            print("#" * 79)
-            for entry in projectlistfromfile:
-                print(delete_project(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(delete_project, projectlistfromfile, zfsurl, zauth,
+                 session, args, "Deleting projects", PROJECTLOGFILE)
     elif listprojects:
-        if args.progress:
-            progbar = createprogress(len(projectlistfromfile))
-            logger = CreateLogger(PROJECTLOGFILE)
-            for entry in projectlistfromfile:
-                err, msg = list_projects(entry, zfsurl, zauth, timeout, verify)
-                initial += 1
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Listing projects")
-            print("#" * 79)
-            for entry in projectlistfromfile:
-                print(list_projects(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(list_projects, projectlistfromfile, zfsurl, zauth,
+                 session, args, "Listing projects", PROJECTLOGFILE)
@@ -0,0 +1,82 @@
+"""Retry functions
+
+Retry policy with exponential backoff, jitter and a retry budget for the
+whole run.
+
+Optional values read from the server config file (YAML):
+
+retries: int # retries after the first attempt (default 0, no retries)
+retry_backoff: float # seconds, doubled every attempt (default 0.5)
+retry_max_backoff: float # max seconds between attempts (default 30)
+retry_budget: int # max retries for the whole run (default 100)
+retry_statuses: list # HTTP codes to retry (default [500, 502, 503, 504])
+"""
+import random
+import threading
+from requests.exceptions import ConnectionError, Timeout
+
+RETRY_STATUSES = (500, 502, 503, 504)
+RETRY_EXCEPTIONS = (ConnectionError, Timeout)
+
+
+class RetryBudget(object):
+    """Thread safe count of retries left for the run."""
+
+    def __init__(self, retries=100):
+        self.left = retries
+        self.spent = 0
+        self.denied = 0
+        self.lock = threading.Lock()
+
+    def spend(self):
+        """Take one retry from the budget, False when exhausted."""
+        with self.lock:
+            if self.left <= 0:
+                self.denied += 1
+                return False
+            self.left -= 1
+            self.spent += 1
+            return True
+
+
+class RetryPolicy(object):
+    """Which failures are retried, how many times and how long to wait."""
+
+    def __init__(self, retries=0, backoff=0.5, max_backoff=30,
+                 statuses=RETRY_STATUSES, exceptions=RETRY_EXCEPTIONS,
+                 budget=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+        self.budget = budget or RetryBudget()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return the policy described in the server config."""
+        return cls(retries=config.get('retries', 0),
+                   backoff=config.get('retry_backoff', 0.5),
+                   max_backoff=config.get('retry_max_backoff', 30),
+                   statuses=config.get('retry_statuses', RETRY_STATUSES),
+                   budget=RetryBudget(config.get('retry_budget', 100)))
+
+    def retryable(self, status):
+        """Return True if HTTP status should be retried."""
+        return status in self.statuses
+
+    def allowed(self, attempt):
+        """Return True if retry number attempt (0 based) can be done, taking
+        it from the budget."""
+        return attempt < self.retries and self.budget.spend()
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt, full jitter."""
+        ceiling = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def summary(self):
+        """Return a list of lines describing the retries done."""
+        return ["Retries: done {} budget left {} denied {}"
+                .format(self.budget.spent, self.budget.left,
+                        self.budget.denied)]
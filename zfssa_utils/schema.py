@@ -0,0 +1,337 @@
+"""Endpoint schema functions
+
+Registry of the endpoints collected by the explorer: the url path of every
+datatype and the tables of its csv file, every table a list of columns read
+from the response. The row extractor of a table is compiled once from its
+columns, an operator.itemgetter reading every field of a row in one call.
+
+Columns are given as specs:
+
+    key          value of key, the row fails when it is missing
+    key?         value of key, '-' when it is missing
+    key+         value of key and its human size in column 'key (Human)'
+    key%         human size of key only
+    parent.key   key of the dict parent, in column 'parent_key' ('src_key'
+                 for source)
+    spec=header  column header instead of the one given by spec
+"""
+from collections import namedtuple, OrderedDict
+from operator import itemgetter
+from six.moves import map
+
+MISSING = '-'
+PREFIXES = {'source': 'src'}
+SIZECACHE = 65536
+_SIZES = {}
+
+Column = namedtuple('Column', 'header parent key optional human')
+# rows where key is value get '-' in the columns of paths (keys of the row
+# or parents)
+Blank = namedtuple('Blank', 'key value paths')
+
+
+def parse_column(spec):
+    """Return the Columns of a column spec."""
+    header = None
+    if '=' in spec:
+        spec, header = spec.split('=')
+    flag = spec[-1] if spec[-1] in '?+%' else ''
+    parent, _, key = spec.rstrip('?+%').rpartition('.')
+    parent = parent or None
+    if header is None:
+        header = key if parent is None else \
+            '{}_{}'.format(PREFIXES.get(parent, parent), key)
+    if flag == '+':
+        return [Column(header, parent, key, False, False),
+                Column('{} (Human)'.format(header), parent, key, False,
+                       True)]
+    return [Column(header, parent, key, flag == '?', flag == '%')]
+
+
+def response_size(nbytes):
+    """Return size in a human readable format."""
+    suffixes = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
+    i = 0
+    while nbytes >= 1024 and i < len(suffixes)-1:
+        nbytes /= 1024.
+        i += 1
+    f = ('{:.2f}'.format(nbytes)).rstrip('0').rstrip('.')
+    return '{} {}'.format(f, suffixes[i])
+
+
+def human_size(nbytes):
+    """Return response_size(nbytes), remembering the sizes seen (quotas,
+    record sizes... repeat across rows)."""
+    try:
+        return _SIZES[nbytes]
+    except KeyError:
+        if len(_SIZES) >= SIZECACHE:
+            _SIZES.clear()
+        size = _SIZES[nbytes] = response_size(nbytes)
+        return size
+
+
+def _getter(keys):
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda item: (item[key],)
+    return itemgetter(*keys)
+
+
+def _fallback(keys, optional):
+    def getter(item):
+        values = []
+        for key in keys:
+            try:
+                values.append(item[key])
+            except KeyError:
+                if key not in optional:
+                    raise
+                values.append(MISSING)
+        return values
+    return getter
+
+
+def compile_row(columns, blank=()):
+    """Return a function returning the csv row of an item, '-' in the
+    columns whose key or parent is in blank. Fields of the item and of
+    every parent are read by one itemgetter, the slower per field lookup
+    only runs for items missing optional fields."""
+    def blanked(column):
+        if column.parent is None:
+            return column.key in blank
+        return column.parent in blank
+
+    groups = OrderedDict()
+    optional = {}
+    for column in columns:
+        if blanked(column):
+            continue
+        keys = groups.setdefault(column.parent, [])
+        if column.key not in keys:
+            keys.append(column.key)
+        if column.optional:
+            optional.setdefault(column.parent, set()).add(column.key)
+    offsets = {}
+    getters = []
+    size = 0
+    for parent, keys in groups.items():
+        offsets[parent] = size
+        size += len(keys)
+        getters.append((parent, _getter(keys),
+                        _fallback(keys, optional.get(parent, set()))))
+    places = []
+    human = []
+    for index, column in enumerate(columns):
+        if blanked(column):
+            places.append(size)
+            continue
+        places.append(offsets[column.parent] +
+                      groups[column.parent].index(column.key))
+        if column.human:
+            human.append(index)
+    order = _getter(places)
+
+    def extract(item):
+        values = []
+        for parent, fast, slow in getters:
+            obj = item if parent is None else item[parent]
+            try:
+                values.extend(fast(obj))
+            except KeyError:
+                values.extend(slow(obj))
+        values.append(MISSING)
+        row = list(order(values))
+        for index in human:
+            row[index] = human_size(row[index])
+        return row
+    return extract
+
+
+class Table(object):
+    """Header and rows of a csv table read from data at path (dotted keys),
+    a dict giving one row or a list (or iterator) of rows."""
+
+    def __init__(self, path, columns, blank=None):
+        self.path = path.split('.')
+        self.columns = [column for spec in columns
+                        for column in parse_column(spec)]
+        self.headers = [column.header for column in self.columns]
+        self.blank = blank
+        self.extract = compile_row(self.columns)
+        if blank is not None:
+            self.extract_blank = compile_row(self.columns, blank.paths)
+
+    def rows(self, data):
+        """Return an iterator over the rows of data."""
+        for key in self.path:
+            data = data[key]
+        if isinstance(data, dict):
+            data = [data]
+        if self.blank is None:
+            return map(self.extract, data)
+        return (self.extract_blank(item)
+                if item[self.blank.key] == self.blank.value
+                else self.extract(item) for item in data)
+
+
+class Endpoint(object):
+    """Datatype collected from the api path, written as csv tables."""
+
+    def __init__(self, name, path, tables):
+        self.name = name
+        self.path = path
+        self.tables = tables
+
+    def url(self, zfsip):
+        """Return the url of the endpoint on appliance api zfsip."""
+        return "{}/{}".format(zfsip, self.path)
+
+    def write(self, writer, data):
+        """Write the header and rows of every table to a csv writer."""
+        for table in self.tables:
+            writer.writerow(table.headers)
+            writer.writerows(table.rows(data))
+
+
+ENDPOINTS = OrderedDict((endpoint.name, endpoint) for endpoint in [
+    Endpoint('version', 'system/v1/version', [
+        Table('version', [
+            'href', 'nodename', 'mkt_product', 'product', 'version',
+            'install_time', 'update_time', 'boot_time', 'asn', 'csn', 'part',
+            'urn', 'navname', 'navagent', 'http', 'ssl', 'ak_version',
+            'os_version', 'bios_version', 'sp_version'])]),
+    Endpoint('cluster', 'hardware/v1/cluster', [
+        Table('cluster', [
+            'state', 'description', 'peer_asn', 'peer_hostname',
+            'peer_state', 'peer_description']),
+        Table('cluster.resources', [
+            'owner', 'type', 'user_label', 'details', 'href'])]),
+    Endpoint('problems', 'problem/v1/problems', [
+        Table('problems', [
+            'uuid', 'code', 'diagnosed', 'phoned_home', 'severity', 'type',
+            'url', 'description', 'impact', 'response', 'action', 'href'])]),
+    Endpoint('datalinks', 'network/v1/datalinks', [
+        Table('datalinks', [
+            'class', 'label', 'mac', 'links', 'pkey?', 'linkmode?', 'mtu?',
+            'id?', 'speed?', 'duplex?', 'datalink', 'href'])]),
+    Endpoint('devices', 'network/v1/devices', [
+        Table('devices', [
+            'speed', 'up', 'active', 'media', 'factory_mac', 'port?',
+            'guid?', 'duplex?', 'device', 'href'])]),
+    Endpoint('interfaces', 'network/v1/interfaces', [
+        Table('interfaces', [
+            'state', 'curaddrs', 'class', 'label', 'enable', 'admin',
+            'links', 'v4addrs', 'v4dhcp', 'v4directnets', 'v6addrs',
+            'v6dhcp', 'v6directnets', 'key?', 'standbys?', 'interface',
+            'href'])]),
+    Endpoint('routes', 'network/v1/routes', [
+        Table('routes', [
+            'status', 'family', 'destination', 'mask', 'href', 'interface',
+            'type', 'gateway'])]),
+    Endpoint('routing', 'network/v1/routing', [
+        Table('routing', ['href', 'multihoming'])]),
+    Endpoint('pools', 'storage/v1/pools', [
+        Table('pools', [
+            'status', 'profile', 'name', 'usage.available+',
+            'usage.usage_snapshots+', 'usage.used+', 'usage.compression',
+            'usage.usage_data+', 'usage.free+', 'usage.dedupratio',
+            'usage.total+', 'usage.usage_total+', 'peer', 'href?', 'owner',
+            'asn'], blank=Blank('status', 'exported', ('profile', 'usage')))]),
+    Endpoint('projects', 'storage/v1/projects', [
+        Table('projects', [
+            'snapdir', 'default_volblocksize%', 'defaultgroupquota',
+            'logbias', 'creation', 'nodestroy', 'dedup', 'sharenfs', 'href',
+            'sharesmb', 'default_permissions', 'mountpoint', 'snaplabel',
+            'id', 'readonly', 'space_data+', 'compression',
+            'defaultuserquota', 'source.snapdir', 'source.logbias',
+            'source.dedup', 'source.sharenfs', 'source.sharesmb',
+            'source.mountpoint', 'source.rrsrc_actions?',
+            'source.compression', 'source.sharetftp', 'source.encryption?',
+            'source.sharedav', 'source.copies', 'source.aclinherit',
+            'source.shareftp', 'source.readonly', 'source.keychangedate',
+            'source.secondarycache', 'source.maxblocksize',
+            'source.exported', 'source.vscan', 'source.reservation',
+            'source.atime', 'source.recordsize', 'source.checksum',
+            'source.sharesftp', 'source.nbmand', 'source.aclmode',
+            'source.rstchown', 'default_sparse', 'encryption', 'aclmode',
+            'copies', 'aclinherit', 'compressratio', 'shareftp',
+            'canonical_name', 'recordsize+', 'keychangedate',
+            'space_available+', 'secondarycache', 'name', 'space_snapshots+',
+            'space_unused_res+', 'quota+', 'maxblocksize+', 'exported',
+            'default_volsize+', 'vscan', 'reservation+', 'keystatus',
+            'atime', 'pool', 'default_user', 'space_unused_res_shares+',
+            'sharetftp', 'checksum', 'space_total+', 'default_group',
+            'sharesftp', 'rstchown', 'sharedav', 'nbmand'])]),
+    Endpoint('luns', 'storage/v1/luns', [
+        Table('luns', [
+            'logbias', 'creation', 'nodestroy', 'assignednumber', 'copies',
+            'href', 'fixednumber', 'space_data+', 'id', 'writecache',
+            'compression', 'encryption', 'dedup', 'snaplabel',
+            'compressratio', 'source.compression', 'source.encryption?',
+            'source.logbias', 'source.dedup', 'source.copies',
+            'source.maxblocksize', 'source.exported', 'source.checksum',
+            'source.keychangedate', 'source.rrsrc_actions?',
+            'source.secondarycache', 'space_total+', 'lunumber',
+            'keychangedate', 'space_available+',
+            'secondarycache=secondary_cache', 'status', 'space_snapshots+',
+            'lunguid', 'maxblocksize+', 'exported', 'initiatorgroup',
+            'volsize+', 'keystatus', 'pool', 'volblocksize+', 'writelimit?',
+            'name', 'checksum', 'canonical_name', 'project', 'sparse',
+            'targetgroup', 'effectivewritelimit?'])]),
+    Endpoint('filesystems', 'storage/v1/filesystems', [
+        Table('filesystems', [
+            'snapdir', 'logbias', 'creation', 'nodestroy', 'dedup',
+            'sharenfs', 'sharesmb_abe?', 'sharesmb', 'root_acl?',
+            'mountpoint', 'casesensitivity', 'snaplabel', 'id', 'readonly',
+            'sharesmb_name?', 'space_data+', 'compression', 'sharetftp',
+            'source.snapdir', 'source.logbias', 'source.dedup',
+            'source.sharenfs', 'source.sharesmb', 'source.mountpoint',
+            'source.rrsrc_actions?', 'source.compression',
+            'source.sharetftp', 'source.encryption?', 'source.sharedav',
+            'source.copies', 'source.aclinherit', 'source.shareftp',
+            'source.readonly', 'source.keychangedate',
+            'source.secondarycache', 'source.maxblocksize',
+            'source.exported', 'source.vscan', 'source.reservation',
+            'source.atime', 'source.recordsize', 'source.checksum',
+            'source.sharesftp', 'source.nbmand', 'source.aclmode',
+            'source.rstchown', 'encryption', 'aclmode', 'copies',
+            'smbshareacl?', 'aclinherit', 'compressratio', 'shareftp',
+            'canonical_name', 'recordsize+', 'keychangedate',
+            'space_available+', 'root_group', 'secondarycache', 'root_user',
+            'root_permissions', 'shadow', 'space_snapshots+', 'href',
+            'space_unused_res+', 'quota+', 'utf8only', 'sharesmb_dfsroot?',
+            'maxblocksize+', 'exported', 'vscan', 'reservation+',
+            'keystatus', 'atime', 'pool', 'quota_snap+',
+            'space_unused_res_shares?', 'name', 'checksum', 'space_total+',
+            'project', 'normalization', 'sharesftp', 'rstchown',
+            'reservation_snap+', 'sharedav', 'nbmand'])]),
+    Endpoint('fc_initiators', 'san/v1/fc/initiators', [
+        Table('initiators', ['alias', 'initiator', 'href'])]),
+    Endpoint('fc_initiator-groups', 'san/v1/fc/initiator-groups', [
+        Table('groups', ['name', 'initiators', 'href'])]),
+    Endpoint('fc_targets', 'san/v1/fc/targets', [
+        Table('targets', [
+            'wwn', 'port', 'mode', 'speed', 'discovered_ports',
+            'link_failure_count', 'loss_of_sync_count',
+            'loss_of_signal_count', 'protocol_error_count',
+            'invalid_tx_word_count', 'invalid_crc_count', 'href'])]),
+    Endpoint('fc_target-groups', 'san/v1/fc/target-groups', [
+        Table('groups', ['name?', 'targets?', 'href?'])]),
+    Endpoint('iscsi_initiators', 'san/v1/iscsi/initiators', [
+        Table('initiators', [
+            'alias?', 'initiator?', 'chapuser?', 'chapsecret?', 'href?'])]),
+    Endpoint('iscsi_initiator-groups', 'san/v1/iscsi/initiator-groups', [
+        Table('groups', ['name?', 'initiators?', 'href?'])]),
+    Endpoint('iscsi_targets', 'san/v1/iscsi/targets', [
+        Table('targets', [
+            'alias?', 'iqn?', 'auth?', 'targetchapuser?',
+            'targetchapsecret?', 'interfaces?', 'href?'])]),
+    Endpoint('iscsi_target-groups', 'san/v1/iscsi/target-groups', [
+        Table('groups', ['name?', 'targets?', 'href?'])]),
+    Endpoint('users', 'user/v1/users', [
+        Table('users', [
+            'logname', 'type', 'uid', 'fullname', 'initial_password',
+            'require_annotation', 'roles?', 'kiosk_mode?', 'kiosk_screen?',
+            'href'])]),
+])
@@ -21,9 +21,10 @@ import requests
 from requests.exceptions import HTTPError, ConnectionError
 from urllib3.exceptions import InsecureRequestWarning
 from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
-                                read_csv_file, createprogress, CreateLogger,
-                                SNAPLOGFILE, msgdeco, COLORGREEN, COLORRED,
-                                RESETCOLOR)
+                                read_csv_file, SNAPLOGFILE, msgdeco)
+from zfssa_utils.connection import get_session
+from zfssa_utils.jsondecode import response_json
+from zfssa_utils.bulk import run_bulk
 
 # to disable warning
 # InsecureRequestWarning: Unverified HTTPS request is being made.
@@ -32,7 +33,8 @@ from zfssa_utils.common import (HEADER, response_size, read_yaml_file,
 requests.urllib3.disable_warnings(InsecureRequestWarning)
 
 
-def list_snap(snap, zfsurl, zauth, timeout, verify):
+def list_snap(snap, zfsurl, zauth, timeout, verify,
+              session=requests):
     """List Snapshots from line in csv format. (err, msg)"""
     pool, project, snaptarget, snaptype, snapname = snap
     fullurl = ""
@@ -49,9 +51,9 @@ def list_snap(snap, zfsurl, zauth, timeout, verify):
         return False, msgdeco('FAIL', 'LIST', "snaptype '{}' unknown"
                               .format(snaptype))
     try:
-        req = requests.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
-                           timeout=timeout)
-        j = json.loads(req.text)
+        req = session.get(fullurl, auth=zauth, verify=verify, headers=HEADER,
+                          timeout=timeout)
+        j = response_json(req)
         req.close()
         req.raise_for_status()
         # if len(j['snapshots']) == 0:
@@ -96,7 +98,8 @@ def list_snap(snap, zfsurl, zauth, timeout, verify):
                                      pool, error))
 
 
-def create_snap(snap, zfsurl, zauth, timeout, verify):
+def create_snap(snap, zfsurl, zauth, timeout, verify,
+                session=requests):
     """Create Snapshots from line in csv format. (err, msg)"""
     pool, project, snaptarget, snaptype, snapname = snap
     fullurl = ""
@@ -113,10 +116,10 @@ def create_snap(snap, zfsurl, zauth, timeout, verify):
         return False, msgdeco('FAIL', 'CREATE', "snaptype '{}' unknown"
                               .format(snaptype))
     try:
-        req = requests.post(fullurl, data=json.dumps({'name': snapname}),
-                            auth=zauth, verify=verify, headers=HEADER,
-                            timeout=timeout)
-        j = json.loads(req.text)
+        req = session.post(fullurl, data=json.dumps({'name': snapname}),
+                           auth=zauth, verify=verify, headers=HEADER,
+                           timeout=timeout)
+        j = response_json(req)
         req.close()
         req.raise_for_status()
         if 'fault' in j:
@@ -147,7 +150,8 @@ def create_snap(snap, zfsurl, zauth, timeout, verify):
                                      pool, error))
 
 
-def delete_snap(snap, zfsurl, zauth, timeout, verify):
+def delete_snap(snap, zfsurl, zauth, timeout, verify,
+                session=requests):
     """Delete Snapshots from line in csv format. (err, msg)"""
     pool, project, snaptarget, snaptype, snapname = snap
     fullurl = ""
@@ -166,8 +170,8 @@ def delete_snap(snap, zfsurl, zauth, timeout, verify):
         return False, msgdeco('FAIL', 'DELETE', "snaptype ''{}' unknown"
                               .format(snaptype))
     try:
-        req = requests.delete(fullurl, auth=zauth, verify=verify,
-                              headers=HEADER, timeout=timeout)
+        req = session.delete(fullurl, auth=zauth, verify=verify,
+                             headers=HEADER, timeout=timeout)
         req.close()
         req.raise_for_status()
         return False, msgdeco('SUCCESS', 'DELETE', "snapshot '{}' {} '{}' "
@@ -197,37 +201,17 @@ def run_snaps(args):
     listsnaps = args.list
     createsnaps = args.create
     deletesnaps = args.delete
-    timeout = args.timeout
     verify = args.cert
     snaplist = read_csv_file(csvfile)
     configfile = args.server
     config = read_yaml_file(configfile)
     zfsurl = "https://{}:215/api".format(config['ip'])
     zauth = (config['username'], config['password'])
-    initial = 0  # for progressbar
+    session = get_session(config, verify,
+                          not getattr(args, 'no_cache', False))
     if createsnaps:
-        if args.progress:
-            progbar = createprogress(len(snaplist))
-            logger = CreateLogger(SNAPLOGFILE)
-            for entry in snaplist:
-                err, msg = create_snap(entry, zfsurl, zauth, timeout, verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Creating snapshots")
-            print("#" * 79)
-            for entry in snaplist:
-                print(create_snap(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(create_snap, snaplist, zfsurl, zauth, session, args,
+                 "Creating snapshots", SNAPLOGFILE)
     elif deletesnaps:
         if not args.noconfirm:
             print("You are about to destroy")
@@ -245,48 +229,8 @@ def run_snaps(args):
                 pass
             else:
                 exit("Not confirmed, Exiting program")
-        if args.progress:
-            progbar = createprogress(len(snaplist))
-            logger = CreateLogger(SNAPLOGFILE)
-            for entry in snaplist:
-                err, msg = delete_snap(entry, zfsurl, zauth, timeout, verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Deleting snapshots")
-            print("#" * 79)
-            for entry in snaplist:
-                print(delete_snap(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(delete_snap, snaplist, zfsurl, zauth, session, args,
+                 "Deleting snapshots", SNAPLOGFILE)
     elif listsnaps:
-        if args.progress:
-            progbar = createprogress(len(snaplist))
-            logger = CreateLogger(SNAPLOGFILE)
-            for entry in snaplist:
-                err, msg = list_snap(entry, zfsurl, zauth, timeout, verify)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-            progbar.finish()
-            logger.shutdown()
-        else:
-            print("#" * 79)
-            print("Listing snapshots")
-            print("#" * 79)
-            for entry in snaplist:
-                print(list_snap(entry, zfsurl, zauth, timeout, verify)[1])
-                print("=" * 79)
+        run_bulk(list_snap, snaplist, zfsurl, zauth, session, args,
+                 "Listing snapshots", SNAPLOGFILE)
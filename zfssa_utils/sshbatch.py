@@ -0,0 +1,329 @@
+"""SSH batch functions
+
+Run create, delete and update csv files through the appliance CLI instead of
+the REST api: every csv line is compiled to CLI commands, the whole file is
+sent as one CLI script over a single SSH session and the line printed by the
+script for every csv line is turned back into the usual (err, msg) result.
+
+Every csv line runs in its own try/catch block, one line failing doesn't stop
+the next ones. Lists keep using the REST api.
+
+The appliance host key must be known (system known_hosts files), unknown
+keys are refused unless accepted with --ssh-accept-host-key, the password
+of the server config is never sent to a host that can't be verified.
+"""
+from __future__ import print_function
+import json
+import socket
+from collections import namedtuple
+from six.moves.urllib.parse import urlparse
+from zfssa_utils.common import msgdeco
+from zfssa_utils.deadline import DeadlineExceeded, INTERRUPTED
+from zfssa_utils.filesystems import create_filesystems, delete_filesystems
+from zfssa_utils.luns import create_lun, delete_lun
+from zfssa_utils.projects import create_project, delete_project
+from zfssa_utils.snapshots import create_snap, delete_snap
+from zfssa_utils.updates import update_entry
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+
+SSHPORT = 22
+MARKER = 'ZU'
+# defines zu(index, commands), running commands from the root context and
+# printing "ZU <index> OK" or "ZU <index> FAIL <message>"
+PRELUDE = """script
+function zu(index, commands) {
+    try {
+        run('cd /');
+        for (var i = 0; i < commands.length; i++) {
+            run(commands[i]);
+        }
+        printf('ZU %d OK\\n', index);
+    } catch (err) {
+        printf('ZU %d FAIL %s\\n', index,
+               String(err.message || err).replace(/\\n/g, ' '));
+    }
+}
+"""
+PROJECTFIELDS = ['mountpoint', 'quota', 'reservation', 'compression',
+                 'logbias', 'nodestroy', 'recordsize', 'readonly', 'atime',
+                 'default_sparse', 'default_user', 'default_group',
+                 'default_permissions', 'default_volblocksize',
+                 'default_volsize', 'sharenfs', 'sharesmb']
+FSFIELDS = ['mountpoint', 'quota', 'reservation', 'compression', 'logbias',
+            'nodestroy', 'recordsize', 'readonly', 'atime', 'root_user',
+            'root_group', 'root_permissions', 'sharenfs', 'sharesmb']
+LUNFIELDS = ['volsize', 'volblocksize', 'sparse', 'targetgroup',
+             'initiatorgroup', 'compression', 'logbias', 'nodestroy']
+
+# csv line compiled: result type, object description, CLI commands and the
+# text added after the description in its result
+BatchLine = namedtuple('BatchLine', 'op label commands suffix')
+
+
+class LineError(Exception):
+    """Csv line that can't be compiled, reported as a failed result."""
+
+    def __init__(self, op, msg):
+        super(LineError, self).__init__(msg)
+        self.op = op
+        self.msg = msg
+
+
+def cli_value(value):
+    """Return a csv value as a CLI property value."""
+    if value in ('True', 'False'):
+        return value.lower()
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def _sets(names, values):
+    return ['set {}={}'.format(name, cli_value(value))
+            for name, value in zip(names, values)]
+
+
+def _shares(pool, *contexts):
+    return ['shares set pool={}'.format(cli_value(pool))] + \
+        ['shares'] + list(contexts)
+
+
+def _columns(op, fileline, count):
+    if len(fileline) != count:
+        raise LineError(op, "Error in line {} It needs to be {} columns long"
+                        .format(fileline, count))
+
+
+def compile_create_project(fileline):
+    """Compile a create projects csv line."""
+    _columns('CREATE', fileline, 19)
+    pool, project = fileline[:2]
+    return BatchLine('CREATE', "project '{}' pool '{}'".format(project, pool),
+                     _shares(pool, 'project {}'.format(project)) +
+                     _sets(PROJECTFIELDS, fileline[2:]) + ['commit'], '')
+
+
+def compile_delete_project(fileline):
+    """Compile a delete projects csv line."""
+    _columns('DELETE', fileline, 2)
+    pool, project = fileline
+    return BatchLine('DELETE', "project '{}' pool '{}'".format(project, pool),
+                     _shares(pool, 'confirm destroy {}'.format(project)), '')
+
+
+def compile_create_filesystem(fileline):
+    """Compile a create filesystems csv line."""
+    _columns('CREATE', fileline, 17)
+    pool, project, fs = fileline[:3]
+    return BatchLine('CREATE', "filesystem '{}' project '{}' pool '{}'"
+                     .format(fs, project, pool),
+                     _shares(pool, 'select {}'.format(project),
+                             'filesystem {}'.format(fs)) +
+                     _sets(FSFIELDS, fileline[3:]) + ['commit'], '')
+
+
+def compile_delete_filesystem(fileline):
+    """Compile a delete filesystems csv line."""
+    _columns('DELETE', fileline, 3)
+    pool, project, fs = fileline
+    return BatchLine('DELETE', "filesystem '{}' project '{}' pool '{}'"
+                     .format(fs, project, pool),
+                     _shares(pool, 'select {}'.format(project),
+                             'confirm destroy {}'.format(fs)), '')
+
+
+def compile_create_lun(fileline):
+    """Compile a create luns csv line."""
+    _columns('CREATE', fileline, 11)
+    pool, project, lun = fileline[:3]
+    return BatchLine('CREATE', "lun '{}' project '{}' pool '{}'"
+                     .format(lun, project, pool),
+                     _shares(pool, 'select {}'.format(project),
+                             'lun {}'.format(lun)) +
+                     _sets(LUNFIELDS, fileline[3:]) + ['commit'], '')
+
+
+def compile_delete_lun(fileline):
+    """Compile a delete luns csv line."""
+    _columns('DELETE', fileline, 3)
+    pool, project, lun = fileline
+    return BatchLine('DELETE', "lun '{}' project '{}' pool '{}'"
+                     .format(lun, project, pool),
+                     _shares(pool, 'select {}'.format(project),
+                             'confirm destroy {}'.format(lun)), '')
+
+
+def _snapshots(op, snap):
+    _columns(op, snap, 5)
+    pool, project, snaptarget, snaptype, snapname = snap
+    if snaptype in ('filesystem', 'lun'):
+        contexts = ['select {}'.format(project),
+                    'select {}'.format(snaptarget), 'snapshots']
+    elif snaptype == 'project':
+        contexts = ['select {}'.format(project), 'snapshots']
+    else:
+        raise LineError(op, "snaptype '{}' unknown".format(snaptype))
+    return ("snapshot '{}' {} '{}' project '{}' pool '{}'"
+            .format(snapname, snaptype, snaptarget, project, pool),
+            _shares(pool, *contexts), snapname)
+
+
+def compile_create_snap(snap):
+    """Compile a create snapshots csv line."""
+    label, commands, snapname = _snapshots('CREATE', snap)
+    return BatchLine('CREATE', label,
+                     commands + ['snapshot {}'.format(snapname)], '')
+
+
+def compile_delete_snap(snap):
+    """Compile a delete snapshots csv line."""
+    label, commands, snapname = _snapshots('DELETE', snap)
+    return BatchLine('DELETE', label,
+                     commands + ['confirm destroy {}'.format(snapname)], '')
+
+
+def compile_update(item):
+    """Compile an update csv line."""
+    try:
+        name, project, pool = item[1].split(';')
+        changes = [tuple(entry.split(';')) for entry in item[2:]]
+        if item[0] not in ('project', 'filesystem', 'lun') or \
+                any(len(change) != 2 for change in changes):
+            raise ValueError(item)
+    except (IndexError, ValueError):
+        raise LineError('UPDATE', "Wrong type in file format. line {}"
+                        .format(item))
+    contexts = ['select {}'.format(project)]
+    label = "project '{}' pool '{}'".format(project, pool)
+    if item[0] != 'project':
+        contexts.append('select {}'.format(name))
+        label = "{} '{}' {}".format(item[0], name, label)
+    stringdata = "".join("{} '{}' ".format(key, value)
+                         for key, value in changes)
+    return BatchLine('UPDATE', label,
+                     _shares(pool, *contexts) +
+                     _sets([key for key, _ in changes],
+                           [value for _, value in changes]) + ['commit'],
+                     " - updates: {}".format(stringdata))
+
+
+COMPILERS = {create_project: compile_create_project,
+             delete_project: compile_delete_project,
+             create_filesystems: compile_create_filesystem,
+             delete_filesystems: compile_delete_filesystem,
+             create_lun: compile_create_lun,
+             delete_lun: compile_delete_lun,
+             create_snap: compile_create_snap,
+             delete_snap: compile_delete_snap,
+             update_entry: compile_update}
+
+
+def build_script(lines):
+    """Return the CLI script running lines, a list of (index, BatchLine)."""
+    script = [PRELUDE]
+    for index, line in lines:
+        script.append("zu({}, {});\n".format(index,
+                                              json.dumps(line.commands)))
+    script.append(".\n")
+    return "".join(script)
+
+
+def parse_result(text):
+    """Return (index, error) from a result line printed by the script, error
+    is None when the csv line succeeded. Return None for other output."""
+    parts = text.strip().split(' ', 3)
+    if len(parts) < 3 or parts[0] != MARKER or not parts[1].isdigit():
+        return None
+    if parts[2] == 'OK':
+        return int(parts[1]), None
+    if parts[2] == 'FAIL':
+        return int(parts[1]), parts[3] if len(parts) > 3 else 'failed'
+    return None
+
+
+def line_result(line, error=None):
+    """Return the (err, msg) result of a compiled line."""
+    if error is None:
+        return False, msgdeco('SUCCESS', line.op, line.label + line.suffix)
+    return True, msgdeco('FAIL', line.op, "{} - Error \"{}\"{}"
+                         .format(line.label, error, line.suffix))
+
+
+def open_shell(host, port, zauth, timeout, accept_host_key=False):
+    """Return an SSH client and a channel running the appliance shell, as
+    'ssh user@host < script' would. Unknown host keys are refused unless
+    accept_host_key."""
+    client = paramiko.SSHClient()
+    client.load_system_host_keys()
+    if accept_host_key:
+        client.set_missing_host_key_policy(paramiko.WarningPolicy())
+    else:
+        client.set_missing_host_key_policy(paramiko.RejectPolicy())
+    client.connect(host, port=port, username=zauth[0], password=zauth[1],
+                   timeout=timeout, banner_timeout=timeout,
+                   auth_timeout=timeout)
+    channel = client.get_transport().open_session()
+    channel.settimeout(timeout)
+    channel.invoke_shell()
+    return client, channel
+
+
+def run_ssh(func, entries, zfsurl, zauth, timeout, callback, port=SSHPORT,
+            deadline=None, accept_host_key=False):
+    """Run row function func for every entry as one CLI script sent over a
+    single SSH session, calling callback(index, err, msg) as the script
+    reports every entry. Timeout is the longest wait for the next result,
+    with deadline the session ends when the run must stop. Appliances with
+    a host key not known fail every entry unless accept_host_key."""
+    if paramiko is None:
+        exit("Error: --ssh needs paramiko installed (pip install paramiko)")
+    compiler = COMPILERS.get(func)
+    if compiler is None:
+        exit("Error: --ssh runs create, delete and update csv files")
+    lines = {}
+    for index, entry in enumerate(entries):
+        try:
+            lines[index] = compiler(entry)
+        except LineError as error:
+            callback(index, True, msgdeco('FAIL', error.op, error.msg))
+    if not lines:
+        return
+    error = "no result from the appliance script"
+    client = None
+    try:
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        client, channel = open_shell(urlparse(zfsurl).hostname, port, zauth,
+                                     timeout, accept_host_key)
+        channel.sendall(build_script(sorted(lines.items())).encode('utf-8'))
+        channel.shutdown_write()
+        output = channel.makefile('r')
+        while lines:
+            if deadline is not None:
+                channel.settimeout(deadline.timeout(timeout))
+            text = output.readline()
+            if not text:
+                break
+            if isinstance(text, bytes):
+                text = text.decode('utf-8', 'replace')
+            result = parse_result(text)
+            if result is not None and result[0] in lines:
+                index, failure = result
+                err, msg = line_result(lines.pop(index), failure)
+                callback(index, err, msg)
+    except (paramiko.SSHException, socket.error, DeadlineExceeded) as exc:
+        error = exc
+        if deadline is not None and deadline.stopped:
+            error = "no result, {}".format(deadline.message())
+    except KeyboardInterrupt:
+        if deadline is None:
+            raise
+        deadline.cancel(INTERRUPTED)
+        error = "no result, {}".format(deadline.message())
+    finally:
+        if client is not None:
+            client.close()
+    for index in sorted(lines):
+        err, msg = line_result(lines[index], error)
+        callback(index, err, msg)
@@ -5,8 +5,10 @@ import requests
 from requests.exceptions import HTTPError, ConnectionError
 from urllib3.exceptions import InsecureRequestWarning
 from zfssa_utils.common import (HEADER, read_csv_file, read_yaml_file,
-                                createprogress, CreateLogger, UPDATELOGFILE,
-                                msgdeco, COLORGREEN, COLORRED, RESETCOLOR)
+                                UPDATELOGFILE, msgdeco)
+from zfssa_utils.connection import get_session
+from zfssa_utils.jsondecode import response_json
+from zfssa_utils.bulk import run_bulk
 
 # to disable warning
 # InsecureRequestWarning: Unverified HTTPS request is being made.
@@ -16,7 +18,8 @@ requests.urllib3.disable_warnings(InsecureRequestWarning)
 
 
 def update_component(component_type, fullurl, zauth, timeout, data, verify,
-                     project=None, pool=None, filesystem=None, lun=None):
+                     project=None, pool=None, filesystem=None, lun=None,
+                     session=requests):
     """Update every component passed."""
     project, pool, filesystem, lun = project, pool, filesystem, lun
     stringdata = ""
@@ -24,10 +27,10 @@ def update_component(component_type, fullurl, zauth, timeout, data, verify,
         stringdata += "{} '{}' ".format(k, data[k])
     if component_type == 'project':
         try:
-            req = requests.put(fullurl, data=json.dumps(data),
-                               auth=zauth, verify=verify, headers=HEADER,
-                               timeout=timeout)
-            j = json.loads(req.text)
+            req = session.put(fullurl, data=json.dumps(data),
+                              auth=zauth, verify=verify, headers=HEADER,
+                              timeout=timeout)
+            j = response_json(req)
             if 'fault' in j:
                 if 'message' in j['fault']:
                     return True, msgdeco('FAIL', 'UPDATE', "project '{}' pool "
@@ -55,10 +58,10 @@ def update_component(component_type, fullurl, zauth, timeout, data, verify,
 
     elif component_type == 'filesystem':
         try:
-            req = requests.put(fullurl, data=json.dumps(data),
-                               auth=zauth, verify=verify, headers=HEADER,
-                               timeout=timeout)
-            j = json.loads(req.text)
+            req = session.put(fullurl, data=json.dumps(data),
+                              auth=zauth, verify=verify, headers=HEADER,
+                              timeout=timeout)
+            j = response_json(req)
             if 'fault' in j:
                 if 'message' in j['fault']:
                     return True, msgdeco('FAIL', 'UPDATE', "filesystem '{}' "
@@ -92,10 +95,10 @@ def update_component(component_type, fullurl, zauth, timeout, data, verify,
 
     elif component_type == 'lun':
         try:
-            req = requests.put(fullurl, data=json.dumps(data),
-                               auth=zauth, verify=verify, headers=HEADER,
-                               timeout=timeout)
-            j = json.loads(req.text)
+            req = session.put(fullurl, data=json.dumps(data),
+                              auth=zauth, verify=verify, headers=HEADER,
+                              timeout=timeout)
+            j = response_json(req)
             if 'fault' in j:
                 if 'message' in j['fault']:
                     return True, msgdeco('FAIL', 'UPDATE', "lun '{}' project "
@@ -154,6 +157,35 @@ def noconfirm_update(noconfirm, update_list):
             exit("Not confirmed, Exiting program")
 
 
+def update_entry(item, zfsurl, zauth, timeout, verify, session=requests):
+    """Update component from line in csv format. (err, msg)"""
+    changes = item[2:]
+    data = {}
+    if item[0] == 'project':
+        _, project, pool = item[1].split(';')
+        fullurl = ("{}/storage/v1/pools/{}/projects/{}"
+                   .format(zfsurl, pool, project))
+        kwargs = {'project': project, 'pool': pool}
+    elif item[0] == 'filesystem':
+        filesystem, project, pool = item[1].split(';')
+        fullurl = ("{}/storage/v1/pools/{}/projects/{}/filesystems/{}"
+                   .format(zfsurl, pool, project, filesystem))
+        kwargs = {'project': project, 'pool': pool, 'filesystem': filesystem}
+    elif item[0] == 'lun':
+        lun, project, pool = item[1].split(';')
+        fullurl = ("{}/storage/v1/pools/{}/projects/{}/luns/{}"
+                   .format(zfsurl, pool, project, lun))
+        kwargs = {'project': project, 'pool': pool, 'lun': lun}
+    else:
+        return True, msgdeco('FAIL', 'UPDATE', "Wrong type in file format. "
+                             "line {}".format(item))
+    for entry in changes:
+        key, value = entry.split(';')
+        data[key] = value
+    return update_component(item[0], fullurl, zauth, timeout, data, verify,
+                            session=session, **kwargs)
+
+
 def run_updates(args):
     """Update component based on a csv file with the following format.
 
@@ -167,129 +199,14 @@ def run_updates(args):
     For projects the second col (name) is hyphen('-').
     """
     datafile = args.file
-    timeout = args.timeout
     verify = args.cert
     configfile = args.server
     config = read_yaml_file(configfile)
     zauth = (config['username'], config['password'])
+    session = get_session(config, verify,
+                          not getattr(args, 'no_cache', False))
     zfsurl = "https://{}:215/api".format(config['ip'])
-    initial = 0  # for progressbar
     updates = read_csv_file(datafile)
-    if args.progress:
-        noconfirm_update(args.noconfirm, updates)
-        progbar = createprogress(len(updates))
-        logger = CreateLogger(UPDATELOGFILE)
-        for item in updates:
-            changes = item[2:]
-            data = {}
-            if item[0] == 'project':
-                _, project, pool = item[1].split(';')
-                fullurl = ("{}/storage/v1/pools/{}/projects/{}"
-                           .format(zfsurl, pool, project))
-                for entry in changes:
-                    key, value = entry.split(';')
-                    data[key] = value
-                err, msg = update_component('project', fullurl, zauth, timeout,
-                                            data, verify, project=project,
-                                            pool=pool)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-
-            elif item[0] == 'filesystem':
-                filesystem, project, pool = item[1].split(';')
-                fullurl = ("{}/storage/v1/pools/{}/projects/{}/filesystems/{}"
-                           .format(zfsurl, pool, project, filesystem))
-                for entry in changes:
-                    key, value = entry.split(';')
-                    data[key] = value
-                err, msg = update_component('project', fullurl, zauth, timeout,
-                                            data, verify, project=project,
-                                            pool=pool)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-
-            elif item[0] == 'lun':
-                lun, project, pool = item[1].split(';')
-                fullurl = ("{}/storage/v1/pools/{}/projects/{}/luns/{}"
-                           .format(zfsurl, pool, project, lun))
-                for entry in changes:
-                    key, value = entry.split(';')
-                    data[key] = value
-                err, msg = update_component('lun', fullurl, zauth, timeout,
-                                            data, verify, project=project,
-                                            pool=pool, lun=lun)
-                if err:
-                    logger.warning(msg.replace(COLORRED, "")
-                                   .replace(RESETCOLOR, ""))
-                else:
-                    logger.info(msg.replace(COLORGREEN, "")
-                                .replace(RESETCOLOR, ""))
-                initial += 1
-                progbar.update(initial)
-        progbar.finish()
-        logger.shutdown()
-
-    else:
-        noconfirm_update(args.noconfirm, updates)
-        for item in updates:
-            changes = item[2:]
-            data = {}
-            if item[0] == 'project':
-                _, project, pool = item[1].split(';')
-                fullurl = ("{}/storage/v1/pools/{}/projects/{}"
-                           .format(zfsurl, pool, project))
-                for entry in changes:
-                    key, value = entry.split(';')
-                    data[key] = value
-                print("#" * 79)
-                print("Updating project")
-                print("#" * 79)
-                print(update_component('project', fullurl, zauth, timeout,
-                                       data, verify, project=project,
-                                       pool=pool)[1])
-                print("=" * 79)
-
-            elif item[0] == 'filesystem':
-                filesystem, project, pool = item[1].split(';')
-                fullurl = ("{}/storage/v1/pools/{}/projects/{}/filesystems/{}"
-                           .format(zfsurl, pool, project, filesystem))
-                for entry in changes:
-                    key, value = entry.split(';')
-                    data[key] = value
-                print("#" * 79)
-                print("Updating filesystem")
-                print("#" * 79)
-                print(update_component('filesystem', fullurl, zauth, timeout,
-                                       data, verify, project=project,
-                                       pool=pool, filesystem=filesystem)[1])
-                print("=" * 79)
-
-            elif item[0] == 'lun':
-                lun, project, pool = item[1].split(';')
-                fullurl = ("{}/storage/v1/pools/{}/projects/{}/luns/{}"
-                           .format(zfsurl, pool, project, lun))
-                for entry in changes:
-                    key, value = entry.split(';')
-                    data[key] = value
-                print("#" * 79)
-                print("Updating lun")
-                print("#" * 79)
-                print(update_component('lun', fullurl, zauth, timeout, data,
-                                       verify, project=project, pool=pool,
-                                       lun=lun)[1])
-                print("=" * 79)
-
-            else:
-                print("Wrong type in file format.")
+    noconfirm_update(args.noconfirm, updates)
+    run_bulk(update_entry, updates, zfsurl, zauth, session, args,
+             "Updating components", UPDATELOGFILE)